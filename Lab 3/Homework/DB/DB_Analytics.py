@@ -0,0 +1,64 @@
+"""Vectorized analytics over the columns returned by ExpensesDatabaseClient.fetch_columns.
+
+Every helper takes that dict of NumPy arrays and works in whole-array operations, so
+nothing loops over rows in Python. Prices keep the dtype they were fetched with:
+float64 amounts, or int64 cents with fetch_columns(price_dtype="int64").
+"""
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+
+def _sum_by(index: np.ndarray, prices: np.ndarray, length: int) -> np.ndarray:
+    """Sum prices into `length` buckets, keeping integer cents as integers."""
+    totals = np.bincount(index, weights=prices, minlength=length)
+    if np.issubdtype(prices.dtype, np.integer):
+        # bincount adds in float64, which is exact for integers below 2 ** 53 cents
+        return np.rint(totals).astype(np.int64)
+    return totals
+
+def monthly_spend(columns: Dict[str, object]) -> Tuple[np.ndarray, np.ndarray]:
+    """Total spend per calendar month from the first to the last month, empty months included: (months, totals)."""
+    prices = columns["price"]
+    if not len(prices):
+        return np.array([], dtype="datetime64[M]"), np.zeros(0, dtype=prices.dtype)
+    months = columns["date"].astype("datetime64[M]")
+    if np.isnat(months).any():
+        raise ValueError("monthly_spend needs the rows' dates; fetch_columns returns NaT dates for files without a date column")
+    first, last = months.min(), months.max()
+    index = (months - first).astype(np.int64)
+    return np.arange(first, last + 1), _sum_by(index, prices, int((last - first).astype(np.int64)) + 1)
+
+def rolling_monthly_spend(columns: Dict[str, object], window: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+    """Spend over the trailing `window` months (the month itself included) for every month: (months, totals)."""
+    if window < 1:
+        raise ValueError("window must be at least 1")
+    months, totals = monthly_spend(columns)
+    cumulative = np.cumsum(totals)
+    rolling = cumulative.copy()
+    rolling[window:] -= cumulative[:-window]
+    return months, rolling
+
+def category_totals(columns: Dict[str, object]) -> Dict[str, float]:
+    """Total spend per expense name, largest first."""
+    categories = columns["categories"]
+    totals = _sum_by(columns["expense_code"], columns["price"], len(categories))
+    return {categories[code]: totals[code].item() for code in np.argsort(totals, kind="stable")[::-1]}
+
+def price_percentiles(columns: Dict[str, object], percentiles: Sequence[float] = (50, 90, 99), by_category: bool = False) -> Dict[object, object]:
+    """Price percentiles ({percentile: value}) over all rows, or {expense name: {percentile: value}} with by_category=True."""
+    prices = columns["price"]
+    if not len(prices):
+        return {}
+    if not by_category:
+        return dict(zip(percentiles, np.percentile(prices, percentiles).tolist()))
+    # Group the prices of each expense name together, then take the percentiles group by group
+    order = np.argsort(columns["expense_code"], kind="stable")
+    codes = columns["expense_code"][order]
+    starts = np.flatnonzero(np.diff(codes)) + 1
+    groups = np.split(prices[order], starts)
+    categories = columns["categories"]
+    return {
+        categories[code]: dict(zip(percentiles, np.percentile(group, percentiles).tolist()))
+        for code, group in zip(codes[np.concatenate(([0], starts))], groups)
+        if len(group)
+    }
@@ -0,0 +1,67 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from functools import partial
+from typing import AsyncIterator, List, Optional, Tuple, Union
+
+from DB_Client import PooledExpensesDatabaseClient
+
+class AsyncExpensesDatabaseClient:
+    def __init__(self, db_name: str = 'expenses.db', *, workers: int = 2, max_pending: int = 64, **client_options):
+        """asyncio front-end: every call runs on a dedicated thread pool so the event loop never blocks on SQLite.
+
+        client_options (cache, durability, profile, instrumentation, ...) go to the wrapped PooledExpensesDatabaseClient.
+        """
+        if max_pending < 1:
+            raise ValueError("max_pending must be at least 1")
+        if "pool_size" in client_options:
+            raise ValueError("The pool size follows workers; pass workers instead of pool_size")
+        # One pooled connection per worker thread; the extra one serves the calling thread (schema setup)
+        self.client = PooledExpensesDatabaseClient(db_name, pool_size=workers + 1, **client_options)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="expenses-db")
+        self.max_pending = max_pending
+        self._pending = None
+    async def _run(self, method, *args, **kwargs):
+        """Run a blocking client method on the executor, waiting for room when max_pending calls are queued."""
+        if self._pending is None:
+            # Created lazily so it binds to the loop the client is actually used from
+            self._pending = asyncio.Semaphore(self.max_pending)
+        async with self._pending:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, partial(method, *args, **kwargs))
+    async def create_expense(self, expense: str, price: Union[Decimal, float, str], date: str) -> int:
+        """Add a new expense to the database with a provided date and return its exp_id."""
+        return await self._run(self.client.create_expense, expense, price, date)
+    async def read_all_expenses(self, limit: int, offset: int = 0) -> List[Tuple[int, str, Decimal, str]]:
+        """Retrieve expenses from the database with pagination."""
+        return await self._run(self.client.read_all_expenses, limit, offset)
+    async def update_expense(self, exp_id: int, expense: Union[str, None] = None, price: Union[Decimal, float, None] = None, date: Union[str, None] = None) -> None:
+        """Update an expense's details in the database."""
+        await self._run(self.client.update_expense, exp_id, expense, price, date)
+    async def search_expenses(self, *args, **kwargs) -> List[Tuple[int, str, Decimal, str]]:
+        """Search expenses; takes the same arguments as ExpensesDatabaseClient.search_expenses."""
+        return await self._run(self.client.search_expenses, *args, **kwargs)
+    async def search_expenses_page(self, *args, **kwargs) -> Tuple[List[Tuple[int, str, Decimal, str]], Optional[str]]:
+        """Keyset-paginated search; takes the same arguments as ExpensesDatabaseClient.search_expenses_page."""
+        return await self._run(self.client.search_expenses_page, *args, **kwargs)
+    async def delete_expense(self, exp_id: int) -> None:
+        """Delete an expense from the database by ID."""
+        await self._run(self.client.delete_expense, exp_id)
+    async def iter_search(self, page_size: int = 500, **filters) -> AsyncIterator[Tuple[int, str, Decimal, str]]:
+        """Asynchronously iterate over every matching row, fetching one keyset page at a time."""
+        cursor = None
+        while True:
+            rows, cursor = await self.search_expenses_page(limit=page_size, cursor=cursor, **filters)
+            for row in rows:
+                yield row
+            if cursor is None:
+                return
+    async def aclose(self) -> None:
+        """Wait for queued calls to finish, then close every connection."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, partial(self.executor.shutdown, wait=True))
+        self.client.close()
+    async def __aenter__(self):
+        return self
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
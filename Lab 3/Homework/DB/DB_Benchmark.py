@@ -0,0 +1,1073 @@
+"""Benchmarks for the ExpensesDatabaseClient.
+
+Every benchmark runs against a throwaway database in a temporary directory,
+so the shipped expenses.db is never touched. Run e.g.:
+
+    python DB_Benchmark.py bulk --sizes 10000 100000 1000000
+
+The suite subcommand runs a fixed, seeded set of measurements and writes them as JSON;
+compare checks a later run against an earlier one and exits with status 1 on regressions:
+
+    python DB_Benchmark.py suite --sizes 10k 1m --output before.json
+    python DB_Benchmark.py suite --sizes 10k 1m --output after.json
+    python DB_Benchmark.py compare before.json after.json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from DB_AsyncClient import AsyncExpensesDatabaseClient
+from DB_Client import ExpensesDatabaseClient, PooledExpensesDatabaseClient, QueryCache
+from DB_Instrumentation import JsonlSink, MemorySink, QueryInstrumentation
+from DB_Transfer import export_expenses, import_expenses
+
+CATEGORIES = ["Veg", "Fruit", "Fuel", "Rent", "Books", "Lunch", "Groceries", "Transport", "Coffee", "Gym"]
+
+def synthetic_rows(count: int, seed: int = 42, start_year: int = 2015) -> Iterator[Tuple[str, float, str]]:
+    """Yield reproducible (expense, price, date) rows spread over ten years."""
+    rng = random.Random(seed)
+    start = date(start_year, 1, 1)
+    for _ in range(count):
+        day = start + timedelta(days=rng.randrange(3650))
+        yield rng.choice(CATEGORIES), round(rng.uniform(0.5, 500.0), 2), day.isoformat()
+
+def synthetic_ledger(count: int, seed: int = 42, merchants: int = 2000) -> Iterator[Tuple[str, float, str]]:
+    """Like synthetic_rows, but with "<category> at <merchant>" descriptions for text-search benchmarks."""
+    rng = random.Random(seed + 1)
+    names = [f"merchant{i:04d}" for i in range(merchants)]
+    for expense, price, day in synthetic_rows(count, seed):
+        yield f"{expense} at {rng.choice(names)}", price, day
+
+@contextmanager
+def temp_client(client_class=ExpensesDatabaseClient, **kwargs) -> Iterator[ExpensesDatabaseClient]:
+    """Yield a client bound to a fresh database file that is removed afterwards."""
+    with tempfile.TemporaryDirectory() as tmp:
+        with client_class(os.path.join(tmp, "bench.db"), **kwargs) as client:
+            yield client
+
+def bench_bulk_insert(sizes: List[int], batch_size: int) -> None:
+    """Compare create_expense (one commit per row) with create_expenses_bulk."""
+    print(f"{'rows':>10} {'per-row (s)':>12} {'bulk (s)':>10} {'speedup':>8}")
+    for size in sizes:
+        with temp_client() as client:
+            start = time.perf_counter()
+            for expense, price, day in synthetic_rows(size):
+                client.create_expense(expense, price, day)
+            per_row = time.perf_counter() - start
+        with temp_client() as client:
+            start = time.perf_counter()
+            client.create_expenses_bulk(synthetic_rows(size), batch_size=batch_size)
+            bulk = time.perf_counter() - start
+        print(f"{size:>10} {per_row:>12.3f} {bulk:>10.3f} {per_row / bulk:>7.1f}x")
+
+def bench_deep_pages(sizes: List[int], page_size: int, repeats: int = 20) -> None:
+    """Time fetching a page near the end of the table with OFFSET and with a keyset cursor, and one late in a year search."""
+    print(f"{'rows':>10} {'OFFSET (ms)':>12} {'keyset (ms)':>12} {'year (ms)':>10}")
+    for size in sizes:
+        with temp_client() as client:
+            client.create_expenses_bulk(synthetic_rows(size), batch_size=10_000)
+            offset = size - page_size
+            start = time.perf_counter()
+            for _ in range(repeats):
+                client.read_all_expenses(page_size, offset)
+            by_offset = (time.perf_counter() - start) / repeats
+            # Tokens are opaque to callers; the benchmark builds one to jump straight to the deep page
+            cursor = client._encode_cursor(offset)
+            start = time.perf_counter()
+            for _ in range(repeats):
+                client.read_expenses_page(page_size, cursor)
+            by_keyset = (time.perf_counter() - start) / repeats
+            # Year searches are ordered by (date, exp_id); this page starts in December of the last year
+            cursor = client._encode_cursor(0, "2024-12-01")
+            start = time.perf_counter()
+            for _ in range(repeats):
+                client.search_expenses_page(year=2024, limit=page_size, cursor=cursor)
+            by_year = (time.perf_counter() - start) / repeats
+        print(f"{size:>10} {by_offset * 1000:>12.3f} {by_keyset * 1000:>12.3f} {by_year * 1000:>10.3f}")
+
+def bench_text_search(size: int, terms: List[str], repeats: int = 5) -> None:
+    """Compare substring LIKE search with the FTS5 index on a synthetic ledger."""
+    with temp_client() as client:
+        if not client.fts_enabled:
+            print("SQLite was built without FTS5; nothing to compare")
+            return
+        client.create_expenses_bulk(synthetic_ledger(size), batch_size=10_000)
+        print(f"{size} rows")
+        print(f"{'term':>20} {'LIKE (ms)':>10} {'FTS (ms)':>10} {'ranked (ms)':>12}")
+        for term in terms:
+            timings = []
+            for search in (lambda: client.search_expenses(expense=term, limit=50),
+                           lambda: client.search_expenses(expense=term, limit=50, full_text=True),
+                           lambda: client.search_expenses_ranked(term, limit=50)):
+                start = time.perf_counter()
+                for _ in range(repeats):
+                    search()
+                timings.append((time.perf_counter() - start) / repeats * 1000)
+            print(f"{term:>20} {timings[0]:>10.3f} {timings[1]:>10.3f} {timings[2]:>12.3f}")
+
+def stress_pool(readers: int, writes: int, seconds_limit: float = 120.0) -> bool:
+    """N reader threads and one writer thread share a pooled client; returns True if nothing went wrong."""
+    errors = []
+    reads = [0] * readers
+    done = threading.Event()
+
+    with temp_client(PooledExpensesDatabaseClient, pool_size=readers + 1) as client:
+        def writer():
+            try:
+                rows = synthetic_rows(writes)
+                for expense, price, day in rows:
+                    client.create_expense(expense, price, day)
+            except Exception as exc:
+                errors.append(f"writer: {exc!r}")
+            finally:
+                done.set()
+                client.release_connection()
+
+        def reader(index):
+            seen = 0
+            try:
+                while not done.is_set():
+                    # Committed rows never disappear, so each reader must see a non-decreasing count
+                    count = len(client.read_all_expenses(limit=-1))
+                    if count < seen:
+                        errors.append(f"reader {index}: count went from {seen} to {count}")
+                    seen = count
+                    client.search_expenses(year=2020, month=6, limit=20)
+                    reads[index] += 2
+            except Exception as exc:
+                errors.append(f"reader {index}: {exc!r}")
+            finally:
+                client.release_connection()
+
+        threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+        threads.append(threading.Thread(target=writer))
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(seconds_limit)
+        elapsed = time.perf_counter() - start
+        final = len(client.read_all_expenses(limit=-1))
+
+    if any(thread.is_alive() for thread in threads):
+        errors.append(f"threads still running after {seconds_limit} seconds")
+    if final != writes:
+        errors.append(f"expected {writes} rows, found {final}")
+    print(f"{readers} readers, 1 writer: {writes} writes and {sum(reads)} reads in {elapsed:.2f}s")
+    for error in errors:
+        print("ERROR", error)
+    return not errors
+
+async def _loop_lag(stop: asyncio.Event, interval: float = 0.001) -> List[float]:
+    """Sample how late the event loop wakes up from interval-long sleeps until stop is set."""
+    lags = []
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - start - interval)
+    return lags
+
+async def _measure_loop_lag(search) -> Tuple[float, float]:
+    """Run search while sampling loop lag; returns (max lag, mean lag) in milliseconds."""
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(_loop_lag(stop))
+    await asyncio.sleep(0.01)
+    await search()
+    stop.set()
+    lags = await sampler
+    return max(lags) * 1000, sum(lags) / len(lags) * 1000
+
+def bench_event_loop(size: int) -> None:
+    """Event-loop responsiveness while a large search runs, blocking call vs AsyncExpensesDatabaseClient."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        with ExpensesDatabaseClient(path) as client:
+            client.create_expenses_bulk(synthetic_rows(size), batch_size=10_000)
+
+            async def blocking():
+                client.search_expenses(expense="o", limit=-1)
+            max_lag, mean_lag = asyncio.run(_measure_loop_lag(blocking))
+            print(f"blocking search: max lag {max_lag:.1f} ms, mean lag {mean_lag:.2f} ms")
+
+        async def offloaded():
+            async with AsyncExpensesDatabaseClient(path) as async_client:
+                async def search():
+                    await async_client.search_expenses(expense="o", limit=-1)
+                return await _measure_loop_lag(search)
+        max_lag, mean_lag = asyncio.run(offloaded())
+        print(f"async search:    max lag {max_lag:.1f} ms, mean lag {mean_lag:.2f} ms")
+
+def bench_streaming(size: int, arraysize: int) -> None:
+    """Peak Python memory while summing every price with fetchall() vs iter_expenses()."""
+    with temp_client() as client:
+        client.create_expenses_bulk(synthetic_rows(size), batch_size=10_000)
+        print(f"{'method':>14} {'time (s)':>9} {'peak (MiB)':>11}")
+        for name, rows in (("fetchall", lambda: client.read_all_expenses(limit=-1)),
+                           ("iter_expenses", lambda: client.iter_expenses(arraysize=arraysize))):
+            tracemalloc.start()
+            start = time.perf_counter()
+            total = sum(row[2] for row in rows())
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{name:>14} {elapsed:>9.3f} {peak / 2 ** 20:>11.2f}  (total {total:.2f})")
+
+def bench_query_cache(size: int, queries: int, write_every: int, max_entries: int) -> None:
+    """A dashboard-like mix of repeated month searches and summaries, with and without a QueryCache."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        with ExpensesDatabaseClient(path) as client:
+            client.create_expenses_bulk(synthetic_rows(size), batch_size=10_000)
+        for cache in (None, QueryCache(max_entries=max_entries)):
+            rng = random.Random(7)
+            with ExpensesDatabaseClient(path, cache=cache) as client:
+                start = time.perf_counter()
+                for number in range(queries):
+                    # Dashboards mostly look at the last couple of years
+                    year, month = rng.choice([2023, 2024]), rng.randint(1, 12)
+                    client.summarize_expenses(year=year, month=month)
+                    client.search_expenses(year=year, month=month, limit=50)
+                    if write_every and number % write_every == 0:
+                        client.create_expense("Coffee", 3.5, f"{year}-{month:02d}-15")
+                elapsed = time.perf_counter() - start
+            label = "no cache" if cache is None else "QueryCache"
+            print(f"{label:>10}: {queries} dashboard refreshes in {elapsed:.3f}s")
+            if cache is not None:
+                print(f"{'':>10}  {cache.stats()}")
+
+def mixed_patches(count: int, max_id: int, seed: int = 11) -> Iterator[Tuple[int, dict]]:
+    """Yield reproducible (exp_id, patch) pairs mixing every combination of updated columns."""
+    rng = random.Random(seed)
+    for _ in range(count):
+        patch = {}
+        while not patch:
+            if rng.random() < 0.5:
+                patch["expense"] = rng.choice(CATEGORIES)
+            if rng.random() < 0.6:
+                patch["price"] = round(rng.uniform(0.5, 500.0), 2)
+            if rng.random() < 0.3:
+                patch["date"] = f"{rng.randint(2015, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        yield rng.randint(1, max_id), patch
+
+def bench_updates(size: int, updates: int) -> None:
+    """Mixed partial updates: one update_expense (and commit) per patch vs update_expenses_bulk."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        with ExpensesDatabaseClient(path) as client:
+            client.create_expenses_bulk(synthetic_rows(size), batch_size=10_000)
+            start = time.perf_counter()
+            for exp_id, patch in mixed_patches(updates, size):
+                client.update_expense(exp_id, **patch)
+            per_call = time.perf_counter() - start
+            start = time.perf_counter()
+            client.update_expenses_bulk(mixed_patches(updates, size))
+            bulk = time.perf_counter() - start
+    print(f"{updates} mixed updates on {size} rows")
+    print(f"update_expense per call: {per_call:.3f}s")
+    print(f"update_expenses_bulk:    {bulk:.3f}s ({per_call / bulk:.1f}x)")
+
+def bench_transactions(writes: int, batch: int) -> None:
+    """Write throughput per durability level: one commit per create_expense vs transaction() blocks of `batch` writes."""
+    print(f"{writes} writes, transaction() blocks of {batch}")
+    print(f"{'durability':>10} {'per-call (rows/s)':>18} {'transaction (rows/s)':>21}")
+    for level in ("full", "normal", "off"):
+        with temp_client(durability=level) as client:
+            rows = list(synthetic_rows(writes))
+            start = time.perf_counter()
+            for row in rows:
+                client.create_expense(*row)
+            per_call = time.perf_counter() - start
+            start = time.perf_counter()
+            for index in range(0, writes, batch):
+                with client.transaction():
+                    for row in rows[index:index + batch]:
+                        client.create_expense(*row)
+            grouped = time.perf_counter() - start
+        print(f"{level:>10} {writes / per_call:>18.0f} {writes / grouped:>21.0f}")
+
+def _legacy_database(path: str, size: int) -> None:
+    """Write a database in the layout used before prices were stored in cents (price REAL)."""
+    connection = sqlite3.connect(path)
+    connection.execute("""
+        CREATE TABLE expenses (
+            exp_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            expense TEXT NOT NULL,
+            price REAL NOT NULL,
+            date DATE NOT NULL
+        );
+    """)
+    connection.executemany("INSERT INTO expenses (expense, price, date) VALUES (?, ?, ?);", synthetic_rows(size))
+    connection.execute("CREATE INDEX idx_expense ON expenses(expense);")
+    connection.execute("CREATE INDEX idx_price ON expenses(price);")
+    connection.execute("CREATE INDEX idx_date_price ON expenses(date, price);")
+    connection.commit()
+    connection.close()
+
+def _timed_sum(path: str, column: str, repeats: int = 5) -> Tuple[object, float]:
+    """Best-of-repeats time of a bare SUM over one column."""
+    connection = sqlite3.connect(path)
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        total = connection.execute(f"SELECT SUM({column}) FROM expenses;").fetchone()[0]
+        timings.append(time.perf_counter() - start)
+    connection.close()
+    return total, min(timings)
+
+def bench_money(size: int, chunk_size: int) -> None:
+    """REAL prices vs integer cents: SUM accuracy and speed, file size, and how long the online migration holds the lock."""
+    exact = sum(Decimal(repr(price)) for _expense, price, _day in synthetic_rows(size))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        _legacy_database(path, size)
+        before_size = os.path.getsize(path)
+        float_total, float_time = _timed_sum(path, "price")
+
+        start = time.perf_counter()
+        stats = ExpensesDatabaseClient.migrate_prices_to_cents(path, chunk_size=chunk_size)
+        migration = time.perf_counter() - start
+        with ExpensesDatabaseClient(path) as client:
+            client.connection.execute("VACUUM;")
+            cents_total = client.total_expenses()
+        _cents, cents_time = _timed_sum(path, "price_cents")
+        after_size = os.path.getsize(path)
+    print(f"{size} rows, exact total {exact}")
+    print(f"REAL  SUM: {float_total!r} (off by {Decimal(repr(float_total)) - exact}) in {float_time * 1000:.1f} ms, file {before_size / 2 ** 20:.1f} MiB")
+    print(f"cents SUM: {cents_total} (off by {cents_total - exact}) in {cents_time * 1000:.1f} ms, file {after_size / 2 ** 20:.1f} MiB after VACUUM")
+    print(f"migration: {stats['migrated']} rows in {migration:.2f}s over {stats['chunks']} chunks, "
+          f"longest write lock {stats['longest_lock'] * 1000:.1f} ms")
+
+def _tuple_analytics(rows) -> Tuple[dict, dict, list]:
+    """Monthly totals, per-category totals and 50/90/99th percentiles with plain Python loops over row tuples."""
+    monthly, categories, prices = {}, {}, []
+    for _exp_id, expense, price, day in rows:
+        month = day[:7]
+        monthly[month] = monthly.get(month, 0) + price
+        categories[expense] = categories.get(expense, 0) + price
+        prices.append(price)
+    prices.sort()
+    percentiles = [prices[min(len(prices) - 1, int(len(prices) * q / 100))] for q in (50, 90, 99)] if prices else []
+    return monthly, categories, percentiles
+
+def bench_columns(size: int) -> None:
+    """Whole-table analytics: tuple rows and Python loops vs fetch_columns and the NumPy helpers in DB_Analytics."""
+    import DB_Analytics
+    with temp_client() as client:
+        client.create_expenses_bulk(synthetic_rows(size), batch_size=50_000)
+        start = time.perf_counter()
+        rows = list(client.iter_expenses(arraysize=10_000))
+        fetched = time.perf_counter() - start
+        monthly, categories, _percentiles = _tuple_analytics(rows)
+        looped = time.perf_counter() - start
+        del rows
+
+        start = time.perf_counter()
+        columns = client.fetch_columns(price_dtype="int64")
+        columnar_fetch = time.perf_counter() - start
+        _months, totals = DB_Analytics.rolling_monthly_spend(columns, window=3)
+        category_totals = DB_Analytics.category_totals(columns)
+        DB_Analytics.price_percentiles(columns)
+        vectorized = time.perf_counter() - start
+    # Same answers both ways (prices as exact cents)
+    assert sorted(category_totals.items()) == sorted((name, int(total * 100)) for name, total in categories.items())
+    assert int(DB_Analytics.monthly_spend(columns)[1].sum()) == int(sum(monthly.values()) * 100)
+    print(f"{size} rows: rolling monthly spend, per-category totals, percentiles")
+    print(f"tuples + loops:       fetch {fetched:.2f}s, total {looped:.2f}s")
+    print(f"fetch_columns + NumPy: fetch {columnar_fetch:.2f}s, total {vectorized:.2f}s ({looped / vectorized:.1f}x)")
+
+def bench_categories(size: int, repeats: int = 5) -> None:
+    """Free-text expense column vs the normalized categories layout: file size, GROUP BY and name-filter speed."""
+    # Ten short names ("Veg", "Fuel", ...), then 20k longer "Coffee at merchant0042"-style names
+    for label, rows in (("10 names", synthetic_rows), ("20k names", synthetic_ledger)):
+        with tempfile.TemporaryDirectory() as tmp:
+            plain_path = os.path.join(tmp, "plain.db")
+            normalized_path = os.path.join(tmp, "normalized.db")
+            with ExpensesDatabaseClient(plain_path) as client:
+                client.create_expenses_bulk(rows(size), batch_size=50_000)
+            shutil.copyfile(plain_path, normalized_path)
+            start = time.perf_counter()
+            stats = ExpensesDatabaseClient.normalize_expenses(normalized_path, chunk_size=50_000)
+            migration = time.perf_counter() - start
+            print(f"{size} rows with {label}, normalized in {migration:.2f}s (longest write lock {stats['longest_lock'] * 1000:.0f} ms)")
+            print(f"{'layout':>11} {'file (MiB)':>11} {'group by (ms)':>14} {'name filter (ms)':>17}")
+            results = []
+            for layout, path in (("plain", plain_path), ("normalized", normalized_path)):
+                with ExpensesDatabaseClient(path) as client:
+                    client.connection.execute("VACUUM;")
+                    grouped, filtered = [], []
+                    for _ in range(repeats):
+                        start = time.perf_counter()
+                        groups = client.summarize_expenses(group_by="expense")
+                        grouped.append(time.perf_counter() - start)
+                        start = time.perf_counter()
+                        client.total_expenses(expense="Coffee")
+                        filtered.append(time.perf_counter() - start)
+                    results.append(groups)
+                print(f"{layout:>11} {os.path.getsize(path) / 2 ** 20:>11.1f} {min(grouped) * 1000:>14.1f} {min(filtered) * 1000:>17.1f}")
+        assert results[0] == results[1]
+
+def _summary_timings(client: ExpensesDatabaseClient, queries: List[dict], repeats: int) -> Tuple[list, float]:
+    """Results and best-of-repeats time of running every summarize_expenses query once."""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        results = [client.summarize_expenses(**query) for query in queries]
+        best = min(best, time.perf_counter() - start)
+    return results, best
+
+def bench_rollup(sizes: List[int], repeats: int = 5) -> None:
+    """Month, year and overall totals from raw rows vs the trigger-maintained monthly rollup, plus the insert overhead."""
+    queries = [
+        {"year": 2020, "month": 6},
+        {"year": 2020, "month": 6, "group_by": "expense"},
+        {"year": 2020, "group_by": "month"},
+        {},
+    ]
+    print(f"{'rows':>10} {'insert (s)':>11} {'no triggers':>12} {'raw (ms)':>9} {'rollup (ms)':>12} {'speedup':>8} {'rebuild (s)':>12}")
+    for size in sizes:
+        with temp_client() as client:
+            for trigger in ("monthly_totals_ai", "monthly_totals_ad", "monthly_totals_au"):
+                client.connection.execute(f"DROP TRIGGER {trigger};")
+            start = time.perf_counter()
+            client.create_expenses_bulk(synthetic_rows(size), batch_size=50_000)
+            untriggered = time.perf_counter() - start
+        with temp_client() as client:
+            start = time.perf_counter()
+            client.create_expenses_bulk(synthetic_rows(size), batch_size=50_000)
+            inserted = time.perf_counter() - start
+            rolled_up, rollup_time = _summary_timings(client, queries, repeats)
+            client.rollup_enabled = False
+            raw, raw_time = _summary_timings(client, queries, repeats)
+            client.rollup_enabled = True
+            start = time.perf_counter()
+            stats = client.rebuild_monthly_totals()
+            rebuild = time.perf_counter() - start
+        assert rolled_up == raw and stats["drifted"] == 0
+        print(
+            f"{size:>10} {inserted:>11.2f} {untriggered:>12.2f} {raw_time * 1000:>9.1f} {rollup_time * 1000:>12.2f} "
+            f"{raw_time / rollup_time:>7.0f}x {rebuild:>12.2f}"
+        )
+
+def bench_transfer(size: int, batch_size: int) -> None:
+    """Export and re-import through CSV and JSON Lines: throughput and peak Python memory, extrapolated to a 1 GB file."""
+    with temp_client() as source:
+        source.create_expenses_bulk(synthetic_rows(size), batch_size=50_000)
+        print(f"{'format':>7} {'file (MiB)':>11} {'export (s)':>11} {'import (s)':>11} {'rows/s':>9} {'peak (MiB)':>11} {'1 GB (min)':>11}")
+        for format in ("csv", "jsonl"):
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, f"expenses.{format}")
+                start = time.perf_counter()
+                export_expenses(source, path, batch_size=batch_size)
+                exported = time.perf_counter() - start
+                file_size = os.path.getsize(path)
+                with ExpensesDatabaseClient(os.path.join(tmp, "imported.db")) as target:
+                    start = time.perf_counter()
+                    stats = import_expenses(target, path, batch_size=batch_size, set_wise_indexing=True)
+                    imported = time.perf_counter() - start
+                    assert stats["imported"] == size and target.total_expenses() == source.total_expenses()
+                # Traced separately, since tracemalloc slows the import down severalfold
+                with ExpensesDatabaseClient(os.path.join(tmp, "traced.db")) as target:
+                    tracemalloc.start()
+                    import_expenses(target, path, batch_size=batch_size, set_wise_indexing=True)
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+            print(
+                f"{format:>7} {file_size / 2 ** 20:>11.1f} {exported:>11.2f} {imported:>11.2f} {size / imported:>9.0f} "
+                f"{peak / 2 ** 20:>11.1f} {imported * 2 ** 30 / file_size / 60:>11.1f}"
+            )
+
+def bench_cli_startup(size: int, runs: int) -> None:
+    """Wall time of short CLI invocations in fresh interpreters, next to bare Python and the Qt import the GUI pays."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        with ExpensesDatabaseClient(path) as client:
+            client.create_expenses_bulk(synthetic_rows(size), batch_size=50_000)
+        cli = [sys.executable, "-m", "DB_CLI", "--db", path, "--output", "json"]
+        commands = [
+            ("python -c pass", [sys.executable, "-c", "pass"]),
+            ("import PyQt5 widgets", [sys.executable, "-c", "import PyQt5.QtWidgets"]),
+            ("import ExpenseV2", [sys.executable, "-c", "import ExpenseV2"]),
+            ("import DB_CLI", [sys.executable, "-c", "import sys, DB_CLI; assert not any(m.startswith('PyQt5') for m in sys.modules)"]),
+            ("cli summarize month", cli + ["summarize", "--year", "2020", "--month", "6"]),
+            ("cli search --limit 10", cli + ["search", "--year", "2020", "--limit", "10"]),
+            ("cli add", cli + ["add", "Coffee", "3.20", "--date", "2020-06-01"]),
+        ]
+        # Startup is measured as installed code behaves: with byte-code caching, after one warm-up run
+        env = {key: value for key, value in os.environ.items() if key != "PYTHONDONTWRITEBYTECODE"}
+        print(f"{'command':<24} {'median (ms)':>12} {'min (ms)':>9}")
+        for label, command in commands:
+            subprocess.run(command, cwd=here, check=True, stdout=subprocess.DEVNULL, env=env)
+            times = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                subprocess.run(command, cwd=here, check=True, stdout=subprocess.DEVNULL, env=env)
+                times.append(time.perf_counter() - start)
+            print(f"{label:<24} {statistics.median(times) * 1000:>12.1f} {min(times) * 1000:>9.1f}")
+
+def _qt_app():
+    """Create (or reuse) a QApplication on the offscreen platform so GUI benchmarks run headless."""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication
+    return QApplication.instance() or QApplication([])
+
+def _legacy_table_load(rows) -> None:
+    """The original QTableWidget load: every inserted cell fired cellChanged, which rescanned every row."""
+    from PyQt5.QtWidgets import QTableWidget, QTableWidgetItem
+    table = QTableWidget(0, 2)
+
+    def calculate_total():
+        return sum(float(table.item(row, 1).text()) for row in range(table.rowCount()) if table.item(row, 1))
+    table.cellChanged.connect(calculate_total)
+    for expense, price, _date in rows:
+        row = table.rowCount()
+        table.insertRow(row)
+        table.setItem(row, 0, QTableWidgetItem(expense))
+        table.setItem(row, 1, QTableWidgetItem(f"{price:.2f}"))
+    table.deleteLater()
+
+def _wait_for_model(app, model, timeout: float = 600.0) -> None:
+    """Process Qt events until the model has no load or page fetch in flight."""
+    deadline = time.perf_counter() + timeout
+    while (model.loading or model._fetching) and time.perf_counter() < deadline:
+        app.processEvents()
+
+def bench_table_load(size: int, legacy_size: int) -> None:
+    """Time showing a ledger: the original per-cell QTableWidget load vs the lazily paged ExpenseTable."""
+    app = _qt_app()
+    from ExpenseV2 import ExpenseTable
+    with temp_client() as client:
+        client.create_expenses_bulk(synthetic_rows(size), batch_size=10_000)
+
+        start = time.perf_counter()
+        table = ExpenseTable(client)
+        model = table.expense_model
+        _wait_for_model(app, model)
+        opened = time.perf_counter() - start
+        while model.canFetchMore():
+            model.fetchMore()
+            _wait_for_model(app, model)
+        walked = time.perf_counter() - start
+        # Sanity check: the running total matches a full recomputation (exactly, since prices are integer cents)
+        assert table.total == table.calculate_total()
+        table.close_queries()
+        table.deleteLater()
+
+        # The old path is quadratic, so it is measured on fewer rows and extrapolated
+        start = time.perf_counter()
+        _legacy_table_load(synthetic_rows(legacy_size))
+        before = time.perf_counter() - start
+        app.processEvents()
+    estimate = before * (size / legacy_size) ** 2
+    print(f"before: {legacy_size} rows in {before:.2f}s (~{estimate:.0f}s extrapolated to {size} rows)")
+    print(f"after:  opened {size} rows in {opened:.3f}s, paged through all of them in {walked:.2f}s")
+
+def bench_search_latency(size: int, repeats: int = 5) -> None:
+    """Time-to-first-row and time-to-total of ExpenseSearch queries running on the background workers."""
+    app = _qt_app()
+    from ExpenseV2 import ExpenseTable
+    with temp_client() as client:
+        client.create_expenses_bulk(synthetic_ledger(size), batch_size=10_000)
+        table = ExpenseTable(client)
+        model = table.expense_model
+        _wait_for_model(app, model)
+        print(f"{size} rows")
+        print(f"{'filters':>48} {'first row (ms)':>15} {'finished (ms)':>14}")
+        for filters in ({}, {"year": 2020, "month": 6}, {"month": 6}, {"expense": "merchant0042"},
+                        {"expense": "merchant0042", "full_text": True}):
+            first, finished = [], []
+            for _ in range(repeats):
+                table.filters = filters
+                start = time.perf_counter()
+                table.load_expenses()
+                _wait_for_model(app, model)
+                finished.append(time.perf_counter() - start)
+                first.append(model.time_to_first_row)
+            print(f"{str(filters):>48} {min(first) * 1000:>15.2f} {min(finished) * 1000:>14.2f}")
+        table.close_queries()
+
+def bench_instrumentation(size: int, calls: int) -> None:
+    """Per-call cost of a read/write mix without instrumentation, with it switched off, and with each sink."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        with ExpensesDatabaseClient(path) as client:
+            client.create_expenses_bulk(synthetic_ledger(size), batch_size=50_000)
+        stats = MemorySink()
+        setups = [
+            ("not instrumented", None),
+            ("switched off", QueryInstrumentation([MemorySink()])),
+            ("MemorySink", QueryInstrumentation([stats])),
+            ("MemorySink + JSONL", QueryInstrumentation([MemorySink(), JsonlSink(os.path.join(tmp, "events.jsonl"))])),
+        ]
+        setups[1][1].enabled = False
+        print(f"{'setup':>20} {'per call (us)':>14} {'overhead':>9}")
+        baseline = None
+        for label, instrumentation in setups:
+            rng = random.Random(3)
+            with ExpensesDatabaseClient(path, instrumentation=instrumentation) as client:
+                # Warm the page cache so the first setup is not penalized
+                client.summarize_expenses()
+                start = time.perf_counter()
+                for number in range(calls):
+                    client.read_expense(rng.randint(1, size))
+                    client.search_expenses(year=rng.randint(2015, 2024), month=rng.randint(1, 12), limit=20)
+                    client.summarize_expenses(year=rng.randint(2015, 2024), group_by="month")
+                    if number % 10 == 0:
+                        client.create_expense("Coffee at merchant0001", 3.5, "2024-06-15")
+                elapsed = time.perf_counter() - start
+            per_call = elapsed / (calls * 3 + (calls + 9) // 10) * 1e6
+            baseline = baseline or per_call
+            print(f"{label:>20} {per_call:>14.1f} {per_call / baseline - 1:>+9.0%}")
+        print()
+        for entry in stats.stats(by="method"):
+            print(f"{entry['method']:>20} {entry['count']:>7} statements  p50 {entry['p50_ms']:.3f} ms  p99 {entry['p99_ms']:.3f} ms  max {entry['max_ms']:.3f} ms")
+
+def _month_workload(client: ExpensesDatabaseClient, queries: int) -> float:
+    """Seconds for a report-like mix of month-of-any-year searches and price lookups."""
+    rng = random.Random(5)
+    start = time.perf_counter()
+    for _ in range(queries):
+        month = rng.randint(1, 12)
+        sum(1 for _ in client.iter_search(month=month, expense="Coffee"))
+        client.summarize_expenses(month=month, expense="Fuel")
+        client.search_expenses(year=rng.randint(2015, 2024), month=month, limit=50)
+    return time.perf_counter() - start
+
+def bench_tuning(size: int, queries: int) -> None:
+    """Bulk load and read time per tuning profile, then a month-heavy workload before and after apply_index_advice."""
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'profile':>12} {'load (s)':>9} {'workload (s)':>13}")
+        for profile in [None] + list(ExpensesDatabaseClient.TUNING_PROFILES):
+            path = os.path.join(tmp, f"{profile}.db")
+            with ExpensesDatabaseClient(path, profile=profile) as client:
+                start = time.perf_counter()
+                client.create_expenses_bulk(synthetic_ledger(size), batch_size=10_000)
+                loaded = time.perf_counter() - start
+                workload = _month_workload(client, queries)
+            print(f"{profile or 'none':>12} {loaded:>9.2f} {workload:>13.2f}")
+        path = os.path.join(tmp, "read-mostly.db")
+        with ExpensesDatabaseClient(path, profile="read-mostly") as client:
+            client.query_shapes.clear()
+            before = _month_workload(client, queries)
+            print(f"\nrecorded shapes: {dict(client.query_shapes)}")
+            for entry in client.advise_indexes():
+                print(f"  {entry['index']:<12} {entry['action']:<6} {entry['reads']:>6} reads ({entry['share']:.0%})")
+            start = time.perf_counter()
+            changed = client.apply_index_advice()
+            applied = time.perf_counter() - start
+            after = _month_workload(client, queries)
+        print(f"changed {changed} in {applied:.2f}s; workload {before:.2f}s before, {after:.2f}s after")
+
+def _report_job(path: str, immutable: bool, seconds: float, results) -> None:
+    """Run full-table reports (a streamed scan and a per-day summary) in a process of its own until seconds are up."""
+    reports = 0
+    with ExpensesDatabaseClient(path, read_only=True, immutable=immutable) as client:
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            sum(row[2] for row in client.iter_search(arraysize=5000))
+            client.summarize_expenses(group_by="day", expense="at")
+            reports += 1
+    results.put(reports)
+
+def _writer_latencies(path: str, durability: str, seconds: float, interval: float = 0.005) -> List[float]:
+    """Latency in ms of create_expense calls made every interval seconds, as the interactive app would."""
+    latencies = []
+    with ExpensesDatabaseClient(path, durability=durability) as client:
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            client.create_expense("Coffee at merchant0001", Decimal("3.20"), "2024-06-15")
+            latencies.append((time.perf_counter() - start) * 1000)
+            time.sleep(interval)
+    return latencies
+
+def bench_snapshot(size: int, seconds: float) -> None:
+    """Writer latency while full-table reports run in another process: on the live file or on a snapshot."""
+    with tempfile.TemporaryDirectory() as tmp:
+        live = os.path.join(tmp, "live.db")
+        snapshot = os.path.join(tmp, "snapshot.db")
+        with ExpensesDatabaseClient(live, profile="bulk-load") as client:
+            client.create_expenses_bulk(synthetic_ledger(size), batch_size=50_000)
+        print(f"{'scenario':>32} {'writes':>7} {'p50 (ms)':>9} {'p99 (ms)':>9} {'max (ms)':>9} {'reports':>8}")
+        scenarios = [
+            ("no report, rollback journal", "full", None),
+            ("report on live, rollback journal", "full", live),
+            ("no report, WAL", "normal", None),
+            ("report on live, WAL", "normal", live),
+            ("report on snapshot, WAL", "normal", snapshot),
+        ]
+        for label, durability, report_path in scenarios:
+            with ExpensesDatabaseClient(live, durability=durability):
+                pass
+            reports = ""
+            job = None
+            if report_path == snapshot:
+                copy = ExpensesDatabaseClient.create_snapshot(live, snapshot)
+                print(f"{'':>32} snapshot: {copy['bytes'] / 2**20:.0f} MiB in {copy['seconds']:.2f}s")
+            if report_path is not None:
+                results = multiprocessing.Queue()
+                job = multiprocessing.Process(target=_report_job, args=(report_path, report_path == snapshot, seconds, results))
+                job.start()
+                # Let the reporter open the file and start its first scan
+                time.sleep(0.2)
+            latencies = _writer_latencies(live, durability, seconds)
+            if job is not None:
+                reports = results.get()
+                job.join()
+            latencies.sort()
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            print(f"{label:>32} {len(latencies):>7} {statistics.median(latencies):>9.2f} {p99:>9.2f} {latencies[-1]:>9.2f} {reports:>8}")
+
+def bench_partitions(size: int, repeats: int) -> None:
+    """Current-year reads, VACUUM and file size with every year in the live table vs the years before 2024 archived."""
+    queries = {
+        "expense, this year": lambda client: client.search_expenses(expense="merchant0042", year=2024, limit=-1),
+        "full-text, this year": lambda client: client.search_expenses(expense="merchant0042", full_text=True, year=2024, limit=-1),
+        "price, this year": lambda client: client.search_expenses(price=Decimal("123.45"), year=2024, limit=-1),
+        "days of this year": lambda client: client.summarize_expenses(group_by="day", year=2024, expense="at"),
+        "scan this year": lambda client: sum(1 for _ in client.iter_search(year=2024)),
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "partitions.db")
+        with ExpensesDatabaseClient(path, profile="bulk-load") as client:
+            client.create_expenses_bulk(synthetic_ledger(size), batch_size=50_000)
+        timings = {name: [] for name in queries}
+        for archived in (False, True):
+            with ExpensesDatabaseClient(path) as client:
+                if archived:
+                    start = time.perf_counter()
+                    report = client.archive_years(2024)
+                    print(f"archived {report['rows']} rows in {time.perf_counter() - start:.2f}s to a {report['bytes'] / 2**20:.1f} MiB gzip file")
+                start = time.perf_counter()
+                sizes = client.vacuum()
+                print(f"{'2024 live, older archived' if archived else 'all years live':>26}: {sizes['bytes_after'] / 2**20:.1f} MiB file, VACUUM {time.perf_counter() - start:.2f}s")
+                for name, query in queries.items():
+                    timings[name].append(_measure(lambda: query(client), repeats)["median_ms"])
+        print(f"\n{'query':>22} {'all live (ms)':>14} {'archived (ms)':>14}")
+        for name, (live, archived) in timings.items():
+            print(f"{name:>22} {live:>14.2f} {archived:>14.2f}")
+        # Reads of archived years still work; the first one decompresses and attaches the archive
+        with ExpensesDatabaseClient(path) as client:
+            start = time.perf_counter()
+            client.summarize_expenses(group_by="day", year=2016, expense="at")
+            first = (time.perf_counter() - start) * 1000
+            warm = _measure(lambda: client.summarize_expenses(group_by="day", year=2016, expense="at"), repeats)["median_ms"]
+        print(f"\ndays of 2016 (archived): {first:.0f} ms the first time, then {warm:.2f} ms")
+
+# Row counts of the suite's seeded ledgers
+SUITE_SIZES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+# search_expenses calls of the suite: name -> keyword arguments (the limit is 50 unless given)
+SUITE_SEARCHES = {
+    "all": {},
+    "expense_like": {"expense": "merchant0042"},
+    "expense_full_text": {"expense": "merchant0042", "full_text": True},
+    "price": {"price": Decimal("123.45")},
+    "year": {"year": 2020},
+    "year_month": {"year": 2020, "month": 6},
+    "month_any_year": {"month": 6},
+    "date_range": {"date_from": "2020-03-01", "date_to": "2020-04-15"},
+    "expense_year_month": {"expense": "Coffee", "year": 2020, "month": 6},
+    "expense_price": {"expense": "Coffee", "price": Decimal("123.45")},
+    "deep_offset": {"offset": 5_000},
+}
+# summarize_expenses calls of the suite
+SUITE_SUMMARIES = {
+    "total_all": {},
+    "total_year_month": {"year": 2020, "month": 6},
+    "total_expense": {"expense": "Coffee"},
+    "by_month_of_year": {"group_by": "month", "year": 2020},
+    "by_expense_of_month": {"group_by": "expense", "year": 2020, "month": 6},
+    "by_day_of_month": {"group_by": "day", "year": 2020, "month": 6},
+}
+
+def _measure(call: Callable[[], object], repeats: int) -> Dict[str, float]:
+    """Time `repeats` calls after one warm-up call; milliseconds."""
+    call()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        call()
+        times.append((time.perf_counter() - start) * 1000)
+    return {"median_ms": statistics.median(times), "min_ms": min(times), "runs": repeats}
+
+def _suite_store(client: ExpensesDatabaseClient, size: int, repeats: int, seed: int) -> Dict[str, Dict[str, float]]:
+    """CRUD, search and summary timings against a client holding `size` ledger rows."""
+    results = {}
+    rng = random.Random(seed)
+    ids = iter(rng.sample(range(1, size + 1), min(size, 4 * (repeats + 1))))
+    results["crud.create_expense"] = _measure(lambda: client.create_expense("Coffee at merchant0001", Decimal("3.20"), "2020-06-15"), repeats)
+    results["crud.read_expense"] = _measure(lambda: client.read_expense(next(ids)), repeats)
+    results["crud.update_expense"] = _measure(lambda: client.update_expense(next(ids), price=Decimal("9.99")), repeats)
+    results["crud.delete_expense"] = _measure(lambda: client.delete_expense(next(ids)), repeats)
+    for name, arguments in SUITE_SEARCHES.items():
+        arguments = {"limit": 50, **arguments}
+        results[f"search.{name}"] = _measure(lambda: client.search_expenses(**arguments), repeats)
+    for name, arguments in SUITE_SUMMARIES.items():
+        results[f"summarize.{name}"] = _measure(lambda: client.summarize_expenses(**arguments), repeats)
+    return results
+
+def _suite_gui(client: ExpensesDatabaseClient, repeats: int) -> Dict[str, Dict[str, float]]:
+    """Offscreen timings of the ExpenseV2 hot paths: a table load, calculate_total and a year/month search."""
+    app = _qt_app()
+    from ExpenseV2 import ExpenseSearch, ExpenseTable
+    results = {}
+    table = ExpenseTable(client)
+    model = table.expense_model
+    _wait_for_model(app, model)
+
+    def load():
+        table.load_expenses()
+        _wait_for_model(app, model)
+    results["gui.load_expenses"] = _measure(load, repeats)
+    results["gui.calculate_total"] = _measure(table.calculate_total, repeats)
+    search = ExpenseSearch(table, lambda: None)
+    # The year box only lists the last ten years, which need not include the ledger's
+    if search.year_input.findText("2020") == -1:
+        search.year_input.addItem("2020")
+    search.year_input.setCurrentText("2020")
+    search.month_input.setCurrentIndex(5)
+
+    def filtered():
+        search.filtered_expense()
+        _wait_for_model(app, model)
+    results["gui.filtered_expense"] = _measure(filtered, repeats)
+    results["gui.calculate_total_year_month"] = _measure(table.calculate_total, repeats)
+    table.close_queries()
+    search.deleteLater()
+    table.deleteLater()
+    app.processEvents()
+    return results
+
+def run_suite(sizes: List[str], repeats: int, seed: int, gui: bool, output: str) -> None:
+    """Measure every size of the seeded suite and write the results (and the environment) as JSON."""
+    try:
+        revision = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        revision = ""
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "revision": revision or None,
+            "seed": seed,
+            "repeats": repeats,
+        },
+        "results": {},
+    }
+    for label in sizes:
+        size = SUITE_SIZES[label]
+        with temp_client() as client:
+            start = time.perf_counter()
+            client.create_expenses_bulk(synthetic_ledger(size, seed), batch_size=50_000)
+            built = time.perf_counter() - start
+            print(f"{label}: {size} rows loaded in {built:.1f}s", file=sys.stderr)
+            results = {"build.create_expenses_bulk": {"median_ms": built * 1000, "min_ms": built * 1000, "runs": 1}}
+            results.update(_suite_store(client, size, repeats, seed))
+            if gui:
+                results.update(_suite_gui(client, repeats))
+        report["results"][label] = results
+        for name, timing in results.items():
+            print(f"{label:>4} {name:<36} {timing['median_ms']:>12.3f} ms", file=sys.stderr)
+    with open(output, "w", encoding="utf-8") as handle:
+        json.dump(report, handle, indent=2, sort_keys=True)
+    print(f"wrote {output}", file=sys.stderr)
+
+def compare_runs(baseline_path: str, current_path: str, threshold: float, min_delta_ms: float) -> bool:
+    """Print every metric of two suite runs side by side; True when none got slower by more than threshold."""
+    with open(baseline_path, encoding="utf-8") as handle:
+        baseline = json.load(handle)
+    with open(current_path, encoding="utf-8") as handle:
+        current = json.load(handle)
+    for key in ("sqlite", "python", "platform"):
+        if baseline["meta"].get(key) != current["meta"].get(key):
+            print(f"note: {key} differs: {baseline['meta'].get(key)} -> {current['meta'].get(key)}")
+    regressions = 0
+    print(f"{'size':>4} {'metric':<36} {'before (ms)':>12} {'after (ms)':>12} {'change':>8}")
+    for label in sorted(set(baseline["results"]) | set(current["results"])):
+        before_results = baseline["results"].get(label, {})
+        after_results = current["results"].get(label, {})
+        for name in sorted(set(before_results) | set(after_results)):
+            if name not in before_results or name not in after_results:
+                print(f"{label:>4} {name:<36} {'only in ' + ('after' if name in after_results else 'before'):>34}")
+                continue
+            before, after = before_results[name]["median_ms"], after_results[name]["median_ms"]
+            change = after / before - 1 if before else 0.0
+            # Sub-millisecond timings jitter by more than any sensible ratio, so tiny deltas never count
+            flag = ""
+            if change > threshold and after - before > min_delta_ms:
+                flag = "  REGRESSION"
+                regressions += 1
+            elif change < -threshold / (1 + threshold) and before - after > min_delta_ms:
+                flag = "  faster"
+            print(f"{label:>4} {name:<36} {before:>12.3f} {after:>12.3f} {change:>+7.0%}{flag}")
+    print(f"{regressions} regression(s) beyond {threshold:.0%}")
+    return regressions == 0
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks for the expenses database client")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    bulk = commands.add_parser("bulk", help="per-row inserts vs create_expenses_bulk")
+    bulk.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    bulk.add_argument("--batch-size", type=int, default=1000)
+
+    pages = commands.add_parser("pages", help="deep-page latency, LIMIT/OFFSET vs keyset cursors")
+    pages.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000, 10_000_000])
+    pages.add_argument("--page-size", type=int, default=50)
+
+    text = commands.add_parser("fts", help="LIKE substring search vs the FTS5 index")
+    text.add_argument("--size", type=int, default=1_000_000)
+    text.add_argument("--terms", nargs="+", default=["merchant1234", "merch", "Coffee merchant0042", "nomatch"])
+
+    stress = commands.add_parser("stress", help="reader threads and a writer thread on one pooled client")
+    stress.add_argument("--readers", type=int, default=8)
+    stress.add_argument("--writes", type=int, default=2000)
+
+    loop = commands.add_parser("loop", help="event-loop lag during a large search, blocking vs async client")
+    loop.add_argument("--size", type=int, default=1_000_000)
+
+    stream = commands.add_parser("stream", help="memory use of fetchall() vs streaming iterators")
+    stream.add_argument("--size", type=int, default=1_000_000)
+    stream.add_argument("--arraysize", type=int, default=1000)
+
+    table_load = commands.add_parser("table-load", help="ExpenseTable load time, original QTableWidget vs lazy model")
+    table_load.add_argument("--size", type=int, default=50_000)
+    table_load.add_argument("--legacy-size", type=int, default=5_000)
+
+    search_latency = commands.add_parser("search-latency", help="time to first row of background ExpenseTable searches")
+    search_latency.add_argument("--size", type=int, default=1_000_000)
+
+    cache = commands.add_parser("cache", help="repeated month queries with and without a QueryCache")
+    cache.add_argument("--size", type=int, default=1_000_000)
+    cache.add_argument("--queries", type=int, default=2000)
+    cache.add_argument("--write-every", type=int, default=20)
+    cache.add_argument("--max-entries", type=int, default=256)
+
+    updates = commands.add_parser("updates", help="per-call update_expense vs update_expenses_bulk")
+    updates.add_argument("--size", type=int, default=100_000)
+    updates.add_argument("--updates", type=int, default=100_000)
+
+    transactions = commands.add_parser("transactions", help="commit throughput per durability level, per call vs transaction()")
+    transactions.add_argument("--writes", type=int, default=5000)
+    transactions.add_argument("--batch", type=int, default=500)
+
+    money = commands.add_parser("money", help="REAL prices vs integer cents, and the online price migration")
+    money.add_argument("--size", type=int, default=1_000_000)
+    money.add_argument("--chunk-size", type=int, default=5000)
+
+    columns = commands.add_parser("columns", help="tuple loops vs NumPy columns for monthly/category analytics (needs numpy)")
+    columns.add_argument("--size", type=int, default=5_000_000)
+
+    categories = commands.add_parser("categories", help="free-text expense names vs the normalized categories table")
+    categories.add_argument("--size", type=int, default=1_000_000)
+
+    rollup = commands.add_parser("rollup", help="totals from raw rows vs the monthly_totals rollup tables")
+    rollup.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+
+    transfer = commands.add_parser("transfer", help="streaming CSV/JSON Lines export and import")
+    transfer.add_argument("--size", type=int, default=1_000_000)
+    transfer.add_argument("--batch-size", type=int, default=10_000)
+
+    cli_startup = commands.add_parser("cli-startup", help="startup time of DB_CLI commands vs importing the Qt GUI")
+    cli_startup.add_argument("--size", type=int, default=100_000)
+    cli_startup.add_argument("--runs", type=int, default=15)
+
+    instrumentation = commands.add_parser("instrumentation", help="overhead of QueryInstrumentation and its sinks")
+    instrumentation.add_argument("--size", type=int, default=100_000)
+    instrumentation.add_argument("--calls", type=int, default=5_000)
+
+    tuning = commands.add_parser("tuning", help="bulk load and reads per tuning profile, and the index advisor on a month-heavy workload")
+    tuning.add_argument("--size", type=int, default=500_000)
+    tuning.add_argument("--queries", type=int, default=100)
+
+    snapshot = commands.add_parser("snapshot", help="writer latency while full-table reports read the live file or a snapshot")
+    snapshot.add_argument("--size", type=int, default=1_000_000)
+    snapshot.add_argument("--seconds", type=float, default=10.0)
+
+    partitions = commands.add_parser("partitions", help="current-year reads, VACUUM and file size before and after archive_years")
+    partitions.add_argument("--size", type=int, default=1_000_000)
+    partitions.add_argument("--repeats", type=int, default=5)
+
+    suite = commands.add_parser("suite", help="seeded CRUD, search, summary and offscreen GUI timings, written as JSON")
+    suite.add_argument("--sizes", nargs="+", choices=list(SUITE_SIZES), default=["10k", "1m"])
+    suite.add_argument("--repeats", type=int, default=7)
+    suite.add_argument("--seed", type=int, default=42)
+    suite.add_argument("--no-gui", dest="gui", action="store_false", help="skip the Qt timings")
+    suite.add_argument("--output", default="benchmark.json")
+
+    compare = commands.add_parser("compare", help="compare two suite JSON files; exit status 1 on regressions")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--threshold", type=float, default=0.25, help="relative slowdown that counts as a regression")
+    compare.add_argument("--min-delta-ms", type=float, default=0.5, help="ignore slowdowns smaller than this")
+
+    args = parser.parse_args()
+    if args.command == "bulk":
+        bench_bulk_insert(args.sizes, args.batch_size)
+    elif args.command == "pages":
+        bench_deep_pages(args.sizes, args.page_size)
+    elif args.command == "fts":
+        bench_text_search(args.size, args.terms)
+    elif args.command == "stress":
+        sys.exit(0 if stress_pool(args.readers, args.writes) else 1)
+    elif args.command == "loop":
+        bench_event_loop(args.size)
+    elif args.command == "stream":
+        bench_streaming(args.size, args.arraysize)
+    elif args.command == "table-load":
+        bench_table_load(args.size, args.legacy_size)
+    elif args.command == "search-latency":
+        bench_search_latency(args.size)
+    elif args.command == "cache":
+        bench_query_cache(args.size, args.queries, args.write_every, args.max_entries)
+    elif args.command == "updates":
+        bench_updates(args.size, args.updates)
+    elif args.command == "transactions":
+        bench_transactions(args.writes, args.batch)
+    elif args.command == "money":
+        bench_money(args.size, args.chunk_size)
+    elif args.command == "columns":
+        bench_columns(args.size)
+    elif args.command == "categories":
+        bench_categories(args.size)
+    elif args.command == "rollup":
+        bench_rollup(args.sizes)
+    elif args.command == "transfer":
+        bench_transfer(args.size, args.batch_size)
+    elif args.command == "cli-startup":
+        bench_cli_startup(args.size, args.runs)
+    elif args.command == "instrumentation":
+        bench_instrumentation(args.size, args.calls)
+    elif args.command == "tuning":
+        bench_tuning(args.size, args.queries)
+    elif args.command == "snapshot":
+        bench_snapshot(args.size, args.seconds)
+    elif args.command == "partitions":
+        bench_partitions(args.size, args.repeats)
+    elif args.command == "suite":
+        run_suite(args.sizes, args.repeats, args.seed, args.gui, args.output)
+    elif args.command == "compare":
+        sys.exit(0 if compare_runs(args.baseline, args.current, args.threshold, args.min_delta_ms) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""Headless command line for the expenses database, for scripts and cron jobs.
+
+Needs no display and never imports Qt. Run it from this directory, e.g.:
+
+    python -m DB_CLI --db expenses.db add Groceries 12.50 --date 2024-03-01
+    python -m DB_CLI --db expenses.db bulk-import march.csv --on-error skip
+    python -m DB_CLI --db expenses.db --output json search --year 2024 --month 3
+    python -m DB_CLI --db expenses.db summarize --group-by month --year 2024
+    python -m DB_CLI --db expenses.db vacuum
+    python -m DB_CLI --db expenses.db --profile read-mostly optimize --analyze
+    python -m DB_CLI --db expenses.db snapshot report.db
+    python -m DB_CLI --db report.db --immutable summarize --group-by expense
+    python -m DB_CLI --db expenses.db archive 2015
+
+--output json prints one JSON object per line (rows and groups as they are read, so large
+searches stream), --output csv prints a header and rows. Errors go to stderr with exit code 1.
+--slow-log FILE appends statements slower than --slow-ms, with their query plans, to FILE.
+--profile sets the connection pragmas of one of ExpensesDatabaseClient.TUNING_PROFILES.
+--read-only opens the database for reading only; --immutable also skips locking, for snapshots.
+"""
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+from contextlib import closing
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+from DB_Client import ExpensesDatabaseClient
+from DB_Instrumentation import JsonlSink, QueryInstrumentation
+from DB_Transfer import import_expenses, validate_record
+
+ROW_FIELDS = ("exp_id", "expense", "price", "date")
+SUMMARY_FIELDS = ("group", "total", "count", "average")
+
+def _json_line(record: Dict[str, object]) -> str:
+    """One-line JSON object whose Decimal values are written as numbers with their exact digits."""
+    items = (f"{json.dumps(key)}: {value if isinstance(value, Decimal) else json.dumps(value, ensure_ascii=False)}" for key, value in record.items())
+    return "{" + ", ".join(items) + "}"
+
+def _emit(output: str, fields: Iterable[str], records: Iterable[tuple], text_format: str) -> None:
+    """Print records (tuples in the order of fields) as text lines, JSON Lines or CSV."""
+    fields = tuple(fields)
+    if output == "csv":
+        writer = csv.writer(sys.stdout, lineterminator="\n")
+        writer.writerow(fields)
+        writer.writerows(records)
+    elif output == "json":
+        for record in records:
+            print(_json_line(dict(zip(fields, record))))
+    else:
+        for record in records:
+            print(text_format.format(*record))
+
+def _emit_object(output: str, record: Dict[str, object]) -> None:
+    """Print the single result of a command that changes the database."""
+    if output == "json":
+        print(_json_line(record))
+    elif output == "csv":
+        _emit(output, record.keys(), [tuple(record.values())], "")
+    else:
+        print(", ".join(f"{key}: {value}" for key, value in record.items()))
+
+def _filters(args: argparse.Namespace) -> Dict[str, object]:
+    """search_expenses filters from the shared filter options."""
+    return {
+        "expense": args.expense, "price": args.price, "year": args.year, "month": args.month,
+        "date_from": args.date_from, "date_to": args.date_to, "full_text": args.full_text,
+    }
+
+def cmd_add(client: ExpensesDatabaseClient, args: argparse.Namespace) -> None:
+    if args.date is not None and not client.has_date:
+        raise ValueError(f"{args.db} has no date column; add the expense without --date")
+    # The same checks as imports, so scripts cannot store e.g. dates that year/month searches miss
+    expense, price, day = validate_record({"expense": args.expense, "price": args.price, "date": args.date or date.today().isoformat()})
+    # Files from before the date column store none
+    exp_id = client.create_expense(expense, price, day if client.has_date else None)
+    _emit_object(args.output, {"exp_id": exp_id})
+
+def cmd_bulk_import(client: ExpensesDatabaseClient, args: argparse.Namespace) -> None:
+    def progress(stats):
+        print(f"{stats['rows']} rows, {stats['bytes_read'] * 100 // max(stats['total_bytes'], 1)}%", file=sys.stderr)
+    report = import_expenses(
+        client, args.path, format=args.format, batch_size=args.batch_size, on_error=args.on_error,
+        progress=progress if args.progress else None, set_wise_indexing=True
+    )
+    for error in report["errors"]:
+        print(f"skipped {error}", file=sys.stderr)
+    _emit_object(args.output, {"imported": report["imported"], "skipped": report["skipped"], "batches": report["batches"]})
+
+def cmd_search(client: ExpensesDatabaseClient, args: argparse.Namespace) -> None:
+    # Files from before the date column return rows without one
+    if client.has_date:
+        fields, text_format = ROW_FIELDS, "{0:>8}  {3}  {2:>12}  {1}"
+    else:
+        fields, text_format = ROW_FIELDS[:3], "{0:>8}  {2:>12}  {1}"
+    if args.limit is not None:
+        _emit(args.output, fields, client.search_expenses(limit=args.limit, offset=args.offset, **_filters(args)), text_format)
+        return
+    # Streams every match instead of building the whole result in memory. Closed before the
+    # client, also when the reader of the output goes away halfway
+    with closing(client.iter_search(**_filters(args))) as rows:
+        _emit(args.output, fields, rows, text_format)
+
+def cmd_summarize(client: ExpensesDatabaseClient, args: argparse.Namespace) -> None:
+    groups = client.summarize_expenses(group_by=args.group_by, **_filters(args))
+    if args.output == "text":
+        groups = ((group or "all", total, count, average.quantize(Decimal("0.01"))) for group, total, count, average in groups)
+    _emit(args.output, SUMMARY_FIELDS, groups, "{0:<24} {1:>14} {2:>9} {3:>12}")
+
+def cmd_vacuum(client: ExpensesDatabaseClient, args: argparse.Namespace) -> None:
+    _emit_object(args.output, client.vacuum())
+
+def cmd_optimize(client: ExpensesDatabaseClient, args: argparse.Namespace) -> None:
+    client.optimize(analyze=args.analyze)
+    _emit_object(args.output, {"statistics_rows": client.cursor.execute("SELECT COUNT(*) FROM sqlite_stat1;").fetchone()[0]})
+
+def cmd_snapshot(client: ExpensesDatabaseClient, args: argparse.Namespace) -> None:
+    _emit_object(args.output, client.create_snapshot(args.db, args.path, pages=args.pages, pause=args.pause))
+
+def cmd_archive(client: ExpensesDatabaseClient, args: argparse.Namespace) -> None:
+    _emit_object(args.output, client.archive_years(args.before_year, path=args.path, compress=not args.no_compress))
+
+def cmd_rebuild_rollup(client: ExpensesDatabaseClient, args: argparse.Namespace) -> None:
+    _emit_object(args.output, client.rebuild_monthly_totals())
+
+def _add_filter_options(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--expense", help="substring of the expense name (words to match with --full-text)")
+    parser.add_argument("--full-text", action="store_true", help="match --expense against the full-text index")
+    parser.add_argument("--price", type=Decimal, help="exact price")
+    parser.add_argument("--year", type=int)
+    parser.add_argument("--month", type=int, help="1-12, with or without --year")
+    parser.add_argument("--from", dest="date_from", metavar="YYYY-MM-DD", help="first date included")
+    parser.add_argument("--to", dest="date_to", metavar="YYYY-MM-DD", help="first date excluded")
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m DB_CLI", description="Headless access to the expenses database")
+    parser.add_argument("--db", default=os.environ.get("EXPENSES_DB", "expenses.db"), help="database file (default: $EXPENSES_DB or expenses.db)")
+    parser.add_argument("--output", choices=("text", "json", "csv"), default="text", help="text for people, json (JSON Lines) or csv for scripts")
+    parser.add_argument("--slow-log", metavar="FILE", help="append slow statements and their query plans to FILE as JSON Lines")
+    parser.add_argument("--slow-ms", type=float, default=100.0, help="threshold for --slow-log (default: 100)")
+    parser.add_argument("--read-only", action="store_true", help="open the database for reading only")
+    parser.add_argument("--immutable", action="store_true", help="read a file nothing writes to (e.g. a snapshot) without any locking")
+    parser.add_argument("--profile", choices=sorted(ExpensesDatabaseClient.TUNING_PROFILES), help="connection pragmas, e.g. bulk-load for large imports of data you can import again")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("add", help="add one expense and print its exp_id")
+    add.add_argument("expense")
+    add.add_argument("price")
+    add.add_argument("--date", help="YYYY-MM-DD (default: today; not allowed on files without a date column)")
+    add.set_defaults(handler=cmd_add, creates=True)
+
+    bulk_import = commands.add_parser("bulk-import", help="import a CSV or JSON Lines file in batched transactions")
+    bulk_import.add_argument("path")
+    bulk_import.add_argument("--format", choices=("csv", "jsonl"), help="default: from the file extension")
+    bulk_import.add_argument("--batch-size", type=int, default=10_000)
+    bulk_import.add_argument("--on-error", choices=("raise", "skip"), default="raise")
+    bulk_import.add_argument("--progress", action="store_true", help="report progress on stderr")
+    bulk_import.set_defaults(handler=cmd_bulk_import, creates=True)
+
+    search = commands.add_parser("search", help="print the matching expenses in exp_id order")
+    _add_filter_options(search)
+    search.add_argument("--limit", type=int, help="default: every match")
+    search.add_argument("--offset", type=int, default=0)
+    search.set_defaults(handler=cmd_search)
+
+    summarize = commands.add_parser("summarize", help="total, count and average of the matching expenses")
+    _add_filter_options(summarize)
+    summarize.add_argument("--group-by", choices=sorted(ExpensesDatabaseClient.GROUPINGS))
+    summarize.set_defaults(handler=cmd_summarize)
+
+    vacuum = commands.add_parser("vacuum", help="compact the full-text index and the database file")
+    vacuum.set_defaults(handler=cmd_vacuum)
+
+    optimize = commands.add_parser("optimize", help="refresh the query planner statistics")
+    optimize.add_argument("--analyze", action="store_true", help="full ANALYZE instead of PRAGMA optimize")
+    optimize.set_defaults(handler=cmd_optimize)
+
+    snapshot = commands.add_parser("snapshot", help="copy the database to PATH as a point-in-time snapshot for reports")
+    snapshot.add_argument("path")
+    snapshot.add_argument("--pages", type=int, default=-1, help="pages copied per step (default: all in one step)")
+    snapshot.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between steps")
+    snapshot.set_defaults(handler=cmd_snapshot)
+
+    archive = commands.add_parser("archive", help="move the rows dated before BEFORE_YEAR into a compressed archive file that searches still read")
+    archive.add_argument("before_year", type=int)
+    archive.add_argument("--path", help="archive file (default: next to the database, named after the years it holds)")
+    archive.add_argument("--no-compress", action="store_true", help="leave the archive uncompressed, so reading it needs no temporary copy")
+    archive.set_defaults(handler=cmd_archive)
+
+    rebuild_rollup = commands.add_parser("rebuild-rollup", help="recompute the monthly totals tables from the rows")
+    rebuild_rollup.set_defaults(handler=cmd_rebuild_rollup)
+    return parser
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    # Only commands that add rows may create the file; a mistyped path must not yield an empty result
+    if not getattr(args, "creates", False) and not os.path.exists(args.db):
+        print(f"error: database {args.db!r} does not exist", file=sys.stderr)
+        return 1
+    slow_log = None
+    try:
+        if args.slow_log:
+            slow_log = JsonlSink(args.slow_log, slow_only=True)
+        instrumentation = QueryInstrumentation([slow_log], slow_ms=args.slow_ms) if slow_log else None
+        with ExpensesDatabaseClient(args.db, instrumentation=instrumentation, profile=args.profile, read_only=args.read_only, immutable=args.immutable) as client:
+            args.handler(client, args)
+    except BrokenPipeError:
+        # Output piped into e.g. head, which stopped reading; nothing more can be written to it
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+    except (ValueError, OSError, sqlite3.Error) as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 1
+    finally:
+        if slow_log is not None:
+            slow_log.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
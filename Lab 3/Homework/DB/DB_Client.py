@@ -1,103 +1,2067 @@
+import base64
+import binascii
+import gzip
+import os
+import queue
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import weakref
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from itertools import groupby, islice
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, FrozenSet, Hashable, Iterable, Iterator, List, Optional, Tuple, Union
 
+if TYPE_CHECKING:
+    from DB_Instrumentation import QueryInstrumentation
 
-import sqlite3
-from typing import List, Tuple, Union
+@lru_cache(maxsize=256)
+def _cents_columns(description: tuple) -> Tuple[int, ...]:
+    """Positions of the columns selected as "name [cents]" in a cursor description."""
+    return tuple(index for index, column in enumerate(description) if column[0].endswith(" [cents]"))
+
+def _decode_cents(cursor: sqlite3.Cursor, row: tuple) -> tuple:
+    """Row factory of the client's connections: integer minor units selected as "name [cents]" come back as exact Decimals."""
+    columns = _cents_columns(cursor.description)
+    if not columns:
+        return row
+    row = list(row)
+    for index in columns:
+        value = row[index]
+        if value is not None:
+            # Averages are REAL; 15 significant digits, as SQLite prints them, keep binary noise out
+            row[index] = Decimal(value if isinstance(value, int) else format(value, ".15g")).scaleb(-2)
+    return tuple(row)
+
+class QueryCache:
+    def __init__(self, max_entries: int = 256, ttl: Optional[float] = None):
+        """Thread-safe LRU cache of query results, each tagged with the month buckets it was computed from.
+
+        Buckets are 'YYYY-MM' strings, '*-MM' for a month of any year, or None for results that depend
+        on every row (unfiltered reads, open-ended ranges). ttl is in seconds; None keeps entries until
+        they are evicted or invalidated.
+        """
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by every invalidation so a result read before a write is never stored after it
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+    def get(self, key: Hashable) -> Optional[list]:
+        """Return the cached rows for key, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+    def put(self, key: Hashable, rows: list, buckets: Optional[FrozenSet[str]], version: int) -> None:
+        """Store rows for key, unless a write invalidated the cache since version was read."""
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            if version != self.version:
+                return
+            self._entries[key] = (rows, buckets, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    def invalidate(self, months: Optional[Iterable[str]] = None) -> None:
+        """Drop entries that depend on any of the 'YYYY-MM' months; None drops everything."""
+        with self._lock:
+            self.version += 1
+            if months is None:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+                return
+            touched = set(months)
+            touched.update("*" + month[4:] for month in list(touched))
+            stale = [key for key, (_, buckets, _) in self._entries.items() if buckets is None or buckets & touched]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+    def stats(self) -> Dict[str, int]:
+        """Counters for sizing the cache."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+class _TransactionState:
+    """Nesting depth of client.transaction() blocks on one connection, and the months they wrote to (None: all)."""
+    def __init__(self):
+        self.depth = 0
+        self.months = set()
 
 class ExpensesDatabaseClient:
-    def __init__(self, db_name: str = 'expenses.db'):
-        """Initialize the client and connect to the SQLite database."""
+    # journal_mode and synchronous pragmas for each set_durability level
+    DURABILITY_LEVELS = {
+        # Rollback journal, fsync on every commit: the SQLite default
+        "full": ("DELETE", "FULL"),
+        # WAL, fsync only at checkpoints: survives application crashes, a power cut can lose the last commits
+        "normal": ("WAL", "NORMAL"),
+        # No fsync at all: fastest, for data that can be rebuilt (e.g. during a bulk load)
+        "off": ("WAL", "OFF"),
+    }
+    # Pragmas set by each apply_profile profile, in this order; a negative cache_size is in KiB
+    TUNING_PROFILES = {
+        # The GUI and short scripts: WAL so searches never wait for a save, a moderate page cache
+        "interactive": {"journal_mode": "WAL", "synchronous": "NORMAL", "cache_size": -16384, "mmap_size": 64 * 2**20, "temp_store": "MEMORY"},
+        # Large imports: no fsync and a cache big enough to keep the index pages being filled in memory.
+        # Like durability 'off', only for data that can be loaded again after a power cut
+        "bulk-load": {"journal_mode": "WAL", "synchronous": "OFF", "cache_size": -262144, "mmap_size": 0, "temp_store": "MEMORY"},
+        # Reports over a file that rarely changes: reads go straight to the memory-mapped file
+        "read-mostly": {"journal_mode": "WAL", "synchronous": "NORMAL", "cache_size": -65536, "mmap_size": 2**30, "temp_store": "MEMORY"},
+    }
+    # Keep expenses_fts in sync with the expenses table
+    FTS_TRIGGERS = (
+        '''
+            CREATE TRIGGER IF NOT EXISTS expenses_fts_ai AFTER INSERT ON expenses BEGIN
+                INSERT INTO expenses_fts(rowid, expense) VALUES (new.exp_id, new.expense);
+            END;
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS expenses_fts_ad AFTER DELETE ON expenses BEGIN
+                INSERT INTO expenses_fts(expenses_fts, rowid, expense) VALUES ('delete', old.exp_id, old.expense);
+            END;
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS expenses_fts_au AFTER UPDATE OF expense ON expenses BEGIN
+                INSERT INTO expenses_fts(expenses_fts, rowid, expense) VALUES ('delete', old.exp_id, old.expense);
+                INSERT INTO expenses_fts(rowid, expense) VALUES (new.exp_id, new.expense);
+            END;
+        ''',
+    )
+    # The same, for the normalized layout where the names are looked up in categories
+    NORMALIZED_FTS_TRIGGERS = (
+        '''
+            CREATE TRIGGER IF NOT EXISTS expenses_fts_ai AFTER INSERT ON expense_items BEGIN
+                INSERT INTO expenses_fts(rowid, expense)
+                SELECT new.exp_id, name FROM categories WHERE category_id = new.category_id;
+            END;
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS expenses_fts_ad AFTER DELETE ON expense_items BEGIN
+                INSERT INTO expenses_fts(expenses_fts, rowid, expense)
+                SELECT 'delete', old.exp_id, name FROM categories WHERE category_id = old.category_id;
+            END;
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS expenses_fts_au AFTER UPDATE OF category_id ON expense_items BEGIN
+                INSERT INTO expenses_fts(expenses_fts, rowid, expense)
+                SELECT 'delete', old.exp_id, name FROM categories WHERE category_id = old.category_id;
+                INSERT INTO expenses_fts(rowid, expense)
+                SELECT new.exp_id, name FROM categories WHERE category_id = new.category_id;
+            END;
+        ''',
+    )
+    # Batches of create_expenses_bulk(set_wise_indexing=True) from this size on are indexed set-wise (see _insert_batch)
+    SET_WISE_INDEXING_ROWS = 500
+    # Columns update_expense and update_expenses_bulk may write, in the order they appear in statements
+    UPDATABLE_COLUMNS = ("expense", "price", "date")
+    # update_expenses_bulk reads the old dates of this many patched rows per query (below SQLite's 999 parameters)
+    UPDATE_BATCH_ROWS = 500
+    # SQL expression used as the group key for each summarize_expenses grouping
+    GROUPINGS = {
+        "day": "date",
+        "month": "substr(date, 1, 7)",
+        "year": "substr(date, 1, 4)",
+        "expense": "expense",
+    }
+    # Group keys of the groupings summarize_expenses can answer from the monthly rollup tables
+    ROLLUP_GROUPINGS = {
+        None: "NULL",
+        "month": "printf('%04d-%02d', year, month)",
+        "year": "printf('%04d', year)",
+        "expense": "category",
+    }
+    # Indexes advise_indexes may create or drop: name -> (indexed expression, query shapes it serves).
+    # New databases start with idx_expense and idx_price; idx_date_price (date filters, the rollup-less
+    # summaries) and idx_category_price (name lookups of the normalized layout) are always kept.
+    # Name filters are LIKE '%term%' substring matches, which no index can serve, so idx_expense only
+    # counts for grouping by name
+    ADVISED_INDEXES = {
+        "idx_expense": ("expense", {"group:expense"}),
+        "idx_price": ("price_cents", {"price"}),
+        "idx_month": ("strftime('%m', date)", {"month"}),
+    }
+    # SQLite's default limit on attached databases, so the most archives one query can read
+    MAX_ATTACHED_ARCHIVES = 10
+    def __init__(
+        self,
+        db_name: str = 'expenses.db',
+        *,
+        cache: Optional[QueryCache] = None,
+        durability: Optional[str] = None,
+        normalize: bool = False,
+        instrumentation: Optional["QueryInstrumentation"] = None,
+        profile: Optional[str] = None,
+        optimize_every: Optional[float] = None,
+        read_only: bool = False,
+        immutable: bool = False,
+    ):
+        """Initialize the client and connect to the SQLite database; pass a QueryCache to cache read results.
+
+        normalize=True moves the database to the categories layout (see normalize_expenses) if it is not there yet.
+        instrumentation (see DB_Instrumentation.py) times every statement and commit of the client.
+        profile picks the connection pragmas (see TUNING_PROFILES); an explicit durability overrides its journal settings.
+        optimize_every refreshes the planner statistics (see optimize) at most that many seconds apart, and on close.
+        read_only=True opens the file for reading only, with the read-mostly profile unless another is given.
+        immutable=True (which implies read_only) also skips all locking; only for files nothing writes to any
+        more, such as the copies made by create_snapshot (see open_snapshot).
+        """
+        read_only = read_only or immutable
+        if read_only and (normalize or durability is not None or optimize_every is not None):
+            raise ValueError("A read-only client cannot normalize, set durability or optimize the database")
         self.db_name = db_name
-        self.connection = sqlite3.connect(self.db_name)
+        self.cache = cache
+        self.normalize = normalize
+        self.instrumentation = instrumentation
+        self.read_only = read_only
+        self._init_tuning(optimize_every)
+        self._init_archives()
+        # Interned expense name -> category_id, for normalized databases
+        self._categories = {}
+        if read_only:
+            if not os.path.exists(db_name):
+                raise FileNotFoundError(f"Database {db_name!r} does not exist")
+            # SQLite takes the open mode from a URI; immutable=1 also tells it no other process changes the file
+            uri = Path(db_name).absolute().as_uri() + ("?mode=ro&immutable=1" if immutable else "?mode=ro")
+            self.connection = self._connector()(uri, uri=True)
+        else:
+            self.connection = self._connector()(self.db_name)
+        self.connection.row_factory = _decode_cents
         self.cursor = self.connection.cursor()
+        self._transaction = _TransactionState()
+        if profile is not None or read_only:
+            self.apply_profile(profile or "read-mostly")
+        if durability is not None:
+            self.set_durability(durability)
         self.create_table()
+    def _init_tuning(self, optimize_every: Optional[float]) -> None:
+        if optimize_every is not None and optimize_every <= 0:
+            raise ValueError("optimize_every must be a positive number of seconds")
+        self.profile = None
+        self.optimize_every = optimize_every
+        self._next_optimize = None if optimize_every is None else time.monotonic() + optimize_every
+        # Filter combination -> number of reads that used it, for advise_indexes
+        self.query_shapes = Counter()
+        self._shapes_lock = threading.Lock()
+    def _init_archives(self) -> None:
+        # Rows of the archives table, reloaded when schema_version shows another client archived more
+        self._archives = []
+        self._archives_schema = None
+        # archive_id -> decompressed copy in _archive_dir, shared by all connections of the client
+        self._archive_copies = {}
+        self._archive_dir = None
+        self._archive_lock = threading.Lock()
+    def _connector(self) -> Callable[..., sqlite3.Connection]:
+        """sqlite3.connect, or its instrumented drop-in; plain connections cost nothing extra."""
+        return sqlite3.connect if self.instrumentation is None else self.instrumentation.connector(type(self))
+    def set_durability(self, level: str) -> None:
+        """Trade commit cost against crash safety: 'full', 'normal' or 'off' (see DURABILITY_LEVELS)."""
+        journal_mode, synchronous = self._durability_pragmas(level)
+        self.cursor.execute(f"PRAGMA journal_mode={journal_mode};")
+        self.cursor.execute(f"PRAGMA synchronous={synchronous};")
+    def apply_profile(self, name: str) -> None:
+        """Set cache_size, mmap_size, temp_store, journal_mode and synchronous from a TUNING_PROFILES profile."""
+        for pragma, value in self._profile_pragmas(name).items():
+            # The journal settings are the writers' business; a read-only connection cannot change them
+            if not (self.read_only and pragma in ("journal_mode", "synchronous")):
+                self.cursor.execute(f"PRAGMA {pragma}={value};")
+        self.profile = name
+    @classmethod
+    def _profile_pragmas(cls, name: str) -> Dict[str, object]:
+        if name not in cls.TUNING_PROFILES:
+            raise ValueError(f"profile must be one of {sorted(cls.TUNING_PROFILES)}, got {name!r}")
+        return cls.TUNING_PROFILES[name]
+    @classmethod
+    def _durability_pragmas(cls, level: str) -> Tuple[str, str]:
+        if level not in cls.DURABILITY_LEVELS:
+            raise ValueError(f"durability must be one of {sorted(cls.DURABILITY_LEVELS)}, got {level!r}")
+        return cls.DURABILITY_LEVELS[level]
+    def _transaction_state(self) -> _TransactionState:
+        return self._transaction
+    def _category_cache(self) -> Dict[str, int]:
+        return self._categories
+    @contextmanager
+    def transaction(self) -> Iterator["ExpensesDatabaseClient"]:
+        """Group several calls into one unit of work that commits once at the end, or not at all.
+
+        Methods called inside the block skip their own commits. Blocks can be nested; an inner block
+        is a savepoint, so an exception inside it only undoes that block's changes.
+        """
+        state = self._transaction_state()
+        connection = self.connection
+        if state.depth == 0:
+            # IMMEDIATE takes the write lock up front, so the block cannot fail halfway on a busy database
+            connection.execute("BEGIN IMMEDIATE;")
+        savepoint = f"client_tx_{state.depth}"
+        if state.depth > 0:
+            connection.execute(f"SAVEPOINT {savepoint};")
+        state.depth += 1
+        try:
+            yield self
+        except BaseException:
+            state.depth -= 1
+            if state.depth == 0:
+                connection.rollback()
+                self._finish_transaction(state)
+            else:
+                connection.execute(f"ROLLBACK TO {savepoint};")
+                connection.execute(f"RELEASE {savepoint};")
+            # Categories created inside the block are gone again
+            self._category_cache().clear()
+            raise
+        state.depth -= 1
+        if state.depth == 0:
+            try:
+                connection.commit()
+            finally:
+                self._finish_transaction(state)
+        else:
+            connection.execute(f"RELEASE {savepoint};")
+    def _finish_transaction(self, state: _TransactionState) -> None:
+        # Readers on other connections may have cached pre-commit results while the block ran,
+        # and rolled-back changes may have been cached by this one
+        if self.cache is not None and state.months != set():
+            # None (a write without a date) drops every entry
+            self.cache.invalidate(state.months)
+        state.months = set()
+    def _commit(self) -> None:
+        """Commit, unless a transaction() block will commit for us."""
+        if self._transaction_state().depth == 0:
+            self.connection.commit()
+            if self._next_optimize is not None:
+                self._maybe_optimize()
+    def _rollback(self) -> None:
+        """Roll back, unless inside a transaction() block, which rolls back when the error reaches it."""
+        if self._transaction_state().depth == 0:
+            self.connection.rollback()
+            # Ids of categories created by the rolled back statements must not be reused
+            self._category_cache().clear()
     def create_table(self):
         """Create the expenses table if it doesn't exist."""
         """These SQL scripts are well documented on ./init/init.sql"""
-        
+        if self.read_only or ("price" in self._table_columns("expenses") and not self.normalize):
+            # Files from before prices were stored in cents stay read-only until migrate_prices_to_cents
+            self._inspect_schema()
+            return
+        self.legacy_prices = False
+        self._connection_setup = []
+        if self.normalize and not self._is_normalized():
+            # Asking for the rebuild into the normalized layout also converts REAL prices to cents
+            self._migrate_prices(self.connection)
+            self._normalize_expenses(self.connection)
+        self.normalized = self._is_normalized()
+        if self.normalized:
+            for statement in self._normalized_schema("date" in self._table_columns("expenses")):
+                self.cursor.execute(statement)
+        else:
+            new_table = not self._table_columns("expenses")
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS expenses (
+                    exp_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    expense TEXT NOT NULL,
+                    price_cents INTEGER NOT NULL,
+                    date DATE NOT NULL
+                );
+            ''')
+            # Only new tables get the default indexes, so ones dropped by apply_index_advice stay dropped
+            if new_table:
+                self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_expense ON expenses(expense);')
+                self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_price ON expenses(price_cents);')
+        # Migration: databases created before date filtering was indexed get the index on open.
+        # Very old files may predate the date column entirely, in which case there is nothing to index.
+        has_date = self.has_date = "date" in self._table_columns("expenses")
+        if has_date:
+            self.cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_date_price ON {self._write_table}(date, price_cents);')
+        # Column list of every row-returning query; prices come back as Decimal through the _decode_cents row factory
+        self._row_columns = 'exp_id, expense, price_cents AS "price [cents]"' + (", date" if has_date else "")
+        self.fts_enabled = self._create_fts_index()
+        self.rollup_enabled = has_date and self._create_rollup()
+        self._commit()
+    def _inspect_schema(self) -> None:
+        """Set what create_table would, for read-only clients, without creating or migrating anything."""
+        columns = self._table_columns("expenses")
+        if not columns:
+            raise sqlite3.OperationalError(f"{self.db_name!r} has no expenses table")
+        self.legacy_prices = "price" in columns
+        # Run on every connection of the client (pooled ones included)
+        self._connection_setup = self._legacy_price_view("date" in columns) if self.legacy_prices else []
+        for statement in self._connection_setup:
+            self.cursor.execute(statement)
+        self.normalized = self._is_normalized()
+        has_date = self.has_date = "date" in columns
+        self._row_columns = 'exp_id, expense, price_cents AS "price [cents]"' + (", date" if has_date else "")
+        tables = {row[0] for row in self.cursor.execute("SELECT name FROM sqlite_master WHERE name IN ('expenses_fts', 'monthly_totals');")}
+        self.fts_enabled = "expenses_fts" in tables
+        if self.fts_enabled:
+            try:
+                self.cursor.execute("SELECT 1 FROM expenses_fts LIMIT 0;")
+            except sqlite3.OperationalError:
+                # Written by an SQLite with FTS5, read by one without
+                self.fts_enabled = False
+        self.rollup_enabled = has_date and "monthly_totals" in tables
+    def _is_normalized(self) -> bool:
+        """True when expenses is the view over expense_items and categories rather than a table."""
+        self.cursor.execute("SELECT type FROM sqlite_master WHERE name = 'expenses';")
+        row = self.cursor.fetchone()
+        return row is not None and row[0] == "view"
+    @staticmethod
+    def _legacy_price_view(has_date: bool) -> List[str]:
+        """A temporary view shadowing a legacy `price REAL` table with the price_cents column every query reads.
+
+        Temporary objects exist on one connection only and write nothing to the file.
+        """
+        return [
+            f'''
+                CREATE TEMP VIEW IF NOT EXISTS expenses AS
+                SELECT exp_id, expense, CAST(round(price * 100) AS INTEGER) AS price_cents{", date" if has_date else ""}
+                FROM main.expenses;
+            '''
+        ]
+    @property
+    def _write_table(self) -> str:
+        """Table that INSERT, UPDATE and DELETE statements go to."""
+        if self.legacy_prices:
+            raise sqlite3.OperationalError(
+                f"{self.db_name!r} still stores REAL prices and is read-only until they are converted with "
+                f"ExpensesDatabaseClient.migrate_prices_to_cents({self.db_name!r})"
+            )
+        return "expense_items" if self.normalized else "expenses"
+    @staticmethod
+    def _normalized_schema(has_date: bool = True) -> List[str]:
+        """DDL of the normalized layout: expense names live once in categories, rows refer to them by id.
+
+        The expenses view joins them back together, so every read query works unchanged.
+        """
+        date_column = ", date DATE NOT NULL" if has_date else ""
+        return [
+            '''
+                CREATE TABLE IF NOT EXISTS categories (
+                    category_id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL UNIQUE
+                );
+            ''',
+            f'''
+                CREATE TABLE IF NOT EXISTS expense_items (
+                    exp_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    category_id INTEGER NOT NULL REFERENCES categories(category_id),
+                    price_cents INTEGER NOT NULL{date_column}
+                );
+            ''',
+            # Covers GROUP BY category and the row lookups of a name search
+            "CREATE INDEX IF NOT EXISTS idx_category_price ON expense_items(category_id, price_cents);",
+            f'''
+                CREATE VIEW IF NOT EXISTS expenses AS
+                SELECT i.exp_id AS exp_id, c.name AS expense, i.price_cents AS price_cents{", i.date AS date" if has_date else ""},
+                       i.category_id AS category_id
+                FROM expense_items AS i JOIN categories AS c ON c.category_id = i.category_id;
+            ''',
+        ]
+    @classmethod
+    def migrate_prices_to_cents(cls, db_name: str, chunk_size: int = 5000, allow_rounding: bool = False, pause: float = 0.0) -> Dict[str, object]:
+        """Convert a database whose prices are stored as REAL to integer cents; until then clients can only read it."""
+        connection = sqlite3.connect(db_name)
+        try:
+            return cls._migrate_prices(connection, chunk_size, allow_rounding, pause)
+        finally:
+            connection.close()
+    @classmethod
+    def normalize_expenses(cls, db_name: str, chunk_size: int = 5000, pause: float = 0.0) -> Dict[str, object]:
+        """Move a database to the normalized categories layout; clients opened with normalize=True do this on open."""
+        connection = sqlite3.connect(db_name)
+        try:
+            cls._migrate_prices(connection, chunk_size, pause=pause)
+            return cls._normalize_expenses(connection, chunk_size, pause)
+        finally:
+            connection.close()
+    @classmethod
+    def _migrate_prices(cls, connection: sqlite3.Connection, chunk_size: int = 5000, allow_rounding: bool = False, pause: float = 0.0) -> Dict[str, object]:
+        """Rebuild a legacy `price REAL` table as `price_cents INTEGER` (see _rebuild_expenses).
+
+        Sub-cent prices cannot be stored exactly, so they make the migration fail unless
+        allow_rounding is set, in which case they are rounded to the nearest cent.
+        """
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(expenses);")]
+        if "price" not in columns:
+            return {"migrated": 0, "chunks": 0, "rounded": 0, "longest_lock": 0.0}
+        rounded = connection.execute(
+            "SELECT COUNT(*) FROM expenses WHERE abs(price * 100 - round(price * 100)) > 1e-6;"
+        ).fetchone()[0]
+        if rounded and not allow_rounding:
+            raise ValueError(
+                f"{rounded} price(s) have fractions of a cent; run ExpensesDatabaseClient.migrate_prices_to_cents"
+                f"(db_name, allow_rounding=True) to round them to the nearest cent"
+            )
+        has_date = "date" in columns
+        date_column = ", date DATE NOT NULL" if has_date else ""
+        copied = "exp_id, expense, price_cents" + (", date" if has_date else "")
+        mirrored = "new.exp_id, new.expense, CAST(round(new.price * 100) AS INTEGER)" + (", new.date" if has_date else "")
+        setup = [
+            f'''
+                CREATE TABLE IF NOT EXISTS expenses_cents (
+                    exp_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    expense TEXT NOT NULL,
+                    price_cents INTEGER NOT NULL{date_column}
+                );
+            ''',
+            "CREATE INDEX IF NOT EXISTS idx_expense ON expenses_cents(expense);",
+            "CREATE INDEX IF NOT EXISTS idx_price ON expenses_cents(price_cents);",
+        ]
+        if has_date:
+            setup.append("CREATE INDEX IF NOT EXISTS idx_date_price ON expenses_cents(date, price_cents);")
+        stats = cls._rebuild_expenses(
+            connection, "expenses_cents", setup,
+            f"INSERT OR REPLACE INTO expenses_cents ({copied}) VALUES ({mirrored});",
+            f"INSERT OR REPLACE INTO expenses_cents ({copied}) "
+            f"SELECT exp_id, expense, CAST(round(price * 100) AS INTEGER){', date' if has_date else ''} "
+            f"FROM expenses WHERE exp_id > ? AND exp_id <= ?;",
+            ["ALTER TABLE expenses_cents RENAME TO expenses;"],
+            cls.FTS_TRIGGERS, cls._rollup_triggers(False), chunk_size, pause
+        )
+        stats["rounded"] = rounded
+        return stats
+    @classmethod
+    def _normalize_expenses(cls, connection: sqlite3.Connection, chunk_size: int = 5000, pause: float = 0.0) -> Dict[str, object]:
+        """Rebuild the expenses table as expense_items rows pointing into categories (see _rebuild_expenses)."""
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(expenses);")]
+        if not columns:
+            # Nothing to convert: create_table builds the normalized schema from scratch
+            for statement in cls._normalized_schema() + [cls._advised_index_sql("idx_price", "expense_items")]:
+                connection.execute(statement)
+            connection.commit()
+            return {"migrated": 0, "chunks": 0, "longest_lock": 0.0}
+        has_date = "date" in columns
+        schema = cls._normalized_schema(has_date)
+        copied = "exp_id, category_id, price_cents" + (", date" if has_date else "")
+        setup = schema[:3] + [
+            cls._advised_index_sql("idx_price", "expense_items"),
+            # Most names repeat, so the distinct ones are collected up front through idx_expense
+            "INSERT OR IGNORE INTO categories (name) SELECT DISTINCT expense FROM expenses;",
+        ]
+        if has_date:
+            setup.append("CREATE INDEX IF NOT EXISTS idx_date_price ON expense_items(date, price_cents);")
+        mirror = (
+            "INSERT OR IGNORE INTO categories (name) VALUES (new.expense); "
+            f"INSERT OR REPLACE INTO expense_items ({copied}) "
+            f"SELECT new.exp_id, category_id, new.price_cents{', new.date' if has_date else ''} FROM categories WHERE name = new.expense;"
+        )
+        return cls._rebuild_expenses(
+            connection, "expense_items", setup, mirror,
+            f"INSERT OR REPLACE INTO expense_items ({copied}) "
+            f"SELECT e.exp_id, c.category_id, e.price_cents{', e.date' if has_date else ''} "
+            f"FROM expenses AS e JOIN categories AS c ON c.name = e.expense WHERE e.exp_id > ? AND e.exp_id <= ?;",
+            schema[3:], cls.NORMALIZED_FTS_TRIGGERS, cls._rollup_triggers(True), chunk_size, pause
+        )
+    @staticmethod
+    def _rebuild_expenses(connection: sqlite3.Connection, shadow: str, setup: List[str], mirror: str, copy: str, swap: List[str], fts_triggers: Tuple[str, ...], rollup_triggers: List[str], chunk_size: int = 5000, pause: float = 0.0) -> Dict[str, object]:
+        """Online rebuild of the expenses table into a new layout without holding the write lock for long.
+
+        setup creates the shadow table in one short transaction, and triggers running the mirror
+        statements apply every write made in the meantime by any connection to it. copy then moves
+        chunk_size rows per transaction (bound to an exclusive/inclusive exp_id range) up to the last row
+        that existed when the triggers were created. A final short
+        transaction checks the row counts, drops the old table and runs the swap statements. An
+        interrupted rebuild starts over on the next call.
+        """
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+        connection.execute("BEGIN IMMEDIATE;")
+        try:
+            # The new table takes over the index names, so the old indexes go first
+            for index in ("idx_expense", "idx_price", "idx_date_price"):
+                connection.execute(f"DROP INDEX IF EXISTS {index};")
+            for statement in setup:
+                connection.execute(statement)
+            connection.execute(f"CREATE TRIGGER IF NOT EXISTS expenses_rebuild_ai AFTER INSERT ON expenses BEGIN {mirror} END;")
+            connection.execute(
+                f"CREATE TRIGGER IF NOT EXISTS expenses_rebuild_au AFTER UPDATE ON expenses BEGIN "
+                f"DELETE FROM {shadow} WHERE exp_id = old.exp_id; {mirror} END;"
+            )
+            connection.execute(
+                f"CREATE TRIGGER IF NOT EXISTS expenses_rebuild_ad AFTER DELETE ON expenses BEGIN "
+                f"DELETE FROM {shadow} WHERE exp_id = old.exp_id; END;"
+            )
+            # Rows added from here on are mirrored by the triggers, so the copy stops at the current last id
+            high = connection.execute("SELECT COALESCE(max(exp_id), 0) FROM expenses;").fetchone()[0]
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+        last_id = 0
+        migrated = 0
+        chunks = 0
+        longest_lock = 0.0
+        while True:
+            started = time.perf_counter()
+            connection.execute("BEGIN IMMEDIATE;")
+            try:
+                upper, count = connection.execute(
+                    "SELECT max(exp_id), COUNT(*) FROM (SELECT exp_id FROM expenses WHERE exp_id > ? AND exp_id <= ? ORDER BY exp_id LIMIT ?);",
+                    (last_id, high, chunk_size)
+                ).fetchone()
+                if count:
+                    connection.execute(copy, (last_id, upper))
+                connection.commit()
+            except BaseException:
+                connection.rollback()
+                raise
+            longest_lock = max(longest_lock, time.perf_counter() - started)
+            if not count:
+                break
+            last_id = upper
+            migrated += count
+            chunks += 1
+            if pause:
+                # Leaves room for other writers between chunks
+                time.sleep(pause)
+        started = time.perf_counter()
+        connection.execute("BEGIN IMMEDIATE;")
+        try:
+            old_count = connection.execute("SELECT COUNT(*) FROM expenses;").fetchone()[0]
+            new_count = connection.execute(f"SELECT COUNT(*) FROM {shadow};").fetchone()[0]
+            if old_count != new_count:
+                raise sqlite3.DatabaseError(f"Rebuilding expenses copied {new_count} of {old_count} rows")
+            # AUTOINCREMENT must not hand out the ids of rows deleted before the rebuild
+            sequence = connection.execute("SELECT seq FROM sqlite_sequence WHERE name = 'expenses';").fetchone()
+            if sequence is not None:
+                connection.execute("DELETE FROM sqlite_sequence WHERE name = ?;", (shadow,))
+                connection.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?);", (shadow, sequence[0]))
+            # Dropping the old table drops its indexes and triggers, including the full-text and rollup ones
+            connection.execute("DROP TABLE expenses;")
+            for statement in swap:
+                connection.execute(statement)
+            if connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'expenses_fts';").fetchone():
+                for trigger in fts_triggers:
+                    connection.execute(trigger)
+            if connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'monthly_totals';").fetchone():
+                # The rollup already counts every row, the copied ones included
+                for trigger in rollup_triggers:
+                    connection.execute(trigger)
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+        longest_lock = max(longest_lock, time.perf_counter() - started)
+        return {"migrated": migrated, "chunks": chunks, "longest_lock": longest_lock}
+    def _create_fts_index(self) -> bool:
+        """Create the FTS5 index over expense descriptions and its sync triggers; False if FTS5 is unavailable."""
+        self.cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'expenses_fts';")
+        existed = self.cursor.fetchone() is not None
+        try:
+            self.cursor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS expenses_fts USING fts5(expense, content='expenses', content_rowid='exp_id');"
+            )
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5: search_expenses falls back to LIKE
+            return False
+        for trigger in self.NORMALIZED_FTS_TRIGGERS if self.normalized else self.FTS_TRIGGERS:
+            self.cursor.execute(trigger)
+        if not existed:
+            # Migration: index the rows that were written before the FTS table existed
+            self.cursor.execute("INSERT INTO expenses_fts(expenses_fts) VALUES ('rebuild');")
+        return True
+    def _create_rollup(self) -> bool:
+        """Create the monthly_totals and monthly_category_totals rollup tables and the triggers keeping them current."""
+        self.cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'monthly_totals';")
+        existed = self.cursor.fetchone() is not None
+        # Whole-month totals get a table of their own, so they are a single primary-key lookup
+        # and no placeholder category can collide with a real expense name
         self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS expenses (
-                exp_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                expense TEXT NOT NULL,
-                price REAL NOT NULL,
-                date DATE NOT NULL
-            );
+            CREATE TABLE IF NOT EXISTS monthly_totals (
+                year INTEGER NOT NULL,
+                month INTEGER NOT NULL,
+                total_cents INTEGER NOT NULL,
+                row_count INTEGER NOT NULL,
+                PRIMARY KEY (year, month)
+            ) WITHOUT ROWID;
         ''')
-        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_expense ON expenses(expense);')
-        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_price ON expenses(price);')
-        self.connection.commit()
-    def create_expense(self, expense: str, price: float, date: str) -> None:
-        """Add a new expense to the database with a provided date."""
-        self.cursor.execute(
-            "INSERT INTO expenses (expense, price, date) VALUES (?, ?, ?);",
-            (expense, price, date)
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS monthly_category_totals (
+                year INTEGER NOT NULL,
+                month INTEGER NOT NULL,
+                category TEXT NOT NULL,
+                total_cents INTEGER NOT NULL,
+                row_count INTEGER NOT NULL,
+                PRIMARY KEY (year, month, category)
+            ) WITHOUT ROWID;
+        ''')
+        for trigger in self._rollup_triggers(self.normalized):
+            self.cursor.execute(trigger)
+        if not existed:
+            # Migration: count the rows that were written before the rollup existed
+            self._fill_rollup()
+        return True
+    @staticmethod
+    def _rollup_triggers(normalized: bool) -> List[str]:
+        """INSERT, UPDATE and DELETE triggers that add every row to, and take it out of, its month in both rollup tables."""
+        table = "expense_items" if normalized else "expenses"
+        name_column = "category_id" if normalized else "expense"
+        def keys(row: str) -> Tuple[str, str, str]:
+            name = f"(SELECT name FROM categories WHERE category_id = {row}.category_id)" if normalized else f"{row}.expense"
+            return f"CAST(substr({row}.date, 1, 4) AS INTEGER)", f"CAST(substr({row}.date, 6, 2) AS INTEGER)", name
+        def add(row: str) -> str:
+            year, month, name = keys(row)
+            return (
+                f"INSERT INTO monthly_totals (year, month, total_cents, row_count) VALUES ({year}, {month}, {row}.price_cents, 1) "
+                f"ON CONFLICT (year, month) DO UPDATE SET total_cents = total_cents + excluded.total_cents, row_count = row_count + 1; "
+                f"INSERT INTO monthly_category_totals (year, month, category, total_cents, row_count) VALUES ({year}, {month}, {name}, {row}.price_cents, 1) "
+                f"ON CONFLICT (year, month, category) DO UPDATE SET total_cents = total_cents + excluded.total_cents, row_count = row_count + 1;"
+            )
+        def remove(row: str) -> str:
+            year, month, name = keys(row)
+            # Months (and categories) left without rows disappear, so the tables only hold what exists
+            return (
+                f"UPDATE monthly_totals SET total_cents = total_cents - {row}.price_cents, row_count = row_count - 1 "
+                f"WHERE year = {year} AND month = {month}; "
+                f"DELETE FROM monthly_totals WHERE year = {year} AND month = {month} AND row_count = 0; "
+                f"UPDATE monthly_category_totals SET total_cents = total_cents - {row}.price_cents, row_count = row_count - 1 "
+                f"WHERE year = {year} AND month = {month} AND category = {name}; "
+                f"DELETE FROM monthly_category_totals WHERE year = {year} AND month = {month} AND category = {name} AND row_count = 0;"
+            )
+        return [
+            f"CREATE TRIGGER IF NOT EXISTS monthly_totals_ai AFTER INSERT ON {table} BEGIN {add('new')} END;",
+            f"CREATE TRIGGER IF NOT EXISTS monthly_totals_ad AFTER DELETE ON {table} BEGIN {remove('old')} END;",
+            f"CREATE TRIGGER IF NOT EXISTS monthly_totals_au AFTER UPDATE OF {name_column}, price_cents, date ON {table} BEGIN {remove('old')} {add('new')} END;",
+        ]
+    def _fill_rollup(self, id_range: Optional[Tuple[int, int]] = None, archives: Iterable[str] = ()) -> None:
+        """Recompute both rollup tables from the rows, or add the rows of an inclusive exp_id range to them.
+
+        archives names attached archives whose rows are counted too when recomputing.
+        """
+        months = "CAST(substr(date, 1, 4) AS INTEGER), CAST(substr(date, 6, 2) AS INTEGER)"
+        if id_range is None:
+            self.cursor.execute("DELETE FROM monthly_totals;")
+            self.cursor.execute("DELETE FROM monthly_category_totals;")
+            where, values = "", []
+        else:
+            where, values = "WHERE exp_id BETWEEN ? AND ?", list(id_range)
+        add = "DO UPDATE SET total_cents = total_cents + excluded.total_cents, row_count = row_count + excluded.row_count"
+        sources = [(self._write_table, "expenses")] + [(f"{schema}.expenses",) * 2 for schema in archives]
+        for totals_source, category_source in sources:
+            self.cursor.execute(
+                f"INSERT INTO monthly_totals (year, month, total_cents, row_count) "
+                f"SELECT {months}, SUM(price_cents), COUNT(*) FROM {totals_source} {where} GROUP BY 1, 2 "
+                f"ON CONFLICT (year, month) {add};",
+                values
+            )
+            self.cursor.execute(
+                f"INSERT INTO monthly_category_totals (year, month, category, total_cents, row_count) "
+                f"SELECT {months}, expense, SUM(price_cents), COUNT(*) FROM {category_source} {where} GROUP BY 1, 2, 3 "
+                f"ON CONFLICT (year, month, category) {add};",
+                values
+            )
+    def rebuild_monthly_totals(self) -> Dict[str, int]:
+        """Recompute the monthly rollup tables from the rows, repairing any drift, and report what changed.
+
+        The triggers keep the rollup exact on their own; drift only comes from writes that bypass them,
+        e.g. a file edited by a tool that dropped the triggers. Returns the number of months and of
+        month/category pairs, and how many of those were wrong or missing before the rebuild.
+        """
+        if not self.rollup_enabled:
+            # Files without a date column have no months to roll up
+            return {"months": 0, "category_months": 0, "drifted": 0}
+        rollup_rows = (
+            "SELECT year, month, NULL AS category, total_cents, row_count FROM monthly_totals "
+            "UNION ALL SELECT year, month, category, total_cents, row_count FROM monthly_category_totals"
         )
-        self.connection.commit()
-    def read_all_expenses(self, limit: int, offset: int = 0) -> List[Tuple[int, str, float, str]]:
+        # The rollup also counts the archived rows (see archive_years); they are attached before the transaction
+        archives = self._open_archives(None, None, None)
+        with self.transaction():
+            self.cursor.execute("DROP TABLE IF EXISTS temp.rollup_before;")
+            self.cursor.execute(f"CREATE TEMP TABLE rollup_before AS {rollup_rows};")
+            self._fill_rollup(archives=[f"archive_{archive['archive_id']}" for archive in archives])
+            # Keys whose row changed, appeared or disappeared
+            self.cursor.execute(f'''
+                SELECT COUNT(*) FROM (
+                    SELECT year, month, category FROM (SELECT * FROM temp.rollup_before EXCEPT SELECT * FROM ({rollup_rows}))
+                    UNION
+                    SELECT year, month, category FROM (SELECT * FROM ({rollup_rows}) EXCEPT SELECT * FROM temp.rollup_before)
+                );
+            ''')
+            drifted = self.cursor.fetchone()[0]
+            self.cursor.execute("DROP TABLE temp.rollup_before;")
+            months = self.cursor.execute("SELECT COUNT(*) FROM monthly_totals;").fetchone()[0]
+            category_months = self.cursor.execute("SELECT COUNT(*) FROM monthly_category_totals;").fetchone()[0]
+        if self.cache is not None:
+            # Summaries cached from the drifted rollup may be wrong in any month
+            self.cache.invalidate()
+        return {"months": months, "category_months": category_months, "drifted": drifted}
+    def _table_columns(self, table: str) -> List[str]:
+        """Return the column names of a table in the connected database."""
+        self.cursor.execute(f"PRAGMA table_info({table});")
+        return [row[1] for row in self.cursor.fetchall()]
+    def create_expense(self, expense: str, price: Union[Decimal, float, str], date: Optional[str]) -> int:
+        """Add a new expense to the database with a provided date and return its exp_id.
+
+        Files from before the date column (has_date is False) take date=None instead.
+        """
+        if not self.has_date and date is not None:
+            raise ValueError(f"{self.db_name!r} has no date column; pass date=None")
+        # Converted before _name_value, which may already insert a category
+        cents = self._to_cents(price)
+        try:
+            if self.has_date:
+                self.cursor.execute(self._insert_sql(), (self._name_value(expense), cents, date))
+            else:
+                self.cursor.execute(
+                    f"INSERT INTO {self._write_table} ({'category_id' if self.normalized else 'expense'}, price_cents) VALUES (?, ?);",
+                    (self._name_value(expense), cents)
+                )
+            self._commit()
+        except sqlite3.Error:
+            # Otherwise the connection stays in the implicit transaction, holding the write lock
+            self._rollback()
+            raise
+        self._invalidate_dates([date])
+        return self.cursor.lastrowid
+    def create_expenses_bulk(self, rows: Iterable[Tuple[str, Union[Decimal, float, str], str]], batch_size: int = 1000, set_wise_indexing: bool = False) -> Dict[str, object]:
+        """Insert many (expense, price, date) rows, committing once per batch instead of once per row.
+
+        set_wise_indexing=True is the import mode of _insert_batch: faster, but every large batch
+        changes the schema, so the other connections to the file prepare their statements again.
+        Files from before the date column (has_date is False) only take single create_expense calls.
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        if not self.has_date:
+            raise ValueError(f"{self.db_name!r} has no date column to store the rows' dates; add them one by one with create_expense(..., date=None)")
+        rows = iter(rows)  # Works for lists as well as generators
+        inserted = 0
+        id_ranges = []
+        while True:
+            batch = [(expense, self._to_cents(price), date) for expense, price, date in islice(rows, batch_size)]
+            if not batch:
+                break
+            try:
+                last_id = self._insert_batch(batch, set_wise_indexing)
+                self._commit()
+            except sqlite3.Error:
+                self._rollback()
+                raise
+            self._invalidate_dates(row[2] for row in batch)
+            inserted += len(batch)
+            id_ranges.append((last_id - len(batch) + 1, last_id))
+        return {"inserted": inserted, "batches": len(id_ranges), "id_ranges": id_ranges}
+    def _insert_batch(self, batch: List[Tuple[str, int, str]], set_wise: bool = False) -> int:
+        """Insert (expense, price_cents, date) rows in one savepoint and return the exp_id of the last one.
+
+        With set_wise=True, large batches are indexed set-wise: the full-text and rollup insert triggers are dropped
+        inside the savepoint, and one statement each then indexes the whole new id range, which is
+        about three times faster than firing them row by row. Other connections cannot write
+        meanwhile and never see the triggers missing, since the drop is committed together with
+        their re-creation.
+        """
+        deferred = []
+        if set_wise and len(batch) >= self.SET_WISE_INDEXING_ROWS:
+            triggers = self.NORMALIZED_FTS_TRIGGERS if self.normalized else self.FTS_TRIGGERS
+            if self.fts_enabled:
+                deferred.append(("expenses_fts_ai", triggers[0]))
+            if self.rollup_enabled:
+                deferred.append(("monthly_totals_ai", self._rollup_triggers(self.normalized)[0]))
+        self.connection.execute("SAVEPOINT bulk_batch;")
+        try:
+            for name, _ in deferred:
+                self.cursor.execute(f"DROP TRIGGER IF EXISTS {name};")
+            self.cursor.executemany(
+                self._insert_sql(),
+                [(self._name_value(expense), price, date) for expense, price, date in batch]
+            )
+            # AUTOINCREMENT ids are contiguous inside a single write transaction
+            last_id = self.cursor.execute("SELECT last_insert_rowid();").fetchone()[0]
+            id_range = (last_id - len(batch) + 1, last_id)
+            for name, trigger in deferred:
+                if name == "expenses_fts_ai":
+                    self.cursor.execute("INSERT INTO expenses_fts(rowid, expense) SELECT exp_id, expense FROM expenses WHERE exp_id BETWEEN ? AND ?;", id_range)
+                else:
+                    self._fill_rollup(id_range)
+                self.cursor.execute(trigger)
+        except BaseException:
+            self.connection.execute("ROLLBACK TO bulk_batch;")
+            self.connection.execute("RELEASE bulk_batch;")
+            # Categories created by the batch are gone again
+            self._category_cache().clear()
+            raise
+        # Commits too, unless a transaction was already open
+        self.connection.execute("RELEASE bulk_batch;")
+        return last_id
+    def _insert_sql(self) -> str:
+        return f"INSERT INTO {self._write_table} ({'category_id' if self.normalized else 'expense'}, price_cents, date) VALUES (?, ?, ?);"
+    def _name_value(self, expense: str) -> Union[str, int]:
+        """The value stored for an expense name: the name itself, or its interned category_id when normalized."""
+        if not self.normalized:
+            return expense
+        cache = self._category_cache()
+        category_id = cache.get(expense)
+        if category_id is None:
+            # A cursor of its own, since this can run while executemany is iterating on self.cursor.
+            # Unlike OR IGNORE, DO NOTHING still rejects a NULL name, as the plain layout does
+            self.connection.execute("INSERT INTO categories (name) VALUES (?) ON CONFLICT (name) DO NOTHING;", (expense,))
+            row = self.connection.execute("SELECT category_id FROM categories WHERE name = ?;", (expense,)).fetchone()
+            category_id = cache[expense] = row[0]
+        return category_id
+    def read_all_expenses(self, limit: int, offset: int = 0) -> List[Tuple[int, str, Decimal, str]]:
         """Retrieve expenses from the database with pagination."""
-        self.cursor.execute(
-            "SELECT * FROM expenses LIMIT ? OFFSET ?;", 
-            (limit, offset)
+        return self._fetch_cached(
+            ("read_all", limit, offset), None,
+            f"SELECT {self._row_columns} FROM {self._filtered_source(record=False)[0]} LIMIT ? OFFSET ?;",
+            [limit, offset]
         )
-        return self.cursor.fetchall()
-    def update_expense(self, exp_id: int, expense: Union[str, None] = None, price: Union[float, None] = None, date: Union[str, None] = None) -> None:
-        """Update an expense's details in the database."""
-        # Prepare the SQL query based on which parameters are provided
-        if expense is not None and price is not None and date is not None:
-            self.cursor.execute("UPDATE expenses SET expense = ?, price = ?, date = ? WHERE exp_id = ?;", (expense, price, date, exp_id))
-        elif expense is not None and price is not None:
-            self.cursor.execute("UPDATE expenses SET expense = ?, price = ? WHERE exp_id = ?;", (expense, price, exp_id))
-        elif expense is not None and date is not None:
-            self.cursor.execute("UPDATE expenses SET expense = ?, date = ? WHERE exp_id = ?;", (expense, date, exp_id))
-        elif price is not None and date is not None:
-            self.cursor.execute("UPDATE expenses SET price = ?, date = ? WHERE exp_id = ?;", (price, date, exp_id))
-        elif expense is not None:
-            self.cursor.execute("UPDATE expenses SET expense = ? WHERE exp_id = ?;", (expense, exp_id))
-        elif price is not None:
-            self.cursor.execute("UPDATE expenses SET price = ? WHERE exp_id = ?;", (price, exp_id))
-        elif date is not None:
-            self.cursor.execute("UPDATE expenses SET date = ? WHERE exp_id = ?;", (date, exp_id))
-            
-        self.connection.commit()
+    def read_expense(self, exp_id: int, **filters) -> Optional[Tuple[int, str, Decimal, str]]:
+        """Fetch one expense by ID; None if it does not exist or does not match the optional search_expenses filters."""
+        # Served by the primary key whatever the filters, so not a shape for advise_indexes
+        conditions, values = self._build_filters(record=False, **filters)
+        conditions.append("exp_id = ?")
+        values.append(exp_id)
+        self.cursor.execute(f"SELECT {self._row_columns} FROM expenses WHERE " + " AND ".join(conditions), values)
+        row = self.cursor.fetchone()
+        if row is None and self._archives_for(filters.get("year"), filters.get("date_from"), filters.get("date_to")):
+            # Not a live row; maybe an archived one
+            source, conditions, values = self._filtered_source(record=False, **filters)
+            self.cursor.execute(f"SELECT {self._row_columns} FROM {source} WHERE exp_id = ?", values + [exp_id])
+            row = self.cursor.fetchone()
+        return row
+    def iter_expenses(self, arraysize: int = 1000) -> Iterator[Tuple[int, str, Decimal, str]]:
+        """Yield every expense in exp_id order, holding at most arraysize rows in memory at a time."""
+        return self._iter_rows(f"SELECT {self._row_columns} FROM {self._filtered_source(record=False)[0]} ORDER BY exp_id;", [], arraysize)
+    def iter_search(self, expense: Union[str, None] = None, price: Union[Decimal, float, None] = None, year: Union[int, None] = None, month: Union[int, None] = None, date_from: Union[str, None] = None, date_to: Union[str, None] = None, full_text: bool = False, arraysize: int = 1000) -> Iterator[Tuple[int, str, Decimal, str]]:
+        """Yield every expense matching the search_expenses filters, fetching arraysize rows at a time."""
+        source, filters, values = self._filtered_source(expense, price, year, month, date_from, date_to, full_text)
+        query = f"SELECT {self._row_columns} FROM {source}"
+        if filters:
+            query += " WHERE " + " AND ".join(filters)
+        return self._iter_rows(query + " ORDER BY exp_id;", values, arraysize)
+    def fetch_columns(self, price_dtype: str = "float64", arraysize: int = 10000, **filters) -> Dict[str, object]:
+        """Load the rows matching the search_expenses filters as NumPy columns instead of tuples (needs numpy).
 
-    def search_expenses(self, expense: Union[str, None] = None, price: Union[float, None] = None, year: Union[int, None] = None, month: Union[int, None] = None, limit: int = 10, offset: int = 0) -> List[Tuple[int, str, float, str]]:
-        """Search expenses by filtering on expense, price, year, or month with pagination."""
-        # Base query
-        query = "SELECT * FROM expenses WHERE"
+        Returns a dict of equal-length arrays ordered by exp_id: 'exp_id' (int64), 'date' (datetime64[D],
+        all NaT on files without a date column), 'price' (float64 amounts, or int64 cents with
+        price_dtype='int64') and 'expense_code' (int32 codes into the 'categories' list of the distinct
+        expense names).
+        """
+        try:
+            import numpy as np
+        except ImportError:
+            raise ImportError("fetch_columns needs numpy: pip install numpy") from None
+        if price_dtype not in ("float64", "int64"):
+            raise ValueError(f"price_dtype must be 'float64' or 'int64', got {price_dtype!r}")
+        if arraysize < 1:
+            raise ValueError("arraysize must be at least 1")
+        source, conditions, values = self._filtered_source(**filters)
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        self.cursor.execute(f"SELECT COUNT(*) FROM {source}" + where, values)
+        capacity = self.cursor.fetchone()[0]
+        exp_ids = np.empty(capacity, dtype=np.int64)
+        dates = np.empty(capacity, dtype="datetime64[D]")
+        cents = np.empty(capacity, dtype=np.int64)
+        codes = np.empty(capacity, dtype=np.int32)
+        lookup = {}
+        filled = 0
+        cursor = self.connection.cursor()
+        cursor.arraysize = arraysize
+        # Tuples straight from sqlite3, without a row factory call per row
+        cursor.row_factory = None
+        try:
+            # Plain price_cents (no "[cents]" alias) so no Decimal is built per row; on normalized
+            # databases the category ids are fetched instead of the names (archives only have names)
+            by_category = self.normalized and source == "expenses"
+            name = "category_id" if by_category else "expense"
+            # NULL dates become NaT, so files from before the date column get the same arrays
+            date = "date" if self.has_date else "NULL"
+            cursor.execute(f"SELECT exp_id, {name}, price_cents, {date} FROM {source}{where} ORDER BY exp_id;", values)
+            while True:
+                rows = cursor.fetchmany()
+                if not rows:
+                    break
+                end = filled + len(rows)
+                if end > capacity:
+                    # Rows were added after the COUNT; grow instead of failing
+                    capacity = max(end, capacity * 2)
+                    exp_ids, dates, cents, codes = (np.resize(column, capacity) for column in (exp_ids, dates, cents, codes))
+                chunk_ids, chunk_names, chunk_cents, chunk_dates = zip(*rows)
+                exp_ids[filled:end] = chunk_ids
+                cents[filled:end] = chunk_cents
+                dates[filled:end] = chunk_dates  # ISO strings are parsed by NumPy in C
+                if by_category:
+                    codes[filled:end] = chunk_names
+                else:
+                    codes[filled:end] = [lookup.setdefault(expense, len(lookup)) for expense in chunk_names]
+                filled = end
+        finally:
+            cursor.close()
+        codes = codes[:filled]
+        if by_category:
+            # Renumber the category ids that occur to 0..n-1
+            category_ids, codes = np.unique(codes, return_inverse=True)
+            names = dict(self.connection.execute("SELECT category_id, name FROM categories;"))
+            lookup = {names[category_id]: None for category_id in category_ids.tolist()}
+            codes = codes.astype(np.int32)
+        price = cents[:filled] if price_dtype == "int64" else cents[:filled] / 100.0
+        return {
+            "exp_id": exp_ids[:filled],
+            "date": dates[:filled],
+            "price": price,
+            "expense_code": codes,
+            "categories": list(lookup),
+        }
+    def _iter_rows(self, query: str, values: list, arraysize: int) -> Iterator[Tuple[int, str, Decimal, str]]:
+        """Stream a query's rows with fetchmany on a private cursor, so other calls can run mid-iteration."""
+        if arraysize < 1:
+            raise ValueError("arraysize must be at least 1")
+        cursor = self.connection.cursor()
+        cursor.arraysize = arraysize
+        try:
+            cursor.execute(query, values)
+            while True:
+                rows = cursor.fetchmany()
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
+    def update_expense(self, exp_id: int, expense: Union[str, None] = None, price: Union[Decimal, float, None] = None, date: Union[str, None] = None) -> None:
+        """Update an expense's details in the database; archived expenses (see archive_years) raise sqlite3.OperationalError."""
+        # The cache has to forget the month the row is leaving as well as the one it moves to
+        old_row = self.read_expense(exp_id) if self.cache is not None else None
+        changed = None
+        try:
+            # Only the provided parameters are written; a new name may already add a category before a bad price raises
+            columns, values = self._update_columns({"expense": expense, "price": price, "date": date})
+            if columns:
+                self.cursor.execute(self._update_sql(self._write_table, columns), values + [exp_id])
+                changed = self.cursor.rowcount
+            self._commit()
+        except Exception:
+            self._rollback()
+            raise
+        if changed == 0:
+            self._check_not_archived(exp_id)
+        if old_row is not None:
+            # Rows of files without a date column have no month; their reads are all cached under None
+            self._invalidate_dates([old_row[3] if self.has_date else None, date])
+    def _check_not_archived(self, exp_id: int) -> None:
+        """Raise if a write that changed no row was meant for an archived expense, which only reads can reach."""
+        if self._archives_for(None, None, None) and self.read_expense(exp_id) is not None:
+            raise sqlite3.OperationalError(f"Expense {exp_id} is archived (see archive_years) and can no longer be changed")
+    def update_expenses_bulk(self, patches: Iterable[Tuple[int, Dict[str, object]]]) -> int:
+        """Apply many (exp_id, {column: value}) patches in a single transaction and return the number of rows changed.
+
+        Patches of archived expenses (see archive_years) change nothing and are not counted.
+        """
+        updated = 0
+        dates = set()
+        patches = iter(patches)
+        try:
+            while True:
+                batch = [self._update_columns(patch) + (exp_id,) for exp_id, patch in islice(patches, self.UPDATE_BATCH_ROWS)]
+                if not batch:
+                    break
+                if self.cache is not None and self.has_date:
+                    # The months the rows leave, read before they move; one query per batch instead of one per row
+                    placeholders = ", ".join("?" * len(batch))
+                    self.cursor.execute(f"SELECT exp_id, date FROM {self._write_table} WHERE exp_id IN ({placeholders});", [exp_id for _, _, exp_id in batch])
+                    dates.update(date for _, date in self.cursor.fetchall())
+                    dates.update(values[columns.index("date")] for columns, values, _ in batch if "date" in columns)
+                # Consecutive patches touching the same columns share one statement and one executemany call
+                for columns, group in groupby(batch, key=lambda item: item[0]):
+                    if not columns:
+                        continue
+                    self.cursor.executemany(self._update_sql(self._write_table, columns), (values + [exp_id] for _, values, exp_id in group))
+                    updated += self.cursor.rowcount
+            self._commit()
+        except Exception:
+            self._rollback()
+            raise
+        # Rows of files without a date column have no month; their reads are all cached under None
+        self._invalidate_dates(dates if self.has_date else [None])
+        return updated
+    def _update_columns(self, patch: Dict[str, object]) -> Tuple[Tuple[str, ...], list]:
+        """Split a patch into the whitelisted columns to set (in a fixed order) and their stored values; None means unchanged."""
+        unknown = set(patch) - set(self.UPDATABLE_COLUMNS)
+        if unknown:
+            raise ValueError(f"Cannot update column(s) {sorted(unknown)}; allowed: {list(self.UPDATABLE_COLUMNS)}")
+        columns = tuple(column for column in self.UPDATABLE_COLUMNS if patch.get(column) is not None)
+        converters = {"expense": self._name_value, "price": self._to_cents}
+        return columns, [converters.get(column, lambda value: value)(patch[column]) for column in columns]
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _update_sql(table: str, columns: Tuple[str, ...]) -> str:
+        """UPDATE statement for a set of columns; at most seven distinct strings per table, so each stays prepared in sqlite3's statement cache."""
+        stored = {"price": "price_cents", "expense": "category_id" if table == "expense_items" else "expense"}
+        assignments = ", ".join(f"{stored.get(column, column)} = ?" for column in columns)
+        return f"UPDATE {table} SET {assignments} WHERE exp_id = ?;"
+
+    def _build_filters(self, expense: Union[str, None] = None, price: Union[Decimal, float, None] = None, year: Union[int, None] = None, month: Union[int, None] = None, date_from: Union[str, None] = None, date_to: Union[str, None] = None, full_text: bool = False, group_by: Union[str, None] = None, record: bool = True, archived: bool = False) -> Tuple[List[str], list]:
+        """Translate the search arguments into SQL conditions and their bound values; record counts their shape for advise_indexes.
+
+        archived=True builds them for the flat table of an archive file, which has no full-text index (see archive_years).
+        """
         filters = []
         values = []
+        shape = []
+        # On normalized databases the pattern is matched against the few category names, whose
+        # rows are then found through idx_category_price, instead of joining every row to its name
+        name_like = "category_id IN (SELECT category_id FROM categories WHERE name LIKE ?)" if self.normalized and not archived else "expense LIKE ?"
 
         # Add filters based on provided parameters
-        if expense is not None:
-            filters.append("expense LIKE ?")
+        if expense is not None and full_text and self.fts_enabled and not archived:
+            filters.append("exp_id IN (SELECT rowid FROM expenses_fts WHERE expenses_fts MATCH ?)")
+            values.append(self._fts_query(expense))
+            shape.append("full_text")
+        elif expense is not None and full_text:
+            # Without FTS5 every term still has to appear somewhere in the description
+            for term in expense.split():
+                filters.append(name_like)
+                values.append(f"%{term}%")
+            shape.append("expense")
+        elif expense is not None:
+            filters.append(name_like)
             values.append(f"%{expense}%")  # Using LIKE for partial matches
+            shape.append("expense")
         if price is not None:
-            filters.append("price = ?")
-            values.append(price)
+            filters.append("price_cents = ?")
+            values.append(self._to_cents(price))
+            shape.append("price")
         if year is not None:
-            filters.append("strftime('%Y', date) = ?")
-            values.append(str(year))  # Year as string for comparison
-        if month is not None:
+            # Half-open date range so idx_date_price can be used instead of scanning every row
+            start, end = self._period_bounds(int(year), None if month is None else int(month))
+            filters.append("date >= ? AND date < ?")
+            values.extend([start, end])
+            shape.append("date")
+        elif month is not None:
+            # A month without a year spans every year, which no single range can express
             filters.append("strftime('%m', date) = ?")
-            values.append(f"{month:02d}")  # Format month as two digits (e.g., '01', '02')
+            values.append(f"{int(month):02d}")  # Format month as two digits (e.g., '01', '02')
+            shape.append("month")
+        if date_from is not None:
+            filters.append("date >= ?")
+            values.append(date_from)
+        if date_to is not None:
+            filters.append("date < ?")
+            values.append(date_to)
+        if (date_from is not None or date_to is not None) and year is None:
+            shape.append("date")
+        if group_by is not None:
+            shape.append(f"group:{group_by}")
+        if record:
+            with self._shapes_lock:
+                self.query_shapes[tuple(shape)] += 1
+        return filters, values
+    @staticmethod
+    def _period_bounds(year: int, month: Union[int, None] = None) -> Tuple[str, str]:
+        """Return the [start, end) ISO dates covering a year, or a single month of it."""
+        if month is None:
+            return f"{year:04d}-01-01", f"{year + 1:04d}-01-01"
+        if not 1 <= month <= 12:
+            raise ValueError(f"month must be between 1 and 12, got {month}")
+        if month == 12:
+            return f"{year:04d}-12-01", f"{year + 1:04d}-01-01"
+        return f"{year:04d}-{month:02d}-01", f"{year:04d}-{month + 1:02d}-01"
+    def _filtered_source(self, expense: Union[str, None] = None, price: Union[Decimal, float, None] = None, year: Union[int, None] = None, month: Union[int, None] = None, date_from: Union[str, None] = None, date_to: Union[str, None] = None, full_text: bool = False, group_by: Union[str, None] = None, record: bool = True) -> Tuple[str, List[str], list]:
+        """Return the FROM source, conditions and bound values of a filtered read.
+
+        The source is the live expenses table, unless the dates reach archived years: then it is a
+        UNION ALL of the live rows and those archives, each already filtered, so the conditions are empty.
+        """
+        filters, values = self._build_filters(expense, price, year, month, date_from, date_to, full_text, group_by, record)
+        archives = self._open_archives(year, date_from, date_to)
+        if not archives:
+            return "expenses", filters, values
+        branches = []
+        branch_values = []
+        for schema in ["main"] + [f"archive_{archive['archive_id']}" for archive in archives]:
+            if schema != "main":
+                filters, values = self._build_filters(expense, price, year, month, date_from, date_to, full_text, record=False, archived=True)
+            branch = f"SELECT exp_id, expense, price_cents, date FROM {schema}.expenses"
+            if filters:
+                branch += " WHERE " + " AND ".join(filters)
+            branches.append(branch)
+            branch_values.extend(values)
+        return "(" + " UNION ALL ".join(branches) + ") AS expenses", [], branch_values
+    def _archives_for(self, year: Union[int, None], date_from: Union[str, None], date_to: Union[str, None]) -> List[Dict[str, object]]:
+        """The archives holding rows of the year and [date_from, date_to) range; every archive when the dates are open-ended."""
+        # archive_years replaces a trigger, so a changed schema_version is how other clients learn of new
+        # archives; it is read from the file header on every call, so no read misses rows archived just before
+        schema = self.cursor.execute("PRAGMA schema_version;").fetchone()[0]
+        if schema != self._archives_schema:
+            self._archives = self._load_archives()
+            self._archives_schema = schema
+        if not self._archives:
+            return []
+        low, high = self._period_bounds(int(year)) if year is not None else (None, None)
+        if date_from is not None and (low is None or date_from > low):
+            low = date_from
+        if date_to is not None and (high is None or date_to < high):
+            high = date_to
+        return [
+            archive for archive in self._archives
+            if (high is None or archive["first_date"] < high) and (low is None or archive["last_date"] >= low)
+        ]
+    def _load_archives(self) -> List[Dict[str, object]]:
+        if self.cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'archives';").fetchone() is None:
+            return []
+        self.cursor.execute("SELECT archive_id, first_date, last_date, path, row_count, compressed FROM archives ORDER BY archive_id;")
+        columns = [column[0] for column in self.cursor.description]
+        return [dict(zip(columns, row)) for row in self.cursor.fetchall()]
+    def _open_archives(self, year: Union[int, None], date_from: Union[str, None], date_to: Union[str, None]) -> List[Dict[str, object]]:
+        """Attach the archives _archives_for returns, and return them."""
+        archives = self._archives_for(year, date_from, date_to)
+        try:
+            self._attach_archives(archives)
+        except FileNotFoundError:
+            # Another client may have merged the archive into a newer one (see archive_years); look again
+            archives = self._archives_for(year, date_from, date_to)
+            self._attach_archives(archives)
+        return archives
+    def _attach_archives(self, archives: List[Dict[str, object]]) -> None:
+        """ATTACH the archives a query reads to this connection, decompressing them on first use."""
+        attached = {row[1] for row in self.connection.execute("PRAGMA database_list;")} - {"main", "temp"}
+        needed = {f"archive_{archive['archive_id']}" for archive in archives}
+        missing = [archive for archive in archives if f"archive_{archive['archive_id']}" not in attached]
+        if not missing:
+            return
+        if len(needed) > self.MAX_ATTACHED_ARCHIVES:
+            raise sqlite3.OperationalError(f"A query can read at most {self.MAX_ATTACHED_ARCHIVES} archives; narrow its dates")
+        if self.connection.in_transaction:
+            raise sqlite3.OperationalError("Archived years cannot be opened inside a transaction; read them before the transaction() block")
+        # Archives attached for earlier queries make room for these
+        for name in sorted(attached - needed)[:max(0, len(attached) + len(missing) - self.MAX_ATTACHED_ARCHIVES)]:
+            self.connection.execute(f"DETACH DATABASE {name};")
+        for archive in missing:
+            # Nothing writes to an archive, so it is read without any locking
+            uri = Path(self._archive_file(archive)).absolute().as_uri() + "?mode=ro&immutable=1"
+            self.connection.execute(f"ATTACH DATABASE ? AS archive_{archive['archive_id']};", (uri,))
+    def _archive_file(self, archive: Dict[str, object]) -> str:
+        """Path of an archive as an SQLite file: the archive itself, or a decompressed temporary copy of it."""
+        # Registered relative to the database, so the two can be moved together
+        path = os.path.join(os.path.dirname(os.path.abspath(self.db_name)), archive["path"])
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Archive {path!r} of the rows from {archive['first_date']} to {archive['last_date']} is missing")
+        if not archive["compressed"]:
+            return path
+        with self._archive_lock:
+            copy = self._archive_copies.get(archive["archive_id"])
+            if copy is None:
+                if self._archive_dir is None:
+                    self._archive_dir = tempfile.mkdtemp(prefix="expenses-archives-")
+                copy = os.path.join(self._archive_dir, f"archive_{archive['archive_id']}.db")
+                with gzip.open(path, "rb") as source, open(copy, "wb") as target:
+                    shutil.copyfileobj(source, target, 2**20)
+                self._archive_copies[archive["archive_id"]] = copy
+        return copy
+    def archive_years(self, before_year: int, path: Optional[str] = None, compress: bool = True) -> Dict[str, object]:
+        """Move every row dated before before_year out of the live table into a read-only archive file.
+
+        The rows keep their exp_ids and stay visible: searches, summaries and exports whose dates reach
+        the archived years also read the archive, attached on first use, and the monthly rollup keeps
+        counting them. Archived rows can no longer be updated or deleted, and full-text filters match
+        them like the LIKE fallback. compress=True gzips the archive, which each client then decompresses
+        to a temporary copy once. path defaults to '<database>-archive-<first year>-<last year>.db[.gz]'
+        next to the database; run vacuum() afterwards to shrink the database file. A query over every
+        year has to attach every archive, so once there are MAX_ATTACHED_ARCHIVES the newest one is
+        merged into the new archive and its file removed. Returns the archive's id, path, number of rows
+        moved, first and last date, size in bytes and number of archives merged into it; archive_id is
+        None when no row is old enough.
+        """
+        if self.read_only:
+            raise ValueError("A read-only client cannot archive rows")
+        if not self.rollup_enabled:
+            raise ValueError("Only databases with a date column can be archived by year")
+        if self._transaction_state().depth or self.connection.in_transaction:
+            raise sqlite3.OperationalError("Cannot archive inside a transaction() block")
+        cutoff = self._period_bounds(int(before_year))[0]
+        first, last, count = self.cursor.execute("SELECT MIN(date), MAX(date), COUNT(*) FROM expenses WHERE date < ?;", (cutoff,)).fetchone()
+        if not count:
+            return {"archive_id": None, "path": None, "rows": 0, "first_date": None, "last_date": None, "bytes": 0, "merged": 0}
+        archives = self._archives_for(None, None, None)
+        merged = sorted(archives, key=lambda archive: (archive["last_date"], archive["archive_id"]))[self.MAX_ATTACHED_ARCHIVES - 1:]
+        first = min([first] + [archive["first_date"] for archive in merged])
+        last = max([last] + [archive["last_date"] for archive in merged])
+        rows = count + sum(archive["row_count"] for archive in merged)
+        path = self._archive_path(first, last, path, compress)
+        relative = os.path.relpath(os.path.abspath(path), os.path.dirname(os.path.abspath(self.db_name)))
+        raw = path + ".partial"
+        packed = raw + ".gz"
+        for leftover in (raw, packed):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        # archive_new needs a free slot; the merged archives are attached again below
+        for name in {row[1] for row in self.connection.execute("PRAGMA database_list;")} - {"main", "temp"}:
+            self.connection.execute(f"DETACH DATABASE {name};")
+        self._attach_archives(merged)
+        archive_id = None
+        try:
+            version = self._export_archive(raw, cutoff, merged)
+            # The archive is complete on disk before any row leaves the live table
+            check = self._write_archive(raw, path, compress)
+            self.cursor.execute("ATTACH DATABASE ? AS archive_new;", (check,))
+            try:
+                with self.transaction():
+                    self._check_archive(cutoff, count, version)
+                    archive_id = self._register_archive(first, last, relative, rows, compress, merged)
+                    self._purge_archived_rows(cutoff)
+            finally:
+                self.cursor.execute("DETACH DATABASE archive_new;")
+        finally:
+            # An archive that was not registered holds no row the live table lost
+            for leftover in (raw, packed) if archive_id is not None else (raw, packed, path):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        self._remove_merged_archives(merged)
+        if self.cache is not None:
+            # Same rows, but searches without an ORDER BY now list the archived ones last
+            self.cache.invalidate()
+        return {"archive_id": archive_id, "path": path, "rows": count, "first_date": first, "last_date": last, "bytes": os.path.getsize(path), "merged": len(merged)}
+    def _archive_path(self, first: str, last: str, path: Optional[str], compress: bool) -> str:
+        """The archive file of archive_years: path, which must not exist yet, or a free default name next to the database."""
+        if path is not None:
+            if os.path.exists(path):
+                raise FileExistsError(f"Archive {path!r} already exists")
+            return path
+        stem = f"{os.path.splitext(os.path.abspath(self.db_name))[0]}-archive-{first[:4]}-{last[:4]}"
+        suffix = ".db.gz" if compress else ".db"
+        path = stem + suffix
+        # Rows of archived years written later get an archive of their own
+        number = 1
+        while os.path.exists(path):
+            number += 1
+            path = f"{stem}-{number}{suffix}"
+        return path
+    def _export_archive(self, raw: str, cutoff: str, merged: List[Dict[str, object]]) -> int:
+        """Write the live rows dated before cutoff, and those of the attached merged archives, to a new archive file raw.
+
+        Returns the live database's data_version as of the copy, for _check_archive.
+        """
+        self.cursor.execute("ATTACH DATABASE ? AS archive_new;", (raw,))
+        try:
+            with self.transaction():
+                self.cursor.execute('''
+                    CREATE TABLE archive_new.expenses (
+                        exp_id INTEGER PRIMARY KEY,
+                        expense TEXT NOT NULL,
+                        price_cents INTEGER NOT NULL,
+                        date DATE NOT NULL
+                    );
+                ''')
+                sources = [f"SELECT exp_id, expense, price_cents, date FROM archive_{archive['archive_id']}.expenses" for archive in merged]
+                sources.append("SELECT exp_id, expense, price_cents, date FROM main.expenses WHERE date < ?")
+                self.cursor.execute(f"INSERT INTO archive_new.expenses {' UNION ALL '.join(sources)} ORDER BY exp_id;", (cutoff,))
+                self.cursor.execute("CREATE INDEX archive_new.idx_date_price ON expenses(date, price_cents);")
+                # Changes when another connection commits to the live table
+                return self.cursor.execute("PRAGMA main.data_version;").fetchone()[0]
+        finally:
+            self.cursor.execute("DETACH DATABASE archive_new;")
+    @staticmethod
+    def _write_archive(raw: str, path: str, compress: bool) -> str:
+        """Move the exported archive raw to path, gzipped with compress=True; returns the uncompressed file to check it against."""
+        if not compress:
+            os.replace(raw, path)
+            return path
+        packed = raw + ".gz"
+        with open(packed, "wb") as target:
+            with open(raw, "rb") as source, gzip.GzipFile(fileobj=target, mode="wb", compresslevel=6, mtime=0) as writer:
+                shutil.copyfileobj(source, writer, 2**20)
+            os.fsync(target.fileno())
+        os.replace(packed, path)
+        return raw
+    def _check_archive(self, cutoff: str, count: int, version: int) -> None:
+        """Raise if the live rows dated before cutoff are no longer the ones copied to the attached archive_new."""
+        # Rows written by other connections since the copy would be lost; the caller tries again
+        live = self.cursor.execute("SELECT COUNT(*) FROM main.expenses WHERE date < ?;", (cutoff,)).fetchone()[0]
+        changed = 0
+        if self.cursor.execute("PRAGMA main.data_version;").fetchone()[0] != version:
+            changed = self.cursor.execute(
+                "SELECT COUNT(*) FROM (SELECT exp_id, expense, price_cents, date FROM main.expenses WHERE date < ? "
+                "EXCEPT SELECT exp_id, expense, price_cents, date FROM archive_new.expenses);",
+                (cutoff,)
+            ).fetchone()[0]
+        if live != count or changed:
+            raise sqlite3.OperationalError(f"Rows dated before {cutoff} changed while they were archived; run archive_years again")
+    def _register_archive(self, first: str, last: str, relative: str, rows: int, compress: bool, merged: List[Dict[str, object]]) -> int:
+        """Add an archive to the archives table in place of the merged ones and return its archive_id."""
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS archives (
+                archive_id INTEGER PRIMARY KEY,
+                first_date DATE NOT NULL,
+                last_date DATE NOT NULL,
+                path TEXT NOT NULL UNIQUE,
+                row_count INTEGER NOT NULL,
+                compressed INTEGER NOT NULL
+            );
+        ''')
+        self.cursor.execute(
+            "INSERT INTO archives (first_date, last_date, path, row_count, compressed) VALUES (?, ?, ?, ?, ?);",
+            (first, last, relative, rows, int(compress))
+        )
+        archive_id = self.cursor.lastrowid
+        # Deleted after the insert, so the new archive gets an id above every earlier one and other
+        # clients cannot mistake it for a merged archive they still have attached
+        for archive in merged:
+            self.cursor.execute("DELETE FROM archives WHERE archive_id = ?;", (archive["archive_id"],))
+        return archive_id
+    def _purge_archived_rows(self, cutoff: str) -> None:
+        """Delete the live rows dated before cutoff, leaving them counted in the monthly rollup."""
+        # Without the delete trigger, so the rollup keeps counting the archived rows
+        self.cursor.execute("DROP TRIGGER IF EXISTS monthly_totals_ad;")
+        self.cursor.execute(f"DELETE FROM {self._write_table} WHERE date < ?;", (cutoff,))
+        self.cursor.execute(self._rollup_triggers(self.normalized)[1])
+    def _remove_merged_archives(self, merged: List[Dict[str, object]]) -> None:
+        """Detach the archives merged into a new one and delete their files and decompressed copies."""
+        for archive in merged:
+            self.connection.execute(f"DETACH DATABASE archive_{archive['archive_id']};")
+            with self._archive_lock:
+                copy = self._archive_copies.pop(archive["archive_id"], None)
+            for leftover in (copy, os.path.join(os.path.dirname(os.path.abspath(self.db_name)), archive["path"])):
+                if leftover is not None and os.path.exists(leftover):
+                    os.remove(leftover)
+    def _drop_archive_copies(self) -> None:
+        if self._archive_dir is not None:
+            shutil.rmtree(self._archive_dir, ignore_errors=True)
+            self._archive_dir = None
+            self._archive_copies.clear()
+    def search_expenses(self, expense: Union[str, None] = None, price: Union[Decimal, float, None] = None, year: Union[int, None] = None, month: Union[int, None] = None, limit: int = 10, offset: int = 0, date_from: Union[str, None] = None, date_to: Union[str, None] = None, full_text: bool = False) -> List[Tuple[int, str, Decimal, str]]:
+        """Search expenses by filtering on expense, price, year, month or a [date_from, date_to) range with pagination.
+
+        With full_text=True the expense terms are matched as word prefixes through the FTS5 index.
+        """
+        # Base query; the live table, or its union with the archives the dates reach
+        source, filters, values = self._filtered_source(expense, price, year, month, date_from, date_to, full_text)
+        query = f"SELECT {self._row_columns} FROM {source}"
 
         # If no filters are provided, use a base query with pagination
-        if not filters:
-            query = "SELECT * FROM expenses"
-        else:
+        if filters:
             # Join filters with AND
-            query += " AND ".join(filters)
+            query += " WHERE " + " AND ".join(filters)
 
         # Add pagination
         query += " LIMIT ? OFFSET ?"
         values.extend([limit, offset])
 
-        # Execute the query
-        self.cursor.execute(query, values)
+        # Execute the query (or answer it from the cache)
+        key = ("search", expense, price, self._int_or_none(year), self._int_or_none(month), date_from, date_to, full_text, limit, offset)
+        return self._fetch_cached(key, self._cache_buckets(year, month, date_from, date_to), query, values)
+    def summarize_expenses(self, group_by: Union[str, None] = None, expense: Union[str, None] = None, price: Union[Decimal, float, None] = None, year: Union[int, None] = None, month: Union[int, None] = None, date_from: Union[str, None] = None, date_to: Union[str, None] = None, full_text: bool = False) -> List[Tuple[Union[str, None], Decimal, int, Decimal]]:
+        """Compute (group, total, count, average) in SQL over the rows matching the search_expenses filters.
+
+        group_by is None for a single overall row, or one of 'day', 'month', 'year' or 'expense'.
+        Summaries filtered by nothing but year and month are read from the monthly rollup tables,
+        so they cost the same however many rows the months hold.
+        """
+        if group_by is not None and group_by not in self.GROUPINGS:
+            raise ValueError(f"group_by must be one of {sorted(self.GROUPINGS)}, got {group_by!r}")
+        if self.rollup_enabled and group_by in self.ROLLUP_GROUPINGS and (expense, price, date_from, date_to) == (None,) * 4:
+            query, values = self._rollup_summary_query(group_by, year, month)
+        else:
+            source, filters, values = self._filtered_source(expense, price, year, month, date_from, date_to, full_text, group_by)
+            key = "NULL" if group_by is None else self.GROUPINGS[group_by]
+            # Integer sums are exact; the row factory turns them (and the average) into Decimal amounts
+            query = f'SELECT {key}, COALESCE(SUM(price_cents), 0) AS "total [cents]", COUNT(*), COALESCE(AVG(price_cents), 0) AS "average [cents]" FROM {source}'
+            if filters:
+                query += " WHERE " + " AND ".join(filters)
+            if group_by == "expense" and self.normalized and source == "expenses":
+                # Grouping on the integer id walks idx_category_price instead of sorting every name
+                query += " GROUP BY category_id ORDER BY 1"
+            elif group_by is not None:
+                query += " GROUP BY 1 ORDER BY 1"
+        key = ("summary", group_by, expense, price, self._int_or_none(year), self._int_or_none(month), date_from, date_to, full_text)
+        return self._fetch_cached(key, self._cache_buckets(year, month, date_from, date_to), query, values)
+    def _rollup_summary_query(self, group_by: Union[str, None], year: Union[int, None], month: Union[int, None]) -> Tuple[str, list]:
+        """summarize_expenses over monthly_totals, or monthly_category_totals when grouping by expense."""
+        filters = []
+        values = []
+        if year is not None:
+            filters.append("year = ?")
+            values.append(int(year))
+            if month is not None:
+                # Same error as the date-range filter for an impossible month
+                self._period_bounds(int(year), int(month))
+        if month is not None:
+            filters.append("month = ?")
+            values.append(int(month))
+        table = "monthly_category_totals" if group_by == "expense" else "monthly_totals"
+        # The average is computed like AVG(price_cents) would, so both paths return the same Decimal
+        query = (
+            f'SELECT {self.ROLLUP_GROUPINGS[group_by]}, COALESCE(SUM(total_cents), 0) AS "total [cents]", COALESCE(SUM(row_count), 0), '
+            f'COALESCE(CAST(SUM(total_cents) AS REAL) / SUM(row_count), 0) AS "average [cents]" FROM {table}'
+        )
+        if filters:
+            query += " WHERE " + " AND ".join(filters)
+        if group_by is not None:
+            query += " GROUP BY 1 ORDER BY 1"
+        return query, values
+    def _fetch_cached(self, key: tuple, buckets: Optional[FrozenSet[str]], query: str, values: list) -> list:
+        """Run a read query, going through the QueryCache when the client has one."""
+        if self._next_optimize is not None:
+            self._maybe_optimize()
+        if self.cache is None:
+            self.cursor.execute(query, values)
+            return self.cursor.fetchall()
+        rows = self.cache.get(key)
+        if rows is None:
+            version = self.cache.version
+            self.cursor.execute(query, values)
+            rows = self.cursor.fetchall()
+            self.cache.put(key, rows, buckets, version)
+        # A copy, so callers that modify the list cannot corrupt the cached result
+        return list(rows)
+    @staticmethod
+    def _to_cents(price: Union[Decimal, float, str]) -> int:
+        """Convert an amount to integer cents, refusing anything that is not a whole number of cents."""
+        if isinstance(price, float):
+            # repr() is the shortest string that round-trips, so 0.1 becomes Decimal('0.1') and not its binary expansion
+            price = repr(price)
+        try:
+            cents = Decimal(price) * 100
+        except (InvalidOperation, TypeError):
+            raise ValueError(f"Invalid price: {price!r}") from None
+        if not cents.is_finite() or cents != cents.to_integral_value():
+            raise ValueError(f"Price must be a whole number of cents, got {price!r}")
+        return int(cents)
+    @staticmethod
+    def _int_or_none(value) -> Optional[int]:
+        return None if value is None else int(value)
+    @staticmethod
+    def _cache_buckets(year, month, date_from: Optional[str], date_to: Optional[str]) -> Optional[FrozenSet[str]]:
+        """Month buckets a filtered result depends on; None when it can depend on any row."""
+        if year is not None:
+            months = range(1, 13) if month is None else [int(month)]
+            return frozenset(f"{int(year):04d}-{m:02d}" for m in months)
+        if month is not None:
+            return frozenset({f"*-{int(month):02d}"})
+        if date_from is None or date_to is None:
+            return None
+        try:
+            year_from, month_from = int(date_from[:4]), int(date_from[5:7])
+            year_to, month_to = int(date_to[:4]), int(date_to[5:7])
+        except ValueError:
+            return None
+        span = (year_to - year_from) * 12 + month_to - month_from
+        if span > 240:
+            # Long ranges are cheaper to treat as "any row" than to track month by month
+            return None
+        buckets = set()
+        for step in range(span + 1):
+            y, m = divmod(month_from - 1 + step, 12)
+            buckets.add(f"{year_from + y:04d}-{m + 1:02d}")
+        return frozenset(buckets)
+    def _invalidate_dates(self, dates: Iterable[Optional[str]]) -> None:
+        """Tell the cache which months a write touched."""
+        if self.cache is not None:
+            # Without a date column no cached read can be told apart by month
+            months = {date[:7] for date in dates if date} if self.has_date else None
+            self.cache.invalidate(months)
+            state = self._transaction_state()
+            if state.depth > 0 and state.months is not None:
+                # Invalidated again once the transaction ends
+                if months is None:
+                    state.months = None
+                else:
+                    state.months.update(months)
+    def total_expenses(self, **filters) -> Decimal:
+        """Sum of the prices of every expense matching the search_expenses filters."""
+        return self.summarize_expenses(**filters)[0][1]
+    def search_expenses_ranked(self, text: str, limit: int = 10, offset: int = 0) -> List[Tuple[int, str, Decimal, str]]:
+        """Full-text search on expense descriptions, best matches first (bm25); every term is a word prefix.
+
+        Archived rows (see archive_years) have no full-text index: their matches follow the live ones, in exp_id order.
+        """
+        if not self.fts_enabled:
+            # Fallback without FTS5: same rows, but no relevance ordering
+            return self.search_expenses(expense=text, limit=limit, offset=offset, full_text=True)
+        live = "FROM expenses JOIN (SELECT rowid, rank FROM expenses_fts WHERE expenses_fts MATCH ?) AS m ON exp_id = m.rowid"
+        values = [self._fts_query(text)]
+        archives = self._open_archives(None, None, None)
+        if not archives:
+            self.cursor.execute(f"SELECT {self._row_columns} {live} ORDER BY m.rank LIMIT ? OFFSET ?;", values + [limit, offset])
+            return self.cursor.fetchall()
+        branches = [f"SELECT exp_id, expense, price_cents, date, m.rank AS rank {live}"]
+        for archive in archives:
+            filters, archive_values = self._build_filters(expense=text, full_text=True, record=False, archived=True)
+            branches.append(f"SELECT exp_id, expense, price_cents, date, NULL FROM archive_{archive['archive_id']}.expenses WHERE " + " AND ".join(filters))
+            values.extend(archive_values)
+        self.cursor.execute(
+            f"SELECT {self._row_columns} FROM ({' UNION ALL '.join(branches)}) ORDER BY rank IS NULL, rank, exp_id LIMIT ? OFFSET ?;",
+            values + [limit, offset]
+        )
         return self.cursor.fetchall()
+    @staticmethod
+    def _fts_query(text: str) -> str:
+        """Turn free text into an FTS5 query: each word quoted (so punctuation is literal) and prefix-matched."""
+        terms = ['"' + term.replace('"', '""') + '"*' for term in text.split()]
+        if not terms:
+            raise ValueError("Full-text search needs at least one term")
+        return " ".join(terms)
+    def search_expenses_page(self, expense: Union[str, None] = None, price: Union[Decimal, float, None] = None, year: Union[int, None] = None, month: Union[int, None] = None, limit: int = 10, cursor: Optional[str] = None, date_from: Union[str, None] = None, date_to: Union[str, None] = None, full_text: bool = False) -> Tuple[List[Tuple[int, str, Decimal, str]], Optional[str]]:
+        """Keyset-paginated search; returns (rows, next_cursor) where next_cursor is None on the last page.
+
+        Searches filtered by year or date range are ordered by (date, exp_id), which idx_date_price can seek on;
+        the others by exp_id.
+        """
+        source, filters, values = self._filtered_source(expense, price, year, month, date_from, date_to, full_text)
+        by_date = year is not None or date_from is not None or date_to is not None
+        return self._seek_page(filters, values, limit, cursor, source, by_date)
+    def read_expenses_page(self, limit: int, cursor: Optional[str] = None) -> Tuple[List[Tuple[int, str, Decimal, str]], Optional[str]]:
+        """Keyset-paginated read of all expenses; pass the returned cursor back in to get the next page."""
+        return self._seek_page([], [], limit, cursor, self._filtered_source(record=False)[0])
+    def _seek_page(self, filters: List[str], values: list, limit: int, cursor: Optional[str], source: str = "expenses", by_date: bool = False) -> Tuple[List[Tuple[int, str, Decimal, str]], Optional[str]]:
+        """Fetch the page after the cursor position by seeking on the sort key instead of using OFFSET.
+
+        The key is the exp_id primary key, or (date, exp_id) with by_date. Ordering a date range by
+        exp_id would sort every row of the range for each page, so the cost would grow with the table.
+        """
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+        filters = list(filters)
+        values = list(values)
+        if cursor is not None:
+            date, exp_id = self._decode_cursor(cursor)
+            if (date is not None) != by_date:
+                raise ValueError(f"Pagination cursor {cursor!r} belongs to a search with other date filters")
+            if by_date:
+                # First, so SQLite starts the index range at the cursor instead of at the filter's first date.
+                # A UNION ALL source has no filters, only the values of its own conditions, which come first
+                at = 0 if filters else len(values)
+                filters[:0] = ["date >= ?", "(date, exp_id) > (?, ?)"]
+                values[at:at] = [date, date, exp_id]
+            else:
+                filters.append("exp_id > ?")
+                values.append(exp_id)
+        query = f"SELECT {self._row_columns} FROM {source}"
+        if filters:
+            query += " WHERE " + " AND ".join(filters)
+        # Fetch one extra row to find out whether another page exists
+        query += " ORDER BY date, exp_id LIMIT ?" if by_date else " ORDER BY exp_id LIMIT ?"
+        values.append(limit + 1)
+        self.cursor.execute(query, values)
+        rows = self.cursor.fetchall()
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, self._encode_cursor(rows[-1][0], rows[-1][3] if by_date else None)
+    @staticmethod
+    def _encode_cursor(exp_id: int, date: Optional[str] = None) -> str:
+        """Wrap the last seen exp_id, and its date for pages ordered by date, in an opaque continuation token."""
+        token = f"v1:{exp_id}" if date is None else f"v2:{date}:{exp_id}"
+        return base64.urlsafe_b64encode(token.encode()).decode()
+    @staticmethod
+    def _decode_cursor(cursor: str) -> Tuple[Optional[str], int]:
+        """Recover the (date, exp_id) position from a token produced by _encode_cursor; date is None for v1 tokens."""
+        try:
+            version, _, position = base64.urlsafe_b64decode(cursor.encode()).decode().partition(":")
+            if version == "v1":
+                return None, int(position)
+            if version == "v2":
+                date, exp_id = position.split(":")
+                if not date:
+                    raise ValueError(date)
+                return date, int(exp_id)
+            raise ValueError(version)
+        except (ValueError, UnicodeDecodeError, binascii.Error):
+            raise ValueError(f"Invalid pagination cursor: {cursor!r}") from None
     def delete_expense(self, exp_id: int) -> None:
-        """Delete an expense from the database by ID."""
-        self.cursor.execute("DELETE FROM expenses WHERE exp_id = ?;", (exp_id,))
+        """Delete an expense from the database by ID; archived expenses (see archive_years) raise sqlite3.OperationalError."""
+        old_row = self.read_expense(exp_id) if self.cache is not None else None
+        try:
+            self.cursor.execute(f"DELETE FROM {self._write_table} WHERE exp_id = ?;", (exp_id,))
+            changed = self.cursor.rowcount
+            self._commit()
+        except sqlite3.Error:
+            self._rollback()
+            raise
+        if not changed:
+            self._check_not_archived(exp_id)
+        if old_row is not None:
+            self._invalidate_dates([old_row[3] if self.has_date else None])
+    def vacuum(self) -> Dict[str, int]:
+        """Merge the full-text index and rewrite the database file without free pages; returns its size before and after."""
+        if self._transaction_state().depth:
+            raise sqlite3.OperationalError("Cannot vacuum inside a transaction() block")
+        self._commit()
+        size = "SELECT page_count * page_size FROM pragma_page_count(), pragma_page_size();"
+        before = self.cursor.execute(size).fetchone()[0]
+        if self.legacy_prices:
+            # VACUUM rebuilds the indexes of main.expenses by name, which resolves to the temporary view
+            self.cursor.execute("DROP VIEW temp.expenses;")
+        try:
+            if self.fts_enabled:
+                # Folds the many small segments left by incremental inserts into one
+                self.cursor.execute("INSERT INTO expenses_fts(expenses_fts) VALUES ('optimize');")
+                self.connection.commit()
+            self.cursor.execute("VACUUM;")
+        finally:
+            for statement in self._connection_setup:
+                self.cursor.execute(statement)
+        after = self.cursor.execute(size).fetchone()[0]
+        return {"bytes_before": before, "bytes_after": after}
+    def optimize(self, analyze: bool = False) -> None:
+        """Refresh the query planner statistics, which it uses to pick between indexes.
+
+        Runs PRAGMA optimize, which re-analyzes only tables whose statistics went stale, or a full
+        ANALYZE with analyze=True or when the database was never analyzed.
+        """
+        if self._transaction_state().depth:
+            raise sqlite3.OperationalError("Cannot optimize inside a transaction() block")
+        self._commit()
+        analyzed = self.cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1';").fetchone() is not None
+        if analyze or not analyzed:
+            # Exact statistics; also the baseline PRAGMA optimize compares row counts against
+            self.cursor.execute("PRAGMA analysis_limit=0;")
+            self.cursor.execute("ANALYZE;")
+        else:
+            # Samples a bounded number of rows per index, so a scheduled run stays short on big files
+            self.cursor.execute("PRAGMA analysis_limit=1000;")
+            self.cursor.execute("PRAGMA optimize;")
         self.connection.commit()
-    def __del__(self):
-        """Close the database connection when the instance is deleted."""
+        if self.optimize_every is not None:
+            self._next_optimize = time.monotonic() + self.optimize_every
+    def _maybe_optimize(self) -> None:
+        """Run the scheduled optimize once it is due, unless a transaction is open on this connection."""
+        if time.monotonic() < self._next_optimize or self._transaction_state().depth or self.connection.in_transaction:
+            return
+        # Rescheduled first, so other threads of a pooled client do not start the same run
+        self._next_optimize = time.monotonic() + self.optimize_every
+        try:
+            self.optimize()
+        except sqlite3.OperationalError:
+            # Busy or locked by another connection: maintenance must not fail the caller's query,
+            # and the next run is due one interval later
+            pass
+    def advise_indexes(self, shapes: Optional[Dict[Tuple[str, ...], int]] = None, min_share: float = 0.01, min_reads: int = 100) -> List[Dict[str, object]]:
+        """Recommend which ADVISED_INDEXES to create, keep or drop for the filter combinations searches actually use.
+
+        shapes maps filter combinations (tuples such as ('date', 'price') or ('group:expense',)) to
+        read counts; by default the ones this client recorded in query_shapes. An index pays off when
+        the reads it serves are at least min_share of all reads. Below min_reads reads nothing is
+        dropped, since there is too little evidence. Returns one dict per index with its name,
+        action ('create', 'keep', 'drop' or 'none'), the reads it serves and the share of all reads.
+        """
+        if shapes is None:
+            with self._shapes_lock:
+                shapes = dict(self.query_shapes)
+        reads = sum(shapes.values())
+        table = self._write_table
+        existing = {row[0] for row in self.cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ?;", (table,))}
+        has_date = "date" in self._table_columns(table)
+        advice = []
+        for name, (_, served) in self.ADVISED_INDEXES.items():
+            if (name == "idx_expense" and self.normalized) or (name == "idx_month" and not has_date):
+                # Name filters of the normalized layout go through categories and idx_category_price
+                continue
+            uses = sum(count for shape, count in shapes.items() if served.intersection(shape))
+            share = uses / reads if reads else 0.0
+            pays_off = reads > 0 and share >= min_share
+            if name in existing:
+                action = "keep" if pays_off or reads < min_reads else "drop"
+            else:
+                action = "create" if pays_off else "none"
+            advice.append({"index": name, "action": action, "reads": uses, "share": share})
+        return advice
+    def apply_index_advice(self, advice: Optional[List[Dict[str, object]]] = None) -> List[str]:
+        """Create and drop the indexes advise_indexes recommends (by default, from query_shapes); returns the names changed.
+
+        Creating an index reads the whole table, which takes a while on large databases.
+        """
+        if advice is None:
+            advice = self.advise_indexes()
+        changed = []
+        with self.transaction():
+            for entry in advice:
+                if entry["action"] == "create":
+                    self.cursor.execute(self._advised_index_sql(entry["index"], self._write_table))
+                    # Statistics for the new index, so the planner actually considers it
+                    self.cursor.execute(f"ANALYZE {entry['index']};")
+                elif entry["action"] == "drop":
+                    self.cursor.execute(f"DROP INDEX IF EXISTS {entry['index']};")
+                else:
+                    continue
+                changed.append(entry["index"])
+        return changed
+    @classmethod
+    def _advised_index_sql(cls, name: str, table: str) -> str:
+        return f"CREATE INDEX IF NOT EXISTS {name} ON {table}({cls.ADVISED_INDEXES[name][0]});"
+    @classmethod
+    def create_snapshot(cls, db_name: str, path: str, pages: int = -1, pause: float = 0.0, progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, object]:
+        """Copy the database to path as a point-in-time snapshot with the SQLite backup API, for reports to read.
+
+        pages=-1 copies everything in one step under a single read transaction, which in WAL mode never
+        blocks writers. A positive pages copies that many pages per step and sleeps pause seconds in
+        between, for rollback-journal databases whose readers do block writers; a write from another
+        connection restarts that copy. progress(remaining, total) is called after every step. The copy is
+        written under a temporary name, renamed when complete and left in rollback-journal mode, so
+        open_snapshot can open it immutable; refreshing a snapshot that is open elsewhere is safe.
+        The archives of the database (see archive_years) are hard-linked, or copied, next to the snapshot
+        under the same relative paths, since the snapshot looks for them there.
+        """
+        if not os.path.exists(db_name):
+            raise FileNotFoundError(f"Database {db_name!r} does not exist")
+        partial = path + ".partial"
+        if os.path.exists(partial):
+            os.remove(partial)
+        started = time.perf_counter()
+        steps = 0
+        def step(status: int, remaining: int, total: int) -> None:
+            nonlocal steps
+            steps += 1
+            if progress is not None:
+                progress(remaining, total)
+        source = sqlite3.connect(db_name)
+        try:
+            target = sqlite3.connect(partial)
+            try:
+                source.backup(target, pages=pages, progress=step, sleep=pause)
+                # The copy inherits WAL mode from page 1; an immutable reader must not look for a -wal file
+                target.execute("PRAGMA journal_mode=DELETE;")
+                copied = target.execute("PRAGMA page_count;").fetchone()[0]
+                archives = cls._snapshot_archives(target, db_name, path)
+            finally:
+                target.close()
+            os.replace(partial, path)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        finally:
+            source.close()
+        return {"pages": copied, "bytes": os.path.getsize(path), "steps": steps, "seconds": time.perf_counter() - started, "archives": archives}
+    @staticmethod
+    def _snapshot_archives(snapshot: sqlite3.Connection, db_name: str, path: str) -> int:
+        """Put the archives registered in a snapshot next to it, where it resolves their paths; returns how many were placed."""
+        if snapshot.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'archives';").fetchone() is None:
+            return 0
+        source_dir = os.path.dirname(os.path.abspath(db_name))
+        target_dir = os.path.dirname(os.path.abspath(path))
+        placed = 0
+        for (relative,) in snapshot.execute("SELECT path FROM archives ORDER BY archive_id;").fetchall():
+            source = os.path.join(source_dir, relative)
+            target = os.path.join(target_dir, relative)
+            if not os.path.exists(source):
+                raise FileNotFoundError(f"Archive {source!r} is missing; it may have just been merged, so create the snapshot again")
+            if os.path.exists(target):
+                # The link, or a copy2 copy (same size and mtime), of an earlier refresh
+                before, after = os.stat(source), os.stat(target)
+                if os.path.samestat(before, after) or (before.st_size, before.st_mtime_ns) == (after.st_size, after.st_mtime_ns):
+                    continue
+            # A file of that name from an older snapshot may hold other rows (archive names are reused
+            # after a merge), so it is replaced; readers that have it open keep the old file
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            staged = target + ".partial"
+            if os.path.exists(staged):
+                os.remove(staged)
+            try:
+                os.link(source, staged)
+            except OSError:
+                shutil.copy2(source, staged)
+            os.replace(staged, target)
+            placed += 1
+        return placed
+    @classmethod
+    def open_snapshot(cls, path: str, **kwargs) -> "ExpensesDatabaseClient":
+        """Open a create_snapshot copy immutable: reads take no locks and go through the memory map (read-mostly profile)."""
+        return cls(path, immutable=True, **kwargs)
+    def close(self) -> None:
+        """Close the database connection, refreshing the planner statistics first when optimize_every is set."""
+        if self.optimize_every is not None and not self._transaction_state().depth:
+            self.optimize()
         self.connection.close()
+        self._drop_archive_copies()
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class ConnectionPool:
+    def __init__(
+        self,
+        db_name: str,
+        max_connections: int = 8,
+        *,
+        timeout: float = 30.0,
+        synchronous: str = "NORMAL",
+        connect: Callable[..., sqlite3.Connection] = sqlite3.connect,
+    ):
+        """Bounded pool of SQLite connections to one database file, opened lazily in WAL mode with connect."""
+        if max_connections < 1:
+            raise ValueError("max_connections must be at least 1")
+        self.db_name = db_name
+        self.max_connections = max_connections
+        self.timeout = timeout
+        # Applied every time a connection is handed out, so a changed level reaches idle connections too
+        self.synchronous = synchronous
+        # Further per-connection pragmas (e.g. from a tuning profile), applied the same way
+        self.pragmas = {}
+        # Statements run once on every new connection (e.g. the temporary view of a legacy file)
+        self.setup = []
+        self.connect = connect
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._closed = False
+    def _open(self) -> sqlite3.Connection:
+        """Open a new connection that may be handed from one thread to another."""
+        connection = self.connect(self.db_name, timeout=self.timeout, check_same_thread=False)
+        connection.row_factory = _decode_cents
+        # WAL lets readers keep going while a writer holds the write lock
+        connection.execute("PRAGMA journal_mode=WAL;")
+        for statement in self.setup:
+            connection.execute(statement)
+        return connection
+    def acquire(self) -> sqlite3.Connection:
+        """Take a connection out of the pool, waiting up to timeout seconds when all are in use."""
+        if self._closed:
+            raise sqlite3.ProgrammingError("Cannot acquire a connection from a closed pool")
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"No free connection in the pool after {self.timeout} seconds")
+        try:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                connection = self._open()
+            connection.execute(f"PRAGMA synchronous={self.synchronous};")
+            for pragma, value in self.pragmas.items():
+                connection.execute(f"PRAGMA {pragma}={value};")
+            return connection
+        except BaseException:
+            self._slots.release()
+            raise
+    def release(self, connection: sqlite3.Connection) -> None:
+        """Give a connection back, rolling back anything its last user left uncommitted."""
+        try:
+            if self._closed:
+                connection.close()
+            else:
+                connection.rollback()
+                self._idle.put(connection)
+        finally:
+            self._slots.release()
+    def close(self) -> None:
+        """Close every connection; connections still leased are closed when they are released."""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+class _Lease:
+    """A connection (and its cursor) checked out of a pool by one thread."""
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+        self.cursor = connection.cursor()
+        self.transaction = _TransactionState()
+        self.categories = {}
+
+class PooledExpensesDatabaseClient(ExpensesDatabaseClient):
+    def __init__(
+        self,
+        db_name: str = 'expenses.db',
+        *,
+        pool_size: int = 8,
+        timeout: float = 30.0,
+        cache: Optional[QueryCache] = None,
+        durability: Optional[str] = None,
+        normalize: bool = False,
+        instrumentation: Optional["QueryInstrumentation"] = None,
+        profile: Optional[str] = None,
+        optimize_every: Optional[float] = None,
+    ):
+        """Thread-safe client: each thread works on its own connection leased from a bounded pool.
+
+        durability defaults to 'normal', or to the synchronous level of profile when one is given.
+        """
+        self.db_name = db_name
+        self.cache = cache
+        self.normalize = normalize
+        self.instrumentation = instrumentation
+        # Pooled connections are switched to WAL on open, so they are never read-only
+        self.read_only = False
+        self._init_tuning(optimize_every)
+        self._init_archives()
+        self.pool = ConnectionPool(db_name, pool_size, timeout=timeout, synchronous=self._durability_pragmas("normal")[1], connect=self._connector())
+        self._local = threading.local()
+        with self.connection_scope():
+            if profile is not None:
+                self.apply_profile(profile)
+            if durability is not None:
+                self.set_durability(durability)
+            self.create_table()
+        self.pool.setup = self._connection_setup
+    def _lease(self) -> _Lease:
+        """Return the calling thread's lease, taking a connection from the pool on first use."""
+        lease = getattr(self._local, "lease", None)
+        if lease is None:
+            connection = self.pool.acquire()
+            lease = _Lease(connection)
+            # If the thread exits without releasing, its thread-local dies and the connection goes back
+            lease.finalizer = weakref.finalize(lease, self.pool.release, connection)
+            self._local.lease = lease
+        return lease
+    def _transaction_state(self) -> _TransactionState:
+        return self._lease().transaction
+    def _category_cache(self) -> Dict[str, int]:
+        # Per connection, so no thread sees a category id another thread has not committed yet
+        return self._lease().categories
+    def apply_profile(self, name: str) -> None:
+        """Set the pragmas of a TUNING_PROFILES profile on every pooled connection; the journal always stays in WAL mode."""
+        pragmas = dict(self._profile_pragmas(name))
+        del pragmas["journal_mode"]
+        self.pool.synchronous = pragmas.pop("synchronous")
+        self.pool.pragmas = pragmas
+        self.cursor.execute(f"PRAGMA synchronous={self.pool.synchronous};")
+        for pragma, value in pragmas.items():
+            self.cursor.execute(f"PRAGMA {pragma}={value};")
+        self.profile = name
+    def set_durability(self, level: str) -> None:
+        """Set the synchronous level of every pooled connection; the journal always stays in WAL mode."""
+        self.pool.synchronous = self._durability_pragmas(level)[1]
+        self.cursor.execute(f"PRAGMA synchronous={self.pool.synchronous};")
+    @property
+    def connection(self) -> sqlite3.Connection:
+        return self._lease().connection
+    @property
+    def cursor(self) -> sqlite3.Cursor:
+        return self._lease().cursor
+    def release_connection(self) -> None:
+        """Return the calling thread's connection to the pool (a new one is leased on next use)."""
+        lease = getattr(self._local, "lease", None)
+        if lease is not None:
+            self._local.lease = None
+            lease.cursor.close()
+            lease.finalizer()
+    @contextmanager
+    def connection_scope(self) -> Iterator["PooledExpensesDatabaseClient"]:
+        """Hold one connection for the duration of the block and release it afterwards."""
+        try:
+            yield self
+        finally:
+            self.release_connection()
+    def close(self) -> None:
+        """Release this thread's connection and close the pool, refreshing the planner statistics first when optimize_every is set."""
+        if self.optimize_every is not None and not self._transaction_state().depth:
+            self.optimize()
+        self.release_connection()
+        self.pool.close()
+        self._drop_archive_copies()
@@ -0,0 +1,331 @@
+"""Opt-in query instrumentation for ExpensesDatabaseClient.
+
+Pass a QueryInstrumentation to the client and every statement, commit and rollback on its
+connections is timed and handed to the instrumentation's sinks as an event dict:
+
+    stats = MemorySink()
+    instrumentation = QueryInstrumentation([stats, JsonlSink("slow.jsonl", slow_only=True)], slow_ms=50)
+    client = ExpensesDatabaseClient("expenses.db", instrumentation=instrumentation)
+    client.search_expenses(year=2024)
+    instrumentation.flush()
+    for entry in stats.stats():
+        print(entry["method"], entry["statement"], entry["count"], entry["p95_ms"])
+
+Events have the keys kind ('query', 'commit' or 'rollback'), method (the client method that ran
+the statement), statement (its SQL with whitespace collapsed), time (wall clock at the start), ms
+(executing plus fetching its rows), rows (rows fetched, or rows changed by a write), slow, and
+error (the exception name, when it failed). Slow queries also get plan, their EXPLAIN QUERY PLAN.
+
+A query's event is emitted once all of its rows were read, or when its cursor is closed, runs
+another statement or is freed; flush() emits those still open. Without instrumentation the
+client uses plain sqlite3 connections, so there is no overhead at all.
+"""
+import json
+import sqlite3
+import sys
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from collections import deque
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional
+
+# Upper bounds in ms of the latency histogram buckets; one more bucket holds everything slower
+LATENCY_BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+@lru_cache(maxsize=1024)
+def _normalize(sql: str) -> str:
+    """Statement text with runs of whitespace collapsed, used as the statement key."""
+    return " ".join(sql.split())
+
+class MemorySink:
+    def __init__(self, max_slow: int = 100):
+        """Aggregate events into latency histograms per (method, statement), and keep the last max_slow slow events."""
+        self.slow_queries = deque(maxlen=max_slow)
+        self._entries = {}
+        self._lock = threading.Lock()
+    def record(self, event: Dict[str, object]) -> None:
+        key = (event["method"], event["statement"])
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = {"count": 0, "errors": 0, "rows": 0, "total_ms": 0.0, "max_ms": 0.0, "buckets": [0] * (len(LATENCY_BUCKETS_MS) + 1)}
+            entry["count"] += 1
+            entry["errors"] += "error" in event
+            entry["rows"] += event["rows"]
+            entry["total_ms"] += event["ms"]
+            entry["max_ms"] = max(entry["max_ms"], event["ms"])
+            entry["buckets"][bisect_left(LATENCY_BUCKETS_MS, event["ms"])] += 1
+            if event["slow"]:
+                self.slow_queries.append(event)
+    def stats(self, by: str = "statement") -> List[Dict[str, object]]:
+        """One summary per (method, statement), or per method with by='method'; the most total time first."""
+        if by not in ("statement", "method"):
+            raise ValueError(f"by must be 'statement' or 'method', got {by!r}")
+        with self._lock:
+            groups = {}
+            for (method, statement), entry in self._entries.items():
+                key = (method, statement if by == "statement" else None)
+                group = groups.get(key)
+                if group is None:
+                    groups[key] = {**entry, "buckets": list(entry["buckets"])}
+                    continue
+                for name in ("count", "errors", "rows", "total_ms"):
+                    group[name] += entry[name]
+                group["max_ms"] = max(group["max_ms"], entry["max_ms"])
+                group["buckets"] = [a + b for a, b in zip(group["buckets"], entry["buckets"])]
+        summaries = []
+        for (method, statement), group in groups.items():
+            summary = {"method": method}
+            if by == "statement":
+                summary["statement"] = statement
+            summary.update(
+                count=group["count"], errors=group["errors"], rows=group["rows"],
+                total_ms=group["total_ms"], mean_ms=group["total_ms"] / group["count"], max_ms=group["max_ms"],
+                p50_ms=self._percentile(group, 0.50), p95_ms=self._percentile(group, 0.95), p99_ms=self._percentile(group, 0.99),
+                histogram=dict(zip([f"<={bound}" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}"], group["buckets"])),
+            )
+            summaries.append(summary)
+        summaries.sort(key=lambda summary: summary["total_ms"], reverse=True)
+        return summaries
+    @staticmethod
+    def _percentile(group: Dict[str, object], fraction: float) -> float:
+        """Upper bound of the histogram bucket holding the given fraction of the events (capped at the maximum)."""
+        wanted = fraction * group["count"]
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, group["buckets"]):
+            seen += count
+            if seen >= wanted:
+                return min(bound, group["max_ms"])
+        return group["max_ms"]
+    def reset(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.slow_queries.clear()
+
+class JsonlSink:
+    def __init__(self, path: str, slow_only: bool = False):
+        """Append every event (or only the slow ones) to a JSON Lines file, one line each as it happens."""
+        self.path = path
+        self.slow_only = slow_only
+        self._lock = threading.Lock()
+        # Line buffered, so the log is complete up to the last event even if the process dies
+        self._handle = open(path, "a", encoding="utf-8", buffering=1)
+    def record(self, event: Dict[str, object]) -> None:
+        if self.slow_only and not event["slow"]:
+            return
+        line = json.dumps(event, ensure_ascii=False)
+        with self._lock:
+            self._handle.write(line + "\n")
+    def close(self) -> None:
+        with self._lock:
+            self._handle.close()
+
+class CallbackSink:
+    def __init__(self, callback: Callable[[Dict[str, object]], None], slow_only: bool = False):
+        """Call callback(event) for every event (or only the slow ones); exceptions it raises reach the client call."""
+        self.callback = callback
+        self.slow_only = slow_only
+    def record(self, event: Dict[str, object]) -> None:
+        if not self.slow_only or event["slow"]:
+            self.callback(event)
+
+class QueryInstrumentation:
+    def __init__(self, sinks: Optional[List[object]] = None, slow_ms: float = 100.0, explain: bool = True):
+        """Time the statements of the clients it is passed to and send the events to sinks (default: one MemorySink).
+
+        Queries taking at least slow_ms are marked slow and, with explain=True, get their EXPLAIN QUERY PLAN.
+        Set enabled to False to stop recording without reopening the client.
+        """
+        self.sinks = list(sinks) if sinks is not None else [MemorySink()]
+        self.slow_ms = slow_ms
+        self.explain = explain
+        self.enabled = True
+        # Code object of every client method -> its name, to tell which method ran a statement
+        self._methods = {}
+        self._open = weakref.WeakSet()
+        self._lock = threading.Lock()
+    def connector(self, client_class: type) -> Callable[..., sqlite3.Connection]:
+        """A drop-in for sqlite3.connect whose connections report to this instrumentation."""
+        for cls in reversed(client_class.__mro__):
+            for name, value in vars(cls).items():
+                function = getattr(value, "__func__", value)
+                # Unwraps @contextmanager, whose generator is what actually runs
+                function = getattr(function, "__wrapped__", function)
+                code = getattr(function, "__code__", None)
+                if code is not None:
+                    self._methods[code] = name
+        def connect(database: str, **kwargs) -> sqlite3.Connection:
+            connection = sqlite3.connect(database, factory=_InstrumentedConnection, **kwargs)
+            connection.instrumentation = self
+            return connection
+        return connect
+    def caller(self) -> Optional[str]:
+        """The innermost public client method on the stack, else the innermost private one (e.g. a generator's)."""
+        private = None
+        frame = sys._getframe(2)
+        while frame is not None:
+            name = self._methods.get(frame.f_code)
+            if name is not None:
+                if not name.startswith("_"):
+                    return name
+                if private is None:
+                    private = name
+            frame = frame.f_back
+        return private
+    def emit(self, connection: sqlite3.Connection, event: Dict[str, object], parameters=None) -> None:
+        """Mark the event slow if it is, add the query plan of slow queries, and pass it to every sink."""
+        event["slow"] = slow = event["ms"] >= self.slow_ms
+        if slow and self.explain and event["kind"] == "query" and parameters is not None:
+            event["plan"] = self._query_plan(connection, event["statement"], parameters)
+        for sink in self.sinks:
+            sink.record(event)
+    @staticmethod
+    def _query_plan(connection: sqlite3.Connection, statement: str, parameters) -> Optional[List[str]]:
+        """EXPLAIN QUERY PLAN lines, indented by depth like the sqlite3 shell prints them; None if it cannot be explained."""
+        try:
+            # A plain cursor, so explaining is not itself recorded
+            rows = sqlite3.Cursor(connection).execute("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+        except sqlite3.Error:
+            return None
+        depth = {0: -1}
+        lines = []
+        for node, parent, _, detail in rows:
+            depth[node] = depth.get(parent, -1) + 1
+            lines.append("  " * depth[node] + detail)
+        return lines
+    def flush(self, connection: Optional[sqlite3.Connection] = None) -> None:
+        """Emit the events of queries whose rows were not all read yet (only those of connection, if given)."""
+        with self._lock:
+            cursors = [cursor for cursor in self._open if connection is None or cursor.connection is connection]
+        for cursor in cursors:
+            cursor._finish()
+    def _track(self, cursor: "_InstrumentedCursor", open_: bool) -> None:
+        with self._lock:
+            if open_:
+                self._open.add(cursor)
+            else:
+                self._open.discard(cursor)
+
+class _InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times each statement from execute until its last row is fetched."""
+    _event = None
+    _parameters = None
+    def execute(self, sql: str, parameters=()):
+        return self._run(super().execute, sql, parameters, parameters)
+    def executemany(self, sql: str, seq_of_parameters):
+        # Parameters are consumed while running, so there is nothing to explain the statement with
+        return self._run(super().executemany, sql, seq_of_parameters, None)
+    def _run(self, run, sql: str, parameters, explain_with):
+        if self._event is not None:
+            self._finish()
+        instrumentation = self.connection.instrumentation
+        if not instrumentation.enabled:
+            return run(sql, parameters)
+        event = {"kind": "query", "method": instrumentation.caller(), "statement": _normalize(sql), "time": time.time(), "ms": 0.0, "rows": 0}
+        start = time.perf_counter()
+        try:
+            run(sql, parameters)
+        except BaseException as exc:
+            event["ms"] = (time.perf_counter() - start) * 1000
+            event["error"] = type(exc).__name__
+            instrumentation.emit(self.connection, event)
+            raise
+        event["ms"] = (time.perf_counter() - start) * 1000
+        event["rows"] = max(self.rowcount, 0)
+        self._event, self._parameters = event, explain_with
+        if self.description is None:
+            # Nothing to fetch: a write, DDL or a pragma without a result
+            self._finish()
+        else:
+            instrumentation._track(self, True)
+        return self
+    def _finish(self) -> None:
+        event, parameters = self._event, self._parameters
+        self._event = self._parameters = None
+        if event is not None:
+            instrumentation = self.connection.instrumentation
+            instrumentation._track(self, False)
+            instrumentation.emit(self.connection, event, parameters)
+    def _fetched(self, start: float, rows: int, done: bool) -> None:
+        self._event["ms"] += (time.perf_counter() - start) * 1000
+        self._event["rows"] += rows
+        if done:
+            self._finish()
+    def fetchone(self):
+        if self._event is None:
+            return super().fetchone()
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, row is not None, row is None)
+        return row
+    def fetchmany(self, size: Optional[int] = None):
+        if self._event is None:
+            return super().fetchmany(self.arraysize if size is None else size)
+        size = self.arraysize if size is None else size
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(start, len(rows), len(rows) < size)
+        return rows
+    def fetchall(self):
+        if self._event is None:
+            return super().fetchall()
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, len(rows), True)
+        return rows
+    def __next__(self):
+        if self._event is None:
+            return super().__next__()
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(start, 0, True)
+            raise
+        self._fetched(start, 1, False)
+        return row
+    def close(self) -> None:
+        self._finish()
+        super().close()
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            # Too late to report anything: the connection may already be closed
+            pass
+
+class _InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors, execute shortcuts, commits and rollbacks are instrumented."""
+    instrumentation = None
+    def cursor(self, factory=_InstrumentedCursor):
+        return super().cursor(factory)
+    def execute(self, sql: str, parameters=()):
+        return self.cursor().execute(sql, parameters)
+    def executemany(self, sql: str, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+    def commit(self) -> None:
+        self._end("commit", super().commit)
+    def rollback(self) -> None:
+        self._end("rollback", super().rollback)
+    def _end(self, kind: str, end: Callable[[], None]) -> None:
+        instrumentation = self.instrumentation
+        # Commits and rollbacks outside a transaction are no-ops, not worth an event
+        if instrumentation is None or not instrumentation.enabled or not self.in_transaction:
+            return end()
+        event = {"kind": kind, "method": instrumentation.caller(), "statement": kind.upper(), "time": time.time(), "ms": 0.0, "rows": 0}
+        start = time.perf_counter()
+        try:
+            end()
+        except BaseException as exc:
+            event["error"] = type(exc).__name__
+            raise
+        finally:
+            # Includes the fsync of the journal or WAL, which dominates commits on most disks
+            event["ms"] = (time.perf_counter() - start) * 1000
+            instrumentation.emit(self, event)
+    def close(self) -> None:
+        if self.instrumentation is not None:
+            self.instrumentation.flush(self)
+        super().close()
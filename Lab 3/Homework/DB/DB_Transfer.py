@@ -0,0 +1,175 @@
+"""Streaming CSV and JSON Lines import/export for ExpensesDatabaseClient.
+
+Files are read and written one row at a time, so memory use does not grow with their size.
+Imports validate each chunk of batch_size rows before writing it with create_expenses_bulk,
+which commits the chunk as one transaction (or leaves the commit to an enclosing
+client.transaction() block, making the whole import all-or-nothing).
+
+Both formats carry the columns exp_id, expense, price and date. Prices are written as exact
+decimal amounts ("12.34"); imports ignore exp_id, so the rows get fresh ids.
+"""
+import csv
+import json
+import os
+import re
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from DB_Client import ExpensesDatabaseClient
+
+FIELDS = ("exp_id", "expense", "price", "date")
+FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+# Error messages kept in an import report; the count of skipped rows is always exact
+MAX_REPORTED_ERRORS = 100
+
+_ISO_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+def detect_format(path: str, format: Optional[str] = None) -> str:
+    """'csv' or 'jsonl', from the explicit format or else the file extension."""
+    if format is None:
+        format = FORMATS.get(os.path.splitext(path)[1].lower())
+        if format is None:
+            raise ValueError(f"Cannot tell the format of {path!r} from its extension; pass format='csv' or 'jsonl'")
+    if format not in ("csv", "jsonl"):
+        raise ValueError(f"format must be 'csv' or 'jsonl', got {format!r}")
+    return format
+
+def iter_records(handle, format: str) -> Iterator[Tuple[int, object]]:
+    """Yield (line number, record) for every record of an open text file; CSV records are dicts keyed by the header."""
+    if format == "csv":
+        reader = csv.DictReader(handle)
+        missing = {"expense", "price", "date"} - set(reader.fieldnames or ())
+        if missing:
+            raise ValueError(f"CSV header is missing column(s) {sorted(missing)}")
+        for record in reader:
+            # line_num is the last physical line read, which differs from the record count for quoted newlines
+            yield reader.line_num, record
+    else:
+        for number, line in enumerate(handle, 1):
+            if not line.strip():
+                continue
+            try:
+                # Decimal keeps prices such as 0.1 exact instead of rounding them through float
+                yield number, json.loads(line, parse_float=Decimal)
+            except json.JSONDecodeError as exc:
+                yield number, exc
+
+def validate_record(record: object) -> Tuple[str, Decimal, str]:
+    """Turn one parsed record into an (expense, price, date) row, raising ValueError if it is not a valid expense."""
+    if isinstance(record, json.JSONDecodeError):
+        raise ValueError(f"invalid JSON: {record.msg}")
+    if not isinstance(record, dict):
+        raise ValueError("record must be an object with expense, price and date")
+    expense, price, day = record.get("expense"), record.get("price"), record.get("date")
+    if not isinstance(expense, str) or not expense.strip():
+        raise ValueError(f"expense must be a non-empty string, got {expense!r}")
+    if isinstance(price, bool) or not isinstance(price, (str, int, Decimal)):
+        raise ValueError(f"price must be a number, got {price!r}")
+    try:
+        amount = Decimal(price.strip() if isinstance(price, str) else price)
+    except InvalidOperation:
+        raise ValueError(f"price must be a number, got {price!r}") from None
+    if not amount.is_finite() or amount * 100 != (amount * 100).to_integral_value():
+        raise ValueError(f"price must be a whole number of cents, got {price!r}")
+    if not isinstance(day, str) or not _ISO_DATE.fullmatch(day):
+        raise ValueError(f"date must be YYYY-MM-DD, got {day!r}")
+    try:
+        date.fromisoformat(day)
+    except ValueError:
+        raise ValueError(f"date does not exist: {day!r}") from None
+    return expense, amount, day
+
+def import_expenses(client: ExpensesDatabaseClient, path: str, format: Optional[str] = None, batch_size: int = 10000, on_error: str = "raise", progress: Optional[Callable[[Dict[str, int]], None]] = None, set_wise_indexing: bool = False) -> Dict[str, object]:
+    """Stream a CSV or JSON Lines file into the database, batch_size validated rows per transaction.
+
+    on_error='raise' stops at the first invalid row, before its chunk is written (earlier chunks
+    stay committed unless the call runs inside client.transaction()); on_error='skip' leaves invalid
+    rows out and lists the first MAX_REPORTED_ERRORS of them as "line N: reason". progress, if given,
+    is called after every chunk with the rows, imported, skipped, bytes_read and total_bytes so far;
+    an exception raised by it stops the import. set_wise_indexing is passed on to create_expenses_bulk;
+    turn it on for large imports when no other connection needs its prepared statements kept valid.
+    """
+    format = detect_format(path, format)
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    if not client.has_date:
+        # Before reading the file; create_expenses_bulk would refuse the first chunk anyway
+        raise ValueError(f"{client.db_name!r} has no date column, so it cannot import dated rows")
+    if on_error not in ("raise", "skip"):
+        raise ValueError(f"on_error must be 'raise' or 'skip', got {on_error!r}")
+    stats = {"rows": 0, "imported": 0, "skipped": 0, "bytes_read": 0, "total_bytes": os.path.getsize(path)}
+    errors = []
+    batches = 0
+    # utf-8-sig drops the byte order mark spreadsheet programs put in front of CSV exports
+    with open(path, encoding="utf-8-sig", newline="" if format == "csv" else None) as handle:
+        chunk = []
+        for number, record in iter_records(handle, format):
+            stats["rows"] += 1
+            try:
+                chunk.append(validate_record(record))
+            except ValueError as exc:
+                if on_error == "raise":
+                    raise ValueError(f"{path}, line {number}: {exc}") from None
+                stats["skipped"] += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append(f"line {number}: {exc}")
+            if len(chunk) >= batch_size:
+                batches += _write_chunk(client, chunk, stats, handle, progress, set_wise_indexing)
+                chunk = []
+        # Also reports the rows skipped since the last full chunk
+        batches += _write_chunk(client, chunk, stats, handle, progress, set_wise_indexing)
+    return {"imported": stats["imported"], "skipped": stats["skipped"], "batches": batches, "errors": errors}
+
+def _write_chunk(client: ExpensesDatabaseClient, chunk: list, stats: Dict[str, int], handle, progress, set_wise_indexing: bool = False) -> int:
+    """Insert one validated chunk as a single batch, then report progress; returns the number of batches written."""
+    if chunk:
+        client.create_expenses_bulk(chunk, batch_size=len(chunk), set_wise_indexing=set_wise_indexing)
+        stats["imported"] += len(chunk)
+    # The binary buffer's position is exact to within one read-ahead block
+    stats["bytes_read"] = min(handle.buffer.tell(), stats["total_bytes"])
+    if progress is not None:
+        progress(dict(stats))
+    return 1 if chunk else 0
+
+def export_expenses(client: ExpensesDatabaseClient, path: str, format: Optional[str] = None, batch_size: int = 10000, progress: Optional[Callable[[Dict[str, int]], None]] = None, **filters) -> Dict[str, int]:
+    """Stream the expenses matching the search_expenses filters to a CSV or JSON Lines file, in exp_id order.
+
+    The file is written under a temporary name and renamed when complete, so a failed or cancelled
+    export never leaves a truncated file at path. progress, if given, is called every batch_size rows
+    with the rows, total_rows and bytes_written so far; an exception raised by it stops the export.
+    """
+    format = detect_format(path, format)
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    # Served by the monthly rollup for year/month filters, so the count costs next to nothing
+    stats = {"rows": 0, "total_rows": client.summarize_expenses(**filters)[0][2], "bytes_written": 0}
+    partial = path + ".partial"
+    try:
+        with open(partial, "w", encoding="utf-8", newline="") as handle:
+            if format == "csv":
+                writer = csv.writer(handle)
+                writer.writerow(FIELDS)
+                write = writer.writerow
+            else:
+                def write(row):
+                    # Prices go out as JSON numbers with their exact decimal digits
+                    handle.write(
+                        f'{{"exp_id": {row[0]}, "expense": {json.dumps(row[1], ensure_ascii=False)}, '
+                        f'"price": {row[2]}, "date": {json.dumps(row[3] if len(row) > 3 else None)}}}\n'
+                    )
+            for row in client.iter_search(arraysize=batch_size, **filters):
+                write(row)
+                stats["rows"] += 1
+                if progress is not None and stats["rows"] % batch_size == 0:
+                    stats["bytes_written"] = handle.tell()
+                    progress(dict(stats))
+            stats["bytes_written"] = handle.tell()
+        os.replace(partial, path)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    if progress is not None:
+        progress(dict(stats))
+    return {"exported": stats["rows"], "bytes_written": stats["bytes_written"]}
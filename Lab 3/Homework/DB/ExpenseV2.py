@@ -1,69 +1,611 @@
+import sqlite3
 import sys
+import threading
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout,
-    QHBoxLayout, QTableWidget, QTableWidgetItem, 
-    QLineEdit, QLabel, QPushButton, QMenuBar, QMenu
+    QHBoxLayout, QTableView, QHeaderView, QAbstractItemView,
+    QLineEdit, QLabel, QPushButton, QMenuBar, QMenu, QMessageBox,
+    QStyledItemDelegate, QStyleOptionButton, QStyle, QFileDialog, QProgressDialog
+)
+from PyQt5.QtCore import (
+    Qt, QAbstractTableModel, QModelIndex, QEvent, QObject, QRunnable, QThreadPool, pyqtSignal
 )
-from PyQt5.QtCore import Qt
 from PyQt5.QtWidgets import QComboBox, QLabel, QPushButton, QHBoxLayout
 from PyQt5.QtCore import QDate
-from DB_Client import ExpensesDatabaseClient
-client = ExpensesDatabaseClient()
+from DB_Client import ExpensesDatabaseClient, PooledExpensesDatabaseClient
+from DB_Transfer import export_expenses, import_expenses
 class ExpenseMenu(QMenuBar):
+    # Emitted when File > Import... or File > Export... is chosen; the window asks for the file
+    import_requested = pyqtSignal()
+    export_requested = pyqtSignal()
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setup_menu()
 
     def setup_menu(self):
         file_menu = QMenu("File", self)
+        self.import_action = file_menu.addAction("Import...")
+        self.import_action.triggered.connect(lambda: self.import_requested.emit())
+        export_action = file_menu.addAction("Export...")
+        export_action.triggered.connect(lambda: self.export_requested.emit())
         edit_menu = QMenu("Edit", self)
         help_menu = QMenu("Help", self)
         self.addMenu(file_menu)
         self.addMenu(edit_menu)
         self.addMenu(help_menu)
 
-class ExpenseTable(QTableWidget):
+class ExpenseQuerySignals(QObject):
+    # Every signal carries the generation of the query, so results of a replaced query can be dropped
+    rows_ready = pyqtSignal(int, object, list, object)  # generation, start cursor, rows, next cursor
+    total_ready = pyqtSignal(int, object)  # total generation, Decimal total
+    failed = pyqtSignal(int, str)
+    done = pyqtSignal(int)
+
+class ExpenseQueryWorker(QRunnable):
+    # Runs one search off the GUI thread: rows are sent in chunks of chunk_sizes, then optionally the total.
+    # The total is tagged with total_generation, so a total recomputed after a local change replaces older ones
+    def __init__(self, db_client: PooledExpensesDatabaseClient, generation, filters, cursor, chunk_sizes, with_total, total_generation=0):
+        super().__init__()
+        self.db_client = db_client
+        self.generation = generation
+        self.filters = dict(filters)
+        self.cursor = cursor
+        self.chunk_sizes = chunk_sizes
+        self.with_total = with_total
+        self.total_generation = total_generation
+        self.signals = ExpenseQuerySignals()
+        self._cancelled = threading.Event()
+        # The pooled connection of the worker thread, which runs other workers' queries once this one is done,
+        # and whether a call of this worker is running on it; guarded by _lock
+        self._connection = None
+        self._querying = False
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        with self._lock:
+            self._cancelled.set()
+            if self._querying:
+                # Aborts the statement this worker is running; never one of the next worker on the thread
+                self._connection.interrupt()
+
+    def _query(self, method, **kwargs):
+        with self._lock:
+            if self._cancelled.is_set():
+                return None
+            self._querying = True
+        try:
+            return method(**kwargs)
+        finally:
+            with self._lock:
+                self._querying = False
+
+    def run(self):
+        try:
+            self._connection = self.db_client.connection
+            cursor = self.cursor
+            for size in self.chunk_sizes:
+                page = self._query(self.db_client.search_expenses_page, limit=size, cursor=cursor, **self.filters)
+                if self._cancelled.is_set():
+                    return
+                rows, next_cursor = page
+                self.signals.rows_ready.emit(self.generation, cursor, rows, next_cursor)
+                cursor = next_cursor
+                if cursor is None:
+                    break
+            if self.with_total:
+                total = self._query(self.db_client.total_expenses, **self.filters)
+                if not self._cancelled.is_set():
+                    self.signals.total_ready.emit(self.total_generation, total)
+        except Exception as exc:
+            # Not only sqlite3.Error: bad filters or cursors raise ValueError, a missing archive OSError,
+            # and an exception escaping run() would abort the application
+            if not self._cancelled.is_set():
+                self.signals.failed.emit(self.generation, str(exc))
+        finally:
+            self._connection = None
+            self.signals.done.emit(self.generation)
+
+class ExpenseTransferSignals(QObject):
+    progress = pyqtSignal(object)  # progress dict of import_expenses / export_expenses
+    finished = pyqtSignal(object)  # their final report
+    failed = pyqtSignal(str)
+
+class _TransferCancelled(Exception):
+    pass
+
+class ExpenseTransferWorker(QRunnable):
+    # Runs one import or export off the GUI thread, on a connection of its own
+    def __init__(self, db_name, direction, path, filters=None):
+        super().__init__()
+        self.db_name = db_name
+        self.direction = direction
+        self.path = path
+        self.filters = dict(filters or {})
+        self.signals = ExpenseTransferSignals()
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        # Takes effect at the next progress report; rows already imported stay imported
+        self._cancelled.set()
+
+    def _report(self, stats):
+        if self._cancelled.is_set():
+            raise _TransferCancelled()
+        self.signals.progress.emit(stats)
+
+    def run(self):
+        try:
+            with ExpensesDatabaseClient(self.db_name) as client:
+                if self.direction == "import":
+                    # Invalid rows are skipped and listed in the report instead of stopping the import
+                    report = import_expenses(client, self.path, on_error="skip", progress=self._report)
+                else:
+                    report = export_expenses(client, self.path, progress=self._report, **self.filters)
+            self.signals.finished.emit(report)
+        except _TransferCancelled:
+            self.signals.failed.emit(f"{self.direction.capitalize()} cancelled.")
+        except (OSError, ValueError, sqlite3.Error) as exc:
+            self.signals.failed.emit(str(exc))
+
+class ExpenseTableModel(QAbstractTableModel):
+    # Emitted with the new total whenever rows are loaded, added, edited or deleted
+    total_changed = pyqtSignal(object)
+    # Emitted with a message when an edit typed into the table cannot be saved
+    edit_rejected = pyqtSignal(str)
+    # Emitted with a message when a background query fails
+    query_failed = pyqtSignal(str)
+    # Emitted with the seconds between starting a load and its first rows (or its empty result) arriving
+    first_rows_shown = pyqtSignal(float)
+    # Emitted once a load has delivered its first rows and its total
+    load_finished = pyqtSignal()
+
+    HEADERS = ["Expense", "Price", "Actions"]
+
+    def __init__(self, db_client: ExpensesDatabaseClient, page_size=200, max_cached_pages=50, first_chunk=50, parent=None):
+        super().__init__(parent)
+        self.db_client = db_client
+        self.page_size = page_size
+        self.max_cached_pages = max_cached_pages
+        # A small first chunk gets the first screen of rows up before the rest of the page is read
+        self.first_chunk = min(first_chunk, page_size)
+        # search_expenses filters of the rows shown; the total is computed over the same filters
+        self.filters = {}
+        self.total = Decimal("0.00")
+        # Searches, loads and totals run on these threads, each with its own pooled connection
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(2)
+        self.worker_client = PooledExpensesDatabaseClient(db_client.db_name, pool_size=self.thread_pool.maxThreadCount(), profile="read-mostly")
+        self._workers = set()
+        self._generation = 0
+        # The total of a load arrives after its rows; changes made meanwhile cannot be applied as deltas
+        self._total_generation = 0
+        self._total_pending = False
+        self._fetching = False
+        self.loading = False
+        self.time_to_first_row = None
+        self._reset_pages()
+
+    def _reset_pages(self):
+        # Rows are fetched in keyset pages. For every page fetched so far we remember the cursor it
+        # starts at, its length and its first row, so any page can be fetched again after eviction.
+        self._page_cursors = []
+        self._page_lengths = []
+        self._page_offsets = []
+        self._next_cursor = None
+        self._exhausted = False
+        self._row_count = 0
+        # Bounded LRU cache of page number -> list of [exp_id, expense, price, date] rows
+        self._pages = OrderedDict()
+        # Page number -> worker fetching an evicted page again; its rows show a placeholder meanwhile
+        self._refetching = {}
+
+    def load(self):
+        # A newer query replaces whatever is still running
+        self.cancel_queries()
+        self._generation += 1
+        self.beginResetModel()
+        self._reset_pages()
+        self.endResetModel()
+        self.loading = True
+        self.time_to_first_row = None
+        self._load_started = time.perf_counter()
+        chunk_sizes = [self.first_chunk]
+        if self.page_size > self.first_chunk:
+            chunk_sizes.append(self.page_size - self.first_chunk)
+        self._total_generation += 1
+        self._total_pending = True
+        self._start_query(None, chunk_sizes, with_total=True)
+
+    def _start_query(self, cursor, chunk_sizes, with_total, page=None):
+        # Rows are appended to the table, or with page, stored as that already counted page
+        worker = ExpenseQueryWorker(self.worker_client, self._generation, self.filters, cursor, chunk_sizes, with_total, self._total_generation)
+        if page is None:
+            worker.signals.rows_ready.connect(self._on_rows_ready)
+        else:
+            worker.signals.rows_ready.connect(lambda generation, cursor, rows, next_cursor, worker=worker, page=page: self._on_page_ready(worker, page, rows))
+            self._refetching[page] = worker
+        worker.signals.total_ready.connect(self._on_total_ready)
+        worker.signals.failed.connect(self._on_query_failed)
+        worker.signals.done.connect(lambda generation, worker=worker, page=page: self._on_query_done(worker, page))
+        self._workers.add(worker)
+        if chunk_sizes and page is None:
+            self._fetching = True
+        self.thread_pool.start(worker)
+
+    def cancel_queries(self):
+        for worker in self._workers:
+            worker.cancel()
+        self._fetching = False
+
+    def close(self):
+        self.cancel_queries()
+        self.thread_pool.waitForDone()
+        self.worker_client.close()
+
+    def _on_rows_ready(self, generation, cursor, rows, next_cursor):
+        if generation != self._generation:
+            return
+        if self.time_to_first_row is None:
+            self.time_to_first_row = time.perf_counter() - self._load_started
+            self.first_rows_shown.emit(self.time_to_first_row)
+        self._next_cursor = next_cursor
+        self._exhausted = next_cursor is None
+        if not rows:
+            return
+        first = self._row_count
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        self._page_cursors.append(cursor)
+        self._page_lengths.append(len(rows))
+        self._page_offsets.append(first)
+        self._store_page(len(self._page_cursors) - 1, rows)
+        self._row_count += len(rows)
+        self.endInsertRows()
+
+    def _on_total_ready(self, total_generation, total):
+        if total_generation != self._total_generation:
+            return
+        self._total_pending = False
+        self.total = total
+        self.total_changed.emit(self.total)
+
+    def _add_to_total(self, delta):
+        # Applies the change of a row that is already in the database to the running total
+        if self._total_pending:
+            # The total still being computed may or may not include the change, so it is computed again
+            self._recompute_total()
+            return
+        self.total += delta
+        self.total_changed.emit(self.total)
+
+    def _recompute_total(self):
+        self._total_generation += 1
+        self._total_pending = True
+        self._start_query(None, [], with_total=True)
+
+    def _on_page_ready(self, worker, page, rows):
+        # Only the latest request for the page counts; an older one may have had another length
+        if self._refetching.get(page) is not worker:
+            return
+        del self._refetching[page]
+        self._store_page(page, rows)
+        first = self._page_offsets[page]
+        if self._page_lengths[page]:
+            self.dataChanged.emit(self.index(first, 0), self.index(first + self._page_lengths[page] - 1, len(self.HEADERS) - 1))
+
+    def _on_query_failed(self, generation, message):
+        if generation == self._generation:
+            self.query_failed.emit(message)
+
+    def _on_query_done(self, worker, page=None):
+        self._workers.discard(worker)
+        if page is not None and self._refetching.get(page) is worker:
+            # Failed or cancelled; the page is requested again the next time it is shown
+            del self._refetching[page]
+        if worker.with_total and worker.total_generation == self._total_generation:
+            # Failed or cancelled before sending the total; keep the one shown
+            self._total_pending = False
+        if worker.generation != self._generation:
+            return
+        if worker.chunk_sizes and page is None:
+            self._fetching = False
+        if self.loading:
+            self.loading = False
+            self.load_finished.emit()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._row_count
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        # The next page is read in the background; the view asks again once it has arrived
+        if parent.isValid() or self._exhausted or self._fetching:
+            return
+        self._start_query(self._next_cursor, [self.page_size], with_total=False)
+
+    def _store_page(self, page, rows):
+        self._pages[page] = [list(row) for row in rows]
+        self._pages.move_to_end(page)
+        while len(self._pages) > self.max_cached_pages:
+            self._pages.popitem(last=False)
+
+    def _locate(self, row):
+        # Page holding the row and the row's position inside that page
+        page = bisect_right(self._page_offsets, row) - 1
+        return page, row - self._page_offsets[page]
+
+    def _page(self, page):
+        # The cached rows of the page, or None while an evicted page is fetched again in the background
+        rows = self._pages.get(page)
+        if rows is not None:
+            self._pages.move_to_end(page)
+        elif not self._page_lengths[page]:
+            rows = []
+            self._store_page(page, rows)
+        elif page not in self._refetching:
+            self._request_page(page)
+        return rows
+
+    def _request_page(self, page):
+        # Also replaces a request still running, e.g. after the page's length changed
+        self._pages.pop(page, None)
+        self._start_query(self._page_cursors[page], [self._page_lengths[page]], with_total=False, page=page)
+
+    def expense_row(self, row):
+        page, position = self._locate(row)
+        rows = self._page(page)
+        # A page fetched again after other writers deleted rows can come back short
+        return rows[position] if rows is not None and position < len(rows) else None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        expense_row = self.expense_row(index.row())
+        if expense_row is None:
+            if role == Qt.DisplayRole and index.column() == 0 and self._locate(index.row())[0] in self._refetching:
+                return "Loading..."
+            return None
+        # Files from before the date column have no fourth field
+        exp_id, expense, price = expense_row[:3]
+        column = index.column()
+        if role == Qt.UserRole:
+            # exp_id on the expense column, the numeric price on the price column
+            return exp_id if column == 0 else price
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            if column == 0:
+                return expense
+            if column == 1:
+                return f"{price:.2f}"
+            if column == 2 and role == Qt.DisplayRole:
+                return "Delete"
+        return None
+
+    def flags(self, index):
+        flags = super().flags(index)
+        if index.column() in (0, 1):
+            flags |= Qt.ItemIsEditable
+        return flags
+
+    def setData(self, index, value, role=Qt.EditRole):
+        # Edits typed into the table are saved straight to the database
+        if role != Qt.EditRole or index.column() not in (0, 1):
+            return False
+        exp_id = self.data(index.sibling(index.row(), 0), Qt.UserRole)
+        if exp_id is None:
+            # The row's page is still being fetched again
+            return False
+        text = str(value).strip()
+        if index.column() == 0:
+            if not text:
+                self.edit_rejected.emit("Expense name cannot be empty.")
+                return False
+            try:
+                self.db_client.update_expense(exp_id, expense=text)
+            except sqlite3.Error as exc:
+                # e.g. an expense of an archived year
+                self.edit_rejected.emit(str(exc))
+                return False
+            self.update_row(index.row(), expense_name=text)
+            return True
+        try:
+            # Decimal keeps the typed amount exact; the client rejects fractions of a cent
+            price = Decimal(text)
+            self.db_client.update_expense(exp_id, price=price)
+        except (ValueError, InvalidOperation):
+            self.edit_rejected.emit("Price must be a valid number with at most two decimals.")
+            return False
+        except sqlite3.Error as exc:
+            self.edit_rejected.emit(str(exc))
+            return False
+        self.update_row(index.row(), price=price)
+        return True
+
+    def update_row(self, row, expense_name=None, price=None):
+        # Applies a change that is already in the database to the cached row and the running total
+        expense_row = self.expense_row(row)
+        if expense_row is None:
+            # Not cached: the page is fetched again with the new values, and the total recomputed
+            page = self._locate(row)[0]
+            if page not in self._pages and self._page_lengths[page]:
+                self._request_page(page)
+            if price is not None:
+                self._recompute_total()
+            return
+        if expense_name is not None:
+            expense_row[1] = expense_name
+        self.dataChanged.emit(self.index(row, 0), self.index(row, 1))
+        if price is not None:
+            delta = price - expense_row[2]
+            expense_row[2] = price
+            self._add_to_total(delta)
+
+    def remove_row(self, row):
+        if not 0 <= row < self._row_count:
+            return
+        expense_row = self.expense_row(row)
+        page, position = self._locate(row)
+        self.beginRemoveRows(QModelIndex(), row, row)
+        rows = self._pages.get(page)
+        if rows is not None and position < len(rows):
+            del rows[position]
+        self._page_lengths[page] -= 1
+        for later in range(page + 1, len(self._page_offsets)):
+            self._page_offsets[later] -= 1
+        self._row_count -= 1
+        self.endRemoveRows()
+        if page in self._refetching:
+            # Asked for with the old length
+            self._request_page(page)
+        if expense_row is not None:
+            self._add_to_total(-expense_row[2])
+        else:
+            self._recompute_total()
+
+    def append_expense(self, exp_id):
+        expense_row = self.db_client.read_expense(exp_id, **self.filters)
+        if expense_row is None:
+            return
+        if any(self.filters.get(name) is not None for name in ("year", "date_from", "date_to")):
+            # Such searches are paged in (date, exp_id) order (see search_expenses_page), where a new
+            # expense can belong anywhere; loading them again puts it in place and recomputes the total
+            self.load()
+            return
+        # Other searches are in exp_id order, and new expenses have the highest exp_id, so they
+        # belong after every row already fetched
+        if self._exhausted:
+            # Everything else is loaded already, so the row is shown right away; otherwise
+            # fetchMore picks it up when the user scrolls to the end.
+            if not self._page_lengths:
+                self._page_cursors.append(None)
+                self._page_lengths.append(0)
+                self._page_offsets.append(0)
+            last = len(self._page_lengths) - 1
+            rows = self._page(last)
+            self.beginInsertRows(QModelIndex(), self._row_count, self._row_count)
+            if rows is not None:
+                rows.append(list(expense_row))
+            self._page_lengths[last] += 1
+            self._row_count += 1
+            self.endInsertRows()
+            if rows is None:
+                # The page is being fetched again; asked for with its new length, it includes the new row
+                self._request_page(last)
+        self._add_to_total(expense_row[2])
+
+class ExpenseActionDelegate(QStyledItemDelegate):
+    # Draws the Delete button of every row instead of creating one QPushButton widget per row
+    delete_requested = pyqtSignal(int)
+
+    def paint(self, painter, option, index):
+        if index.data() is None:
+            # No button on rows whose page is still being fetched
+            return
+        button = QStyleOptionButton()
+        button.rect = option.rect.adjusted(2, 2, -2, -2)
+        button.text = index.data()
+        button.state = QStyle.State_Enabled | QStyle.State_Raised
+        QApplication.style().drawControl(QStyle.CE_PushButton, button, painter)
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.MouseButtonRelease and option.rect.contains(event.pos()):
+            self.delete_requested.emit(index.row())
+            return True
+        return super().editorEvent(event, model, option, index)
+
+class ExpenseTable(QTableView):
     def __init__(self, db_client: ExpensesDatabaseClient, parent=None):
         super().__init__(parent)
         self.db_client = db_client
-        self.setColumnCount(3)
-        self.setHorizontalHeaderLabels(["Expense", "Price", "Actions"])
+        self.expense_model = ExpenseTableModel(db_client, parent=self)
+        self.setModel(self.expense_model)
+        self.total_changed = self.expense_model.total_changed
+        self.edit_rejected = self.expense_model.edit_rejected
+        self.query_failed = self.expense_model.query_failed
+        self.first_rows_shown = self.expense_model.first_rows_shown
+        self.load_finished = self.expense_model.load_finished
+
+        self.action_delegate = ExpenseActionDelegate(self)
+        self.action_delegate.delete_requested.connect(self.delete_row)
+        self.setItemDelegateForColumn(2, self.action_delegate)
+        self.setSelectionBehavior(QAbstractItemView.SelectRows)
+        # Fixed row heights keep the view from measuring rows it is not showing
+        self.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
         self.load_expenses()
 
+    @property
+    def filters(self):
+        return self.expense_model.filters
+
+    @filters.setter
+    def filters(self, filters):
+        self.expense_model.filters = filters
+
+    @property
+    def total(self):
+        return self.expense_model.total
+
     def load_expenses(self):
-        expenses = self.db_client.read_expenses()
-        for exp_id, expense, price in expenses:
-            self.add_expense(expense, price, exp_id)
+        # Returns right away; rows arrive in chunks from a background query
+        self.expense_model.load()
+
+    def close_queries(self):
+        # Stops background queries and closes their connections
+        self.expense_model.close()
 
-    def add_expense(self, expense_name, price, exp_id=None):
-        row_position = self.rowCount()
-        self.insertRow(row_position)
-        self.setItem(row_position, 0, QTableWidgetItem(expense_name))
-        self.setItem(row_position, 1, QTableWidgetItem(f"{price:.2f}"))
+    def rowCount(self):
+        return self.expense_model.rowCount()
 
-        # Store exp_id in the item data for later retrieval
-        self.item(row_position, 0).setData(Qt.UserRole, exp_id)
+    def currentRow(self):
+        return self.currentIndex().row()
 
-        delete_button = QPushButton("Delete")
-        delete_button.clicked.connect(lambda: self.delete_expense(exp_id, row_position))
-        self.setCellWidget(row_position, 2, delete_button)
+    def row_id(self, row):
+        return self.expense_model.index(row, 0).data(Qt.UserRole)
+
+    def row_price(self, row):
+        return self.expense_model.index(row, 1).data(Qt.UserRole)
+
+    def add_expense(self, expense_name, price, exp_id):
+        self.expense_model.append_expense(exp_id)
+
+    def delete_row(self, row):
+        exp_id = self.row_id(row)
+        if exp_id is not None:
+            self.delete_expense(exp_id, row)
 
     def delete_expense(self, exp_id, row):
-        self.db_client.delete_expense(exp_id)
-        self.removeRow(row)
-        self.parentWidget().parent().update_total()
+        try:
+            self.db_client.delete_expense(exp_id)
+        except sqlite3.Error as exc:
+            # The row stays, and so does the total
+            self.edit_rejected.emit(str(exc))
+            return
+        self.expense_model.remove_row(row)
+
+    def update_row(self, row, expense_name, price):
+        self.expense_model.update_row(row, expense_name, price)
 
     def calculate_total(self):
-        total = 0.0
-        for row in range(self.rowCount()):
-            price_item = self.item(row, 1)
-            if price_item:
-                total += float(price_item.text())
-        return total
+        # Recomputed by the database (from the monthly rollup for year/month filters), e.g. to check the running total for drift
+        return self.db_client.total_expenses(**self.filters)
 class ExpenseSearch(QWidget):
-    def __init__(self, expense_table):
+    def __init__(self, expense_table, update_total_callback):
         super().__init__()  
         self.expense_table = expense_table
+        self.update_total_callback = update_total_callback
         self.setup_search_panel()
 
     def setup_search_panel(self):
@@ -93,18 +635,19 @@ class ExpenseSearch(QWidget):
         layout.addWidget(search_button)
         
         self.setLayout(layout)
+        if not self.expense_table.db_client.has_date:
+            # Files from before the date column cannot be searched by year and month
+            self.setEnabled(False)
+            self.setToolTip("This database has no dates to search by")
 
 
     def filtered_expense(self):
         year = self.year_input.currentText()
         month = self.month_input.currentIndex() + 1
 
-        
-        filtered_expenses = self.expense_table.db_client.search_expenses(year, month)
-        self.expense_table.clear()
-
-        for expense, price in filtered_expenses:
-            self.expense_table.add_expense(expense, price)
+        self.expense_table.filters = {"year": int(year), "month": month}
+        self.expense_table.load_expenses()
+        self.update_total_callback()
 
 class ExpenseInputPanel(QWidget):
     def __init__(self, table, db_client: ExpensesDatabaseClient, update_total_callback, parent=None):
@@ -150,18 +693,22 @@ class ExpenseInputPanel(QWidget):
             self.show_error("Please enter both expense and price.")
             return
         try:
-            price = float(price_text)
+            price = Decimal(price_text)
             if price < 0:
                 self.show_error("Price cannot be negative.")
                 return
-            self.db_client.create_expense(expense_name, price)
-            self.table.add_expense(expense_name, price)
+            today = QDate.currentDate().toString(Qt.ISODate) if self.db_client.has_date else None
+            exp_id = self.db_client.create_expense(expense_name, price, today)
+            self.table.add_expense(expense_name, price, exp_id)
 
             self.expense_input.clear()
             self.price_input.clear()
             self.update_total_callback()
-        except ValueError:
-            self.show_error("Price must be a valid number.")
+        except (ValueError, InvalidOperation):
+            self.show_error("Price must be a valid number with at most two decimals.")
+        except sqlite3.Error as exc:
+            # e.g. a file with REAL prices that still has to be migrated
+            self.show_error(str(exc))
 
     def update_selected_expense(self):
         selected_row = self.table.currentRow()
@@ -176,16 +723,17 @@ class ExpenseInputPanel(QWidget):
             self.show_error("Expense name cannot be empty.")
             return
 
+        exp_id = self.table.row_id(selected_row)  # Retrieve exp_id
         try:
-            price = float(price_text)
-        except ValueError:
-            self.show_error("Please enter a valid numeric value for the price.")
+            price = Decimal(price_text)
+            self.db_client.update_expense(exp_id, expense_name, price)
+        except (ValueError, InvalidOperation):
+            self.show_error("Please enter a valid numeric value for the price, with at most two decimals.")
             return
-
-        exp_id = self.table.item(selected_row, 0).data(Qt.UserRole)  # Retrieve exp_id
-        self.db_client.update_expense(exp_id, expense_name, price)
-        self.table.setItem(selected_row, 0, QTableWidgetItem(expense_name))
-        self.table.setItem(selected_row, 1, QTableWidgetItem(f"{price:.2f}"))
+        except sqlite3.Error as exc:
+            self.show_error(str(exc))
+            return
+        self.table.update_row(selected_row, expense_name, price)
 
         self.expense_input.clear()
         self.price_input.clear()
@@ -195,12 +743,12 @@ class ExpenseInputPanel(QWidget):
         QMessageBox.critical(self, "Error", message)
 
 class ExpenseApp(QMainWindow):
-    def __init__(self):
+    def __init__(self, client: ExpensesDatabaseClient):
         super().__init__()
         self.setWindowTitle("Expense Tracker")
         self.setGeometry(100, 100, 600, 300)
 
-        # Initialize the database client here
+        # The client is owned (and closed) by whoever created the window
         self.client = client
 
         central_widget = QWidget()
@@ -209,13 +757,23 @@ class ExpenseApp(QMainWindow):
 
         self.menu_bar = ExpenseMenu(self)
         self.setMenuBar(self.menu_bar)
+        self.menu_bar.import_requested.connect(self.import_expenses)
+        if not client.has_date:
+            # Imported rows carry dates, which files from before the date column cannot store
+            self.menu_bar.import_action.setEnabled(False)
+            self.menu_bar.import_action.setStatusTip("This database has no date column to import into")
+        self.menu_bar.export_requested.connect(self.export_expenses)
+        self.transfer = None
  
         
 
         self.expense_table = ExpenseTable(self.client, self)
-        self.expense_table.cellChanged.connect(self.update_total) # used for updating the total when 
-        #changing the cell by double clicking on it 
-        self.search_menu = ExpenseSearch(self.expense_table)
+        self.expense_table.total_changed.connect(self.update_total) # used for updating the total when rows are
+        #added, deleted or changed, including edits made by double clicking on a cell
+        self.expense_table.edit_rejected.connect(self.show_error)
+        self.expense_table.query_failed.connect(self.show_error)
+        self.expense_table.first_rows_shown.connect(self.show_first_row_time)
+        self.search_menu = ExpenseSearch(self.expense_table, self.update_total)
 
         self.expense_input_panel = ExpenseInputPanel(self.expense_table, self.client, self.update_total, self)
         self.layout.addWidget(self.expense_input_panel)
@@ -232,12 +790,83 @@ class ExpenseApp(QMainWindow):
 
         self.update_total()  # Initial calculation of total
 
+    def show_error(self, message):
+        QMessageBox.critical(self, "Error", message)
+
+    def show_first_row_time(self, seconds):
+        self.statusBar().showMessage(f"First rows in {seconds * 1000:.0f} ms")
+
+    def import_expenses(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Import expenses", "", "Expenses (*.csv *.jsonl *.ndjson)")
+        if path:
+            self.start_transfer("import", path)
+
+    def export_expenses(self):
+        # Exports the rows the table shows, i.e. the current year/month search if there is one
+        path, _ = QFileDialog.getSaveFileName(self, "Export expenses", "expenses.csv", "CSV (*.csv);;JSON Lines (*.jsonl)")
+        if path:
+            self.start_transfer("export", path)
+
+    def start_transfer(self, direction, path):
+        if self.transfer is not None:
+            self.show_error("An import or export is already running.")
+            return
+        worker = ExpenseTransferWorker(self.client.db_name, direction, path, self.expense_table.filters)
+        dialog = QProgressDialog(f"{direction.capitalize()}ing {path}...", "Cancel", 0, 1000, self)
+        dialog.setWindowModality(Qt.WindowModal)
+        dialog.setMinimumDuration(500)
+        dialog.canceled.connect(worker.cancel)
+        worker.signals.progress.connect(lambda stats: self.show_transfer_progress(dialog, stats))
+        worker.signals.finished.connect(lambda report: self.finish_transfer(direction, report))
+        worker.signals.failed.connect(self.fail_transfer)
+        self.transfer = (worker, dialog)
+        QThreadPool.globalInstance().start(worker)
+
+    def show_transfer_progress(self, dialog, stats):
+        # Imports know how far through the file they are, exports how many of the matching rows they wrote
+        done, total = (stats["bytes_read"], stats["total_bytes"]) if "bytes_read" in stats else (stats["rows"], stats["total_rows"])
+        if total:
+            dialog.setValue(min(999, done * 1000 // total))
+        dialog.setLabelText(f"{stats['rows']} rows")
+
+    def end_transfer(self):
+        _, dialog = self.transfer
+        self.transfer = None
+        dialog.reset()
+
+    def finish_transfer(self, direction, report):
+        self.end_transfer()
+        if direction == "export":
+            self.statusBar().showMessage(f"Exported {report['exported']} rows")
+            return
+        self.statusBar().showMessage(f"Imported {report['imported']} rows, skipped {report['skipped']}")
+        self.expense_table.load_expenses()
+        if report["skipped"]:
+            first = "\n".join(report["errors"][:10])
+            QMessageBox.warning(self, "Import", f"{report['skipped']} invalid rows were skipped:\n{first}")
+
+    def fail_transfer(self, message):
+        self.end_transfer()
+        # A cancelled or failed import may have committed its first batches
+        self.expense_table.load_expenses()
+        self.show_error(message)
+
+    def closeEvent(self, event):
+        if self.transfer is not None:
+            self.transfer[0].cancel()
+        self.expense_table.close_queries()
+        super().closeEvent(event)
+
     def update_total(self):
-        total = self.expense_table.calculate_total()
-        self.total_value.setText(f"{total:.2f}")
+        # The table keeps the total up to date itself: loads take it from SQL, edits apply deltas
+        self.total_value.setText(f"{self.expense_table.total:.2f}")
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
-    window = ExpenseApp()
-    window.show()
-    sys.exit(app.exec_())
+    # The table's worker threads read through their own pooled connections (see ExpenseTableModel);
+    # statistics are refreshed hourly and on exit so the planner keeps picking the right indexes
+    with ExpensesDatabaseClient(profile="interactive", optimize_every=3600) as client:
+        window = ExpenseApp(client)
+        window.show()
+        exit_code = app.exec_()
+    sys.exit(exit_code)
@@ -1,10 +1,86 @@
-CREATE TABLE expenses (
+CREATE TABLE IF NOT EXISTS expenses (
     exp_id INTEGER PRIMARY KEY,
     expense TEXT NOT NULL,
-    price REAL NOT NULL,
+    price_cents INTEGER NOT NULL,
     date DATE NOT NULL
 
 );
 
-CREATE INDEX idx_expense ON expenses(expense);
-CREATE INDEX idx_price ON expenses(price);
+CREATE INDEX IF NOT EXISTS idx_expense ON expenses(expense);
+CREATE INDEX IF NOT EXISTS idx_price ON expenses(price_cents);
+CREATE INDEX IF NOT EXISTS idx_date_price ON expenses(date, price_cents);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS expenses_fts USING fts5(expense, content='expenses', content_rowid='exp_id');
+
+CREATE TRIGGER IF NOT EXISTS expenses_fts_ai AFTER INSERT ON expenses BEGIN
+    INSERT INTO expenses_fts(rowid, expense) VALUES (new.exp_id, new.expense);
+END;
+CREATE TRIGGER IF NOT EXISTS expenses_fts_ad AFTER DELETE ON expenses BEGIN
+    INSERT INTO expenses_fts(expenses_fts, rowid, expense) VALUES ('delete', old.exp_id, old.expense);
+END;
+CREATE TRIGGER IF NOT EXISTS expenses_fts_au AFTER UPDATE OF expense ON expenses BEGIN
+    INSERT INTO expenses_fts(expenses_fts, rowid, expense) VALUES ('delete', old.exp_id, old.expense);
+    INSERT INTO expenses_fts(rowid, expense) VALUES (new.exp_id, new.expense);
+END;
+
+INSERT INTO expenses_fts(expenses_fts) VALUES ('rebuild');
+
+CREATE TABLE IF NOT EXISTS monthly_totals (
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    total_cents INTEGER NOT NULL,
+    row_count INTEGER NOT NULL,
+    PRIMARY KEY (year, month)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS monthly_category_totals (
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    total_cents INTEGER NOT NULL,
+    row_count INTEGER NOT NULL,
+    PRIMARY KEY (year, month, category)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS monthly_totals_ai AFTER INSERT ON expenses BEGIN
+    INSERT INTO monthly_totals (year, month, total_cents, row_count)
+    VALUES (CAST(substr(new.date, 1, 4) AS INTEGER), CAST(substr(new.date, 6, 2) AS INTEGER), new.price_cents, 1)
+    ON CONFLICT (year, month) DO UPDATE SET total_cents = total_cents + excluded.total_cents, row_count = row_count + 1;
+    INSERT INTO monthly_category_totals (year, month, category, total_cents, row_count)
+    VALUES (CAST(substr(new.date, 1, 4) AS INTEGER), CAST(substr(new.date, 6, 2) AS INTEGER), new.expense, new.price_cents, 1)
+    ON CONFLICT (year, month, category) DO UPDATE SET total_cents = total_cents + excluded.total_cents, row_count = row_count + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS monthly_totals_ad AFTER DELETE ON expenses BEGIN
+    UPDATE monthly_totals SET total_cents = total_cents - old.price_cents, row_count = row_count - 1
+    WHERE year = CAST(substr(old.date, 1, 4) AS INTEGER) AND month = CAST(substr(old.date, 6, 2) AS INTEGER);
+    DELETE FROM monthly_totals WHERE year = CAST(substr(old.date, 1, 4) AS INTEGER) AND month = CAST(substr(old.date, 6, 2) AS INTEGER) AND row_count = 0;
+    UPDATE monthly_category_totals SET total_cents = total_cents - old.price_cents, row_count = row_count - 1
+    WHERE year = CAST(substr(old.date, 1, 4) AS INTEGER) AND month = CAST(substr(old.date, 6, 2) AS INTEGER) AND category = old.expense;
+    DELETE FROM monthly_category_totals WHERE year = CAST(substr(old.date, 1, 4) AS INTEGER) AND month = CAST(substr(old.date, 6, 2) AS INTEGER) AND category = old.expense AND row_count = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS monthly_totals_au AFTER UPDATE OF expense, price_cents, date ON expenses BEGIN
+    UPDATE monthly_totals SET total_cents = total_cents - old.price_cents, row_count = row_count - 1
+    WHERE year = CAST(substr(old.date, 1, 4) AS INTEGER) AND month = CAST(substr(old.date, 6, 2) AS INTEGER);
+    DELETE FROM monthly_totals WHERE year = CAST(substr(old.date, 1, 4) AS INTEGER) AND month = CAST(substr(old.date, 6, 2) AS INTEGER) AND row_count = 0;
+    UPDATE monthly_category_totals SET total_cents = total_cents - old.price_cents, row_count = row_count - 1
+    WHERE year = CAST(substr(old.date, 1, 4) AS INTEGER) AND month = CAST(substr(old.date, 6, 2) AS INTEGER) AND category = old.expense;
+    DELETE FROM monthly_category_totals WHERE year = CAST(substr(old.date, 1, 4) AS INTEGER) AND month = CAST(substr(old.date, 6, 2) AS INTEGER) AND category = old.expense AND row_count = 0;
+    INSERT INTO monthly_totals (year, month, total_cents, row_count)
+    VALUES (CAST(substr(new.date, 1, 4) AS INTEGER), CAST(substr(new.date, 6, 2) AS INTEGER), new.price_cents, 1)
+    ON CONFLICT (year, month) DO UPDATE SET total_cents = total_cents + excluded.total_cents, row_count = row_count + 1;
+    INSERT INTO monthly_category_totals (year, month, category, total_cents, row_count)
+    VALUES (CAST(substr(new.date, 1, 4) AS INTEGER), CAST(substr(new.date, 6, 2) AS INTEGER), new.expense, new.price_cents, 1)
+    ON CONFLICT (year, month, category) DO UPDATE SET total_cents = total_cents + excluded.total_cents, row_count = row_count + 1;
+END;
+
+-- The rollup of a database with archived years (an archives table) also counts the rows in the
+-- archive files, which this script cannot read; it is left alone there, rebuild it with
+-- python -m DB_CLI rebuild-rollup instead
+DELETE FROM monthly_totals WHERE NOT EXISTS (SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'archives');
+INSERT INTO monthly_totals (year, month, total_cents, row_count)
+SELECT CAST(substr(date, 1, 4) AS INTEGER), CAST(substr(date, 6, 2) AS INTEGER), SUM(price_cents), COUNT(*)
+FROM expenses WHERE NOT EXISTS (SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'archives') GROUP BY 1, 2;
+DELETE FROM monthly_category_totals WHERE NOT EXISTS (SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'archives');
+INSERT INTO monthly_category_totals (year, month, category, total_cents, row_count)
+SELECT CAST(substr(date, 1, 4) AS INTEGER), CAST(substr(date, 6, 2) AS INTEGER), expense, SUM(price_cents), COUNT(*)
+FROM expenses WHERE NOT EXISTS (SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'archives') GROUP BY 1, 2, 3;
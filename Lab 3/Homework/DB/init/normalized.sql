@@ -0,0 +1,97 @@
+CREATE TABLE IF NOT EXISTS categories (
+    category_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS expense_items (
+    exp_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    category_id INTEGER NOT NULL REFERENCES categories(category_id),
+    price_cents INTEGER NOT NULL,
+    date DATE NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_category_price ON expense_items(category_id, price_cents);
+CREATE INDEX IF NOT EXISTS idx_price ON expense_items(price_cents);
+CREATE INDEX IF NOT EXISTS idx_date_price ON expense_items(date, price_cents);
+
+CREATE VIEW IF NOT EXISTS expenses AS
+SELECT i.exp_id AS exp_id, c.name AS expense, i.price_cents AS price_cents, i.date AS date,
+       i.category_id AS category_id
+FROM expense_items AS i JOIN categories AS c ON c.category_id = i.category_id;
+
+CREATE VIRTUAL TABLE IF NOT EXISTS expenses_fts USING fts5(expense, content='expenses', content_rowid='exp_id');
+
+CREATE TRIGGER IF NOT EXISTS expenses_fts_ai AFTER INSERT ON expense_items BEGIN
+    INSERT INTO expenses_fts(rowid, expense)
+    SELECT new.exp_id, name FROM categories WHERE category_id = new.category_id;
+END;
+CREATE TRIGGER IF NOT EXISTS expenses_fts_ad AFTER DELETE ON expense_items BEGIN
+    INSERT INTO expenses_fts(expenses_fts, rowid, expense)
+    SELECT 'delete', old.exp_id, name FROM categories WHERE category_id = old.category_id;
+END;
+CREATE TRIGGER IF NOT EXISTS expenses_fts_au AFTER UPDATE OF category_id ON expense_items BEGIN
+    INSERT INTO expenses_fts(expenses_fts, rowid, expense)
+    SELECT 'delete', old.exp_id, name FROM categories WHERE category_id = old.category_id;
+    INSERT INTO expenses_fts(rowid, expense)
+    SELECT new.exp_id, name FROM categories WHERE category_id = new.category_id;
+END;
+
+INSERT INTO expenses_fts(expenses_fts) VALUES ('rebuild');
+
+CREATE TABLE IF NOT EXISTS monthly_totals (
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    total_cents INTEGER NOT NULL,
+    row_count INTEGER NOT NULL,
+    PRIMARY KEY (year, month)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS monthly_category_totals (
+    year INTEGER NOT NULL,
+    month INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    total_cents INTEGER NOT NULL,
+    row_count INTEGER NOT NULL,
+    PRIMARY KEY (year, month, category)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS monthly_totals_ai AFTER INSERT ON expense_items BEGIN
+    INSERT INTO monthly_totals (year, month, total_cents, row_count)
+    VALUES (CAST(substr(new.date, 1, 4) AS INTEGER), CAST(substr(new.date, 6, 2) AS INTEGER), new.price_cents, 1)
+    ON CONFLICT (year, month) DO UPDATE SET total_cents = total_cents + excluded.total_cents, row_count = row_count + 1;
+    INSERT INTO monthly_category_totals (year, month, category, total_cents, row_count)
+    VALUES (CAST(substr(new.date, 1, 4) AS INTEGER), CAST(substr(new.date, 6, 2) AS INTEGER), (SELECT name FROM categories WHERE category_id = new.category_id), new.price_cents, 1)
+    ON CONFLICT (year, month, category) DO UPDATE SET total_cents = total_cents + excluded.total_cents, row_count = row_count + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS monthly_totals_ad AFTER DELETE ON expense_items BEGIN
+    UPDATE monthly_totals SET total_cents = total_cents - old.price_cents, row_count = row_count - 1
+    WHERE year = CAST(substr(old.date, 1, 4) AS INTEGER) AND month = CAST(substr(old.date, 6, 2) AS INTEGER);
+    DELETE FROM monthly_totals WHERE year = CAST(substr(old.date, 1, 4) AS INTEGER) AND month = CAST(substr(old.date, 6, 2) AS INTEGER) AND row_count = 0;
+    UPDATE monthly_category_totals SET total_cents = total_cents - old.price_cents, row_count = row_count - 1
+    WHERE year = CAST(substr(old.date, 1, 4) AS INTEGER) AND month = CAST(substr(old.date, 6, 2) AS INTEGER) AND category = (SELECT name FROM categories WHERE category_id = old.category_id);
+    DELETE FROM monthly_category_totals WHERE year = CAST(substr(old.date, 1, 4) AS INTEGER) AND month = CAST(substr(old.date, 6, 2) AS INTEGER) AND category = (SELECT name FROM categories WHERE category_id = old.category_id) AND row_count = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS monthly_totals_au AFTER UPDATE OF category_id, price_cents, date ON expense_items BEGIN
+    UPDATE monthly_totals SET total_cents = total_cents - old.price_cents, row_count = row_count - 1
+    WHERE year = CAST(substr(old.date, 1, 4) AS INTEGER) AND month = CAST(substr(old.date, 6, 2) AS INTEGER);
+    DELETE FROM monthly_totals WHERE year = CAST(substr(old.date, 1, 4) AS INTEGER) AND month = CAST(substr(old.date, 6, 2) AS INTEGER) AND row_count = 0;
+    UPDATE monthly_category_totals SET total_cents = total_cents - old.price_cents, row_count = row_count - 1
+    WHERE year = CAST(substr(old.date, 1, 4) AS INTEGER) AND month = CAST(substr(old.date, 6, 2) AS INTEGER) AND category = (SELECT name FROM categories WHERE category_id = old.category_id);
+    DELETE FROM monthly_category_totals WHERE year = CAST(substr(old.date, 1, 4) AS INTEGER) AND month = CAST(substr(old.date, 6, 2) AS INTEGER) AND category = (SELECT name FROM categories WHERE category_id = old.category_id) AND row_count = 0;
+    INSERT INTO monthly_totals (year, month, total_cents, row_count)
+    VALUES (CAST(substr(new.date, 1, 4) AS INTEGER), CAST(substr(new.date, 6, 2) AS INTEGER), new.price_cents, 1)
+    ON CONFLICT (year, month) DO UPDATE SET total_cents = total_cents + excluded.total_cents, row_count = row_count + 1;
+    INSERT INTO monthly_category_totals (year, month, category, total_cents, row_count)
+    VALUES (CAST(substr(new.date, 1, 4) AS INTEGER), CAST(substr(new.date, 6, 2) AS INTEGER), (SELECT name FROM categories WHERE category_id = new.category_id), new.price_cents, 1)
+    ON CONFLICT (year, month, category) DO UPDATE SET total_cents = total_cents + excluded.total_cents, row_count = row_count + 1;
+END;
+
+-- Left alone on databases with archived years, as in init.sql
+DELETE FROM monthly_totals WHERE NOT EXISTS (SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'archives');
+INSERT INTO monthly_totals (year, month, total_cents, row_count)
+SELECT CAST(substr(date, 1, 4) AS INTEGER), CAST(substr(date, 6, 2) AS INTEGER), SUM(price_cents), COUNT(*)
+FROM expense_items WHERE NOT EXISTS (SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'archives') GROUP BY 1, 2;
+DELETE FROM monthly_category_totals WHERE NOT EXISTS (SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'archives');
+INSERT INTO monthly_category_totals (year, month, category, total_cents, row_count)
+SELECT CAST(substr(date, 1, 4) AS INTEGER), CAST(substr(date, 6, 2) AS INTEGER), expense, SUM(price_cents), COUNT(*)
+FROM expenses WHERE NOT EXISTS (SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'archives') GROUP BY 1, 2, 3;
@@ -0,0 +1,1343 @@
+"""Tests for ExpensesDatabaseClient; run from this directory with python -m pytest (or python -m unittest).
+
+The tests of the GUI table model run without a display and are skipped when PyQt5 is not installed,
+like the columnar analytics tests without NumPy.
+"""
+import asyncio
+import base64
+import gzip
+import io
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+from decimal import Decimal
+from unittest import mock
+
+import DB_Benchmark
+import DB_CLI
+from DB_AsyncClient import AsyncExpensesDatabaseClient
+from DB_Client import ExpensesDatabaseClient, PooledExpensesDatabaseClient, QueryCache
+from DB_Instrumentation import CallbackSink, JsonlSink, MemorySink, QueryInstrumentation
+from DB_Transfer import export_expenses, import_expenses
+
+try:
+    import numpy as np
+    import DB_Analytics
+except ImportError:
+    np = None
+
+try:
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication
+except ImportError:
+    QApplication = None
+
+class FailedWriteTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.client = ExpensesDatabaseClient(os.path.join(self.tmp.name, "expenses.db"), normalize=True)
+        self.exp_id = self.client.create_expense("Rent", "500.00", "2024-01-01")
+    def tearDown(self):
+        self.client.close()
+        self.tmp.cleanup()
+    def test_failed_writes_release_the_write_lock(self):
+        failures = (
+            lambda: self.client.create_expense(None, "1.00", "2024-01-02"),
+            lambda: self.client.create_expense("Fuel", "1.00", None),
+            lambda: self.client.update_expense(self.exp_id, expense="Gym", price="0.001"),
+        )
+        for failure in failures:
+            with self.assertRaises((sqlite3.Error, ValueError)):
+                failure()
+            self.assertFalse(self.client.connection.in_transaction)
+        with ExpensesDatabaseClient(self.client.db_name) as other:
+            other.create_expense("Fuel", "40.00", "2024-01-03")
+        with self.client.transaction():
+            self.client.create_expense("Coffee", "3.20", "2024-01-04")
+        self.assertEqual([row[1] for row in self.client.search_expenses(limit=-1)], ["Rent", "Fuel", "Coffee"])
+        # The category added by the failed update was rolled back with it
+        self.assertIsNone(self.client.connection.execute("SELECT 1 FROM categories WHERE name = 'Gym';").fetchone())
+
+class NoDateColumnTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmp.name, "expenses.db")
+        # The layout of files from before the date column, like the shipped expenses.db
+        with sqlite3.connect(path) as connection:
+            connection.execute("CREATE TABLE expenses (exp_id INTEGER PRIMARY KEY AUTOINCREMENT, expense TEXT NOT NULL, price REAL NOT NULL);")
+            connection.executemany("INSERT INTO expenses (expense, price) VALUES (?, ?);", [("Rent", 500.0), ("Fuel", 40.5)])
+        connection.close()
+        ExpensesDatabaseClient.migrate_prices_to_cents(path)
+        self.client = ExpensesDatabaseClient(path, cache=QueryCache())
+    def tearDown(self):
+        self.client.close()
+        self.tmp.cleanup()
+    def test_writes_invalidate_cached_reads(self):
+        self.assertFalse(self.client.has_date)
+        self.assertEqual(len(self.client.read_all_expenses(10)), 2)
+        self.client.update_expense(1, price="450.00")
+        self.assertEqual(self.client.read_all_expenses(10)[0], (1, "Rent", Decimal("450.00")))
+        self.client.delete_expense(2)
+        self.assertEqual(self.client.read_all_expenses(10), [(1, "Rent", Decimal("450.00"))])
+    def test_rolled_back_writes_leave_no_cached_reads(self):
+        with self.assertRaises(RuntimeError):
+            with self.client.transaction():
+                self.client.create_expense("Coffee", "3.20", None)
+                self.assertEqual(len(self.client.read_all_expenses(10)), 3)
+                raise RuntimeError("abandon the block")
+        self.assertEqual(len(self.client.read_all_expenses(10)), 2)
+    def test_bulk_inserts_are_refused_up_front(self):
+        with self.assertRaisesRegex(ValueError, "no date column"):
+            self.client.create_expenses_bulk([("Coffee", "3.20", "2024-01-01")])
+        self.assertFalse(self.client.connection.in_transaction)
+        self.assertEqual(self.client.create_expense("Coffee", "3.20", None), 3)
+
+class LegacyPriceTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "expenses.db")
+        # The layout of files from before prices were stored in cents
+        with sqlite3.connect(self.path) as connection:
+            connection.execute("CREATE TABLE expenses (exp_id INTEGER PRIMARY KEY AUTOINCREMENT, expense TEXT NOT NULL, price REAL NOT NULL, date DATE NOT NULL);")
+            connection.executemany("INSERT INTO expenses (expense, price, date) VALUES (?, ?, ?);", [
+                ("Rent", 500.0, "2024-01-01"), ("Fuel", 40.1, "2024-01-15"), ("Gym", 0.3, "2024-02-01"),
+            ])
+        connection.close()
+    def tearDown(self):
+        self.tmp.cleanup()
+    def columns(self):
+        with sqlite3.connect(self.path) as connection:
+            columns = [row[1] for row in connection.execute("PRAGMA table_info(expenses);")]
+        connection.close()
+        return columns
+    def test_old_files_are_read_but_not_changed_until_migrated(self):
+        with ExpensesDatabaseClient(self.path) as client:
+            self.assertTrue(client.legacy_prices)
+            self.assertEqual(client.read_expense(2), (2, "Fuel", Decimal("40.10"), "2024-01-15"))
+            self.assertEqual(client.total_expenses(year=2024, month=1), Decimal("540.10"))
+            with self.assertRaisesRegex(sqlite3.OperationalError, "migrate_prices_to_cents"):
+                client.create_expense("Coffee", "3.20", "2024-02-02")
+            with self.assertRaisesRegex(sqlite3.OperationalError, "migrate_prices_to_cents"):
+                client.update_expense(1, price="450.00")
+        with ExpensesDatabaseClient(self.path, read_only=True) as client:
+            self.assertEqual(len(client.search_expenses(year=2024)), 3)
+        self.assertIn("price", self.columns())
+        stats = ExpensesDatabaseClient.migrate_prices_to_cents(self.path)
+        self.assertEqual(stats["migrated"], 3)
+        self.assertEqual(self.columns(), ["exp_id", "expense", "price_cents", "date"])
+        with ExpensesDatabaseClient(self.path) as client:
+            self.assertFalse(client.legacy_prices)
+            client.update_expense(1, price="450.00")
+            self.assertEqual(client.total_expenses(), Decimal("490.40"))
+    def test_vacuum_keeps_reading_the_old_prices(self):
+        with sqlite3.connect(self.path) as connection:
+            connection.execute("CREATE INDEX idx_price ON expenses(price);")
+        connection.close()
+        with ExpensesDatabaseClient(self.path) as client:
+            self.assertIn("bytes_after", client.vacuum())
+            self.assertEqual(client.read_expense(2), (2, "Fuel", Decimal("40.10"), "2024-01-15"))
+            with self.assertRaisesRegex(sqlite3.OperationalError, "migrate_prices_to_cents"):
+                client.delete_expense(1)
+        self.assertIn("price", self.columns())
+    def test_every_pooled_connection_sees_the_old_prices(self):
+        client = PooledExpensesDatabaseClient(self.path, pool_size=4)
+        try:
+            totals = []
+            threads = [threading.Thread(target=lambda: totals.append(client.total_expenses())) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(totals, [Decimal("540.40")] * 3)
+        finally:
+            client.close()
+    def test_fractions_of_a_cent_need_rounding_to_be_allowed(self):
+        with sqlite3.connect(self.path) as connection:
+            connection.execute("UPDATE expenses SET price = 0.305 WHERE exp_id = 3;")
+        connection.close()
+        # Opening the file is fine; only the migration has to decide what to do with the fraction
+        with ExpensesDatabaseClient(self.path) as client:
+            self.assertEqual(len(client.search_expenses()), 3)
+        with self.assertRaisesRegex(ValueError, "allow_rounding"):
+            ExpensesDatabaseClient.migrate_prices_to_cents(self.path)
+        self.assertEqual(ExpensesDatabaseClient.migrate_prices_to_cents(self.path, allow_rounding=True)["rounded"], 1)
+        with ExpensesDatabaseClient(self.path) as client:
+            self.assertEqual(client.read_expense(3)[2], Decimal("0.31"))
+    def test_prices_are_decoded_by_the_client_only(self):
+        self.assertNotIn("CENTS", sqlite3.converters)
+        ExpensesDatabaseClient.migrate_prices_to_cents(self.path)
+        with ExpensesDatabaseClient(self.path) as client:
+            self.assertEqual(client.summarize_expenses(), [(None, Decimal("540.40"), 3, Decimal("180.133333333333"))])
+        with sqlite3.connect(self.path) as connection:
+            self.assertEqual(connection.execute('SELECT price_cents AS "price [cents]" FROM expenses WHERE exp_id = 2;').fetchone(), (4010,))
+        connection.close()
+
+class SeekPageTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.client = ExpensesDatabaseClient(os.path.join(self.tmp.name, "expenses.db"))
+        # Ids run against the dates, so date order and exp_id order disagree
+        self.client.create_expenses_bulk((f"Rent {i}", "10.50", f"{2023 + i % 2}-{12 - i % 12:02d}-01") for i in range(300))
+    def tearDown(self):
+        self.client.close()
+        self.tmp.cleanup()
+    def walk(self, **filters):
+        rows, cursor = self.client.search_expenses_page(limit=7, **filters)
+        while cursor is not None:
+            page, cursor = self.client.search_expenses_page(limit=7, cursor=cursor, **filters)
+            rows += page
+        return rows
+    def test_date_filtered_pages_follow_the_date(self):
+        expected = sorted(self.client.search_expenses(year=2024, limit=-1), key=lambda row: (row[3], row[0]))
+        self.assertEqual(self.walk(year=2024), expected)
+        self.client.archive_years(2024)
+        self.assertEqual(self.walk(year=2023, expense="Rent"), sorted(self.client.search_expenses(year=2023, limit=-1), key=lambda row: (row[3], row[0])))
+        self.assertEqual(self.walk(date_from="2023-06-01", date_to="2024-06-01"), sorted(self.client.search_expenses(date_from="2023-06-01", date_to="2024-06-01", limit=-1), key=lambda row: (row[3], row[0])))
+    def test_pages_without_date_filters_follow_exp_id(self):
+        self.assertEqual(self.walk(), self.client.search_expenses(limit=-1))
+        self.assertEqual(self.walk(expense="Rent 1"), sorted(self.client.search_expenses(expense="Rent 1", limit=-1)))
+        rows, cursor = self.client.read_expenses_page(100)
+        self.assertEqual([row[0] for row in rows], list(range(1, 101)))
+        self.assertEqual(self.client.read_expenses_page(100, cursor)[0][0][0], 101)
+    def test_cursors_issued_before_date_ordering_still_work(self):
+        # The v1 tokens of the first keyset pages: base64 of "v1:<exp_id>"
+        cursor = base64.urlsafe_b64encode(b"v1:42").decode()
+        self.assertEqual(self.client._decode_cursor(cursor), (None, 42))
+        rows, _ = self.client.read_expenses_page(3, cursor)
+        self.assertEqual([row[0] for row in rows], [43, 44, 45])
+        rows, _ = self.client.search_expenses_page(expense="Rent", limit=3, cursor=cursor)
+        self.assertEqual([row[0] for row in rows], [43, 44, 45])
+    def test_malformed_cursors_are_refused(self):
+        for cursor in ("not base64!", base64.urlsafe_b64encode(b"v3:1").decode(), base64.urlsafe_b64encode(b"v2::7").decode()):
+            with self.assertRaisesRegex(ValueError, "Invalid pagination cursor"):
+                self.client.read_expenses_page(3, cursor)
+    def test_cursors_do_not_cross_orderings(self):
+        _, cursor = self.client.search_expenses_page(year=2024, limit=7)
+        with self.assertRaisesRegex(ValueError, "other date filters"):
+            self.client.search_expenses_page(limit=7, cursor=cursor)
+        _, cursor = self.client.read_expenses_page(7)
+        with self.assertRaisesRegex(ValueError, "other date filters"):
+            self.client.search_expenses_page(year=2024, limit=7, cursor=cursor)
+
+class DateFilterTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.client = ExpensesDatabaseClient(os.path.join(self.tmp.name, "expenses.db"))
+        self.client.create_expenses_bulk([
+            ("Rent", "500.00", "2023-12-31"), ("Fuel", "40.00", "2024-01-01"), ("Gym", "30.00", "2024-01-31"),
+            ("Coffee", "3.20", "2024-02-01"), ("Books", "12.00", "2024-12-31"), ("Cinema", "9.50", "2025-01-01"),
+        ])
+    def tearDown(self):
+        self.client.close()
+        self.tmp.cleanup()
+    def names(self, **filters):
+        return [row[1] for row in self.client.search_expenses(limit=-1, **filters)]
+    def test_years_and_months_include_their_first_and_last_day(self):
+        self.assertEqual(self.names(year=2024), ["Fuel", "Gym", "Coffee", "Books"])
+        self.assertEqual(self.names(year=2024, month=1), ["Fuel", "Gym"])
+        self.assertEqual(self.names(year=2024, month=12), ["Books"])
+        self.assertEqual(self.names(month=12), ["Rent", "Books"])
+        with self.assertRaisesRegex(ValueError, "month must be between 1 and 12"):
+            self.client.search_expenses(year=2024, month=13)
+    def test_date_ranges_are_half_open(self):
+        self.assertEqual(self.names(date_from="2024-01-01", date_to="2024-02-01"), ["Fuel", "Gym"])
+        self.assertEqual(self.names(date_from="2024-12-31"), ["Books", "Cinema"])
+        self.assertEqual(self.names(date_to="2024-01-01"), ["Rent"])
+    def test_year_searches_use_the_date_index(self):
+        source, filters, values = self.client._filtered_source(year=2024, record=False)
+        plan = self.client.cursor.execute(f"EXPLAIN QUERY PLAN SELECT * FROM {source} WHERE " + " AND ".join(filters), values).fetchall()
+        self.assertIn("idx_date_price", " ".join(row[-1] for row in plan))
+
+class IndexAdviceTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.client = ExpensesDatabaseClient(os.path.join(self.tmp.name, "expenses.db"))
+        self.client.create_expenses_bulk((f"Coffee {i % 40}", "3.20", f"2024-{i % 12 + 1:02d}-01") for i in range(2000))
+        self.client.query_shapes.clear()
+    def tearDown(self):
+        self.client.close()
+        self.tmp.cleanup()
+    def advice(self, index: str) -> str:
+        return {entry["index"]: entry["action"] for entry in self.client.advise_indexes()}[index]
+    def test_like_searches_do_not_keep_idx_expense(self):
+        for i in range(300):
+            self.client.search_expenses(expense=f"offee {i % 40}")
+        plan = self.client.cursor.execute("EXPLAIN QUERY PLAN SELECT * FROM expenses WHERE expense LIKE '%offee%';").fetchall()
+        self.assertNotIn("idx_expense", " ".join(row[-1] for row in plan))
+        self.assertEqual(self.advice("idx_expense"), "drop")
+        self.assertEqual(self.client.apply_index_advice(), ["idx_expense", "idx_price"])
+        for i in range(300):
+            self.client.search_expenses(expense=f"offee {i % 40}")
+        self.assertEqual(self.advice("idx_expense"), "none")
+    def test_grouping_by_name_keeps_idx_expense(self):
+        for _ in range(300):
+            self.client.summarize_expenses(group_by="expense", expense="Coffee")
+        self.assertEqual(self.advice("idx_expense"), "keep")
+    def test_month_heavy_reads_create_idx_month(self):
+        for i in range(300):
+            self.client.search_expenses(month=i % 12 + 1)
+        self.assertEqual(self.advice("idx_month"), "create")
+        self.assertIn("idx_month", self.client.apply_index_advice())
+        plan = self.client.cursor.execute("EXPLAIN QUERY PLAN SELECT * FROM expenses WHERE strftime('%m', date) = '03';").fetchall()
+        self.assertIn("idx_month", " ".join(row[-1] for row in plan))
+        self.assertEqual(len(self.client.search_expenses(month=3, limit=500)), 167)
+    def test_too_few_reads_drop_nothing(self):
+        for _ in range(10):
+            self.client.search_expenses(year=2024)
+        self.assertNotIn("drop", {entry["action"] for entry in self.client.advise_indexes()})
+
+class TuningProfileTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "expenses.db")
+    def tearDown(self):
+        self.tmp.cleanup()
+    def pragmas(self, client):
+        return {pragma: client.connection.execute(f"PRAGMA {pragma};").fetchone()[0] for pragma in ("journal_mode", "synchronous", "cache_size", "temp_store")}
+    def test_profiles_set_their_pragmas(self):
+        with ExpensesDatabaseClient(self.path, profile="bulk-load") as client:
+            self.assertEqual(self.pragmas(client), {"journal_mode": "wal", "synchronous": 0, "cache_size": -262144, "temp_store": 2})
+            client.apply_profile("interactive")
+            self.assertEqual(client.profile, "interactive")
+            self.assertEqual(self.pragmas(client)["synchronous"], 1)
+            with self.assertRaisesRegex(ValueError, "profile"):
+                client.apply_profile("fastest")
+        # Read-only clients keep the journal settings to the writers
+        with ExpensesDatabaseClient(self.path, read_only=True) as client:
+            self.assertEqual(client.profile, "read-mostly")
+            self.assertEqual(self.pragmas(client)["cache_size"], -65536)
+    def test_optimize_runs_on_schedule(self):
+        with ExpensesDatabaseClient(self.path, optimize_every=3600) as client:
+            client.create_expense("Rent", "500.00", "2024-01-01")
+            client.search_expenses()
+            self.assertIsNone(client.connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1';").fetchone())
+            client._next_optimize = time.monotonic() - 1
+            client.search_expenses()
+            self.assertIsNotNone(client.connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1';").fetchone())
+            self.assertGreater(client._next_optimize, time.monotonic() + 3000)
+            with self.assertRaisesRegex(sqlite3.OperationalError, "transaction"):
+                with client.transaction():
+                    client.optimize()
+        with self.assertRaisesRegex(ValueError, "optimize_every"):
+            ExpensesDatabaseClient(self.path, optimize_every=0)
+
+class ArchiveTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.client = ExpensesDatabaseClient(os.path.join(self.tmp.name, "expenses.db"))
+        self.client.create_expenses_bulk((f"Rent {i % 3}", "10.50", f"{2000 + i % 25}-{i % 12 + 1:02d}-01") for i in range(1000))
+    def tearDown(self):
+        self.client.close()
+        self.tmp.cleanup()
+    def test_archives_beyond_the_attach_limit_are_merged(self):
+        rows = sorted(self.client.search_expenses(limit=-1))
+        total = self.client.total_expenses(expense="Rent 1")
+        for year in range(2001, 2001 + ExpensesDatabaseClient.MAX_ATTACHED_ARCHIVES + 3):
+            self.client.archive_years(year, compress=year % 2 == 0)
+        self.assertEqual(len(self.client._load_archives()), ExpensesDatabaseClient.MAX_ATTACHED_ARCHIVES)
+        self.assertEqual(len([name for name in os.listdir(self.tmp.name) if "-archive-" in name]), ExpensesDatabaseClient.MAX_ATTACHED_ARCHIVES)
+        self.assertEqual(sorted(self.client.search_expenses(limit=-1)), rows)
+        self.assertEqual(self.client.total_expenses(expense="Rent 1"), total)
+        self.assertEqual(self.client.rebuild_monthly_totals()["drifted"], 0)
+    def test_archived_expenses_cannot_be_changed(self):
+        archived = self.client.search_expenses(year=2000, limit=1)[0]
+        self.client.archive_years(2001)
+        with self.assertRaisesRegex(sqlite3.OperationalError, "archived"):
+            self.client.update_expense(archived[0], price="1.00")
+        with self.assertRaisesRegex(sqlite3.OperationalError, "archived"):
+            self.client.delete_expense(archived[0])
+        self.assertEqual(self.client.read_expense(archived[0]), archived)
+        # Ids that never existed are still ignored
+        self.client.delete_expense(10**6)
+    def test_snapshots_carry_their_archives(self):
+        self.client.archive_years(2010)
+        self.client.archive_years(2015, compress=False)
+        rows = sorted(self.client.search_expenses(limit=-1))
+        path = os.path.join(self.tmp.name, "reports", "report.db")
+        os.mkdir(os.path.dirname(path))
+        self.assertEqual(ExpensesDatabaseClient.create_snapshot(self.client.db_name, path)["archives"], 2)
+        with ExpensesDatabaseClient.open_snapshot(path) as report:
+            self.assertEqual(sorted(report.search_expenses(limit=-1)), rows)
+        # Refreshing it finds the archives already in place
+        self.assertEqual(ExpensesDatabaseClient.create_snapshot(self.client.db_name, path)["archives"], 0)
+    def test_ranked_search_lists_archived_matches_after_live_ones(self):
+        if not self.client.fts_enabled:
+            self.skipTest("SQLite was built without FTS5")
+        self.client.create_expense("Rent deposit", "900.00", "2001-06-01")
+        self.client.create_expense("Rent deposit", "950.00", "2024-06-01")
+        matches = self.client.search_expenses_ranked("ren dep", limit=-1)
+        self.client.archive_years(2010)
+        self.assertEqual(self.client.search_expenses_ranked("ren dep", limit=-1), [row for row in matches if row[3] >= "2010"] + [row for row in matches if row[3] < "2010"])
+        self.assertEqual(len(self.client.search_expenses_ranked("rent", limit=-1)), 1002)
+        self.assertEqual(self.client.search_expenses_ranked("rent", limit=5, offset=1000), self.client.search_expenses_ranked("rent", limit=-1)[1000:])
+    def test_other_clients_see_archives_at_once(self):
+        with ExpensesDatabaseClient(self.client.db_name) as other:
+            rows = sorted(other.search_expenses(limit=-1))
+            year_2000 = sorted(other.search_expenses(year=2000, limit=-1))
+            summary = other.summarize_expenses(group_by="year", date_from="2000-01-01")
+            self.client.archive_years(2002)
+            self.assertEqual(sorted(other.search_expenses(limit=-1)), rows)
+            self.assertEqual(sorted(other.search_expenses(year=2000, limit=-1)), year_2000)
+            self.assertEqual(other.summarize_expenses(group_by="year", date_from="2000-01-01"), summary)
+            with self.assertRaisesRegex(sqlite3.OperationalError, "archived"):
+                other.delete_expense(year_2000[0][0])
+
+    def test_archive_path_numbers_default_names_and_refuses_existing_ones(self):
+        stem = os.path.join(self.tmp.name, "expenses-archive-2000-2001")
+        self.assertEqual(self.client._archive_path("2000-01-01", "2001-12-01", None, True), stem + ".db.gz")
+        open(stem + ".db.gz", "wb").close()
+        self.assertEqual(self.client._archive_path("2000-01-01", "2001-12-01", None, True), stem + "-2.db.gz")
+        self.assertEqual(self.client._archive_path("2000-01-01", "2001-12-01", None, False), stem + ".db")
+        with self.assertRaises(FileExistsError):
+            self.client._archive_path("2000-01-01", "2001-12-01", stem + ".db.gz", False)
+    def test_export_copies_only_rows_before_the_cutoff(self):
+        old = sorted(self.client.search_expenses(year=2000, limit=-1))
+        raw = os.path.join(self.tmp.name, "export.db")
+        self.client._export_archive(raw, "2001-01-01", [])
+        with sqlite3.connect(raw) as archive:
+            self.assertEqual(archive.execute("SELECT COUNT(*) FROM expenses;").fetchone()[0], len(old))
+            self.assertEqual([row[0] for row in archive.execute("SELECT exp_id FROM expenses ORDER BY exp_id;")], [row[0] for row in old])
+        archive.close()
+        # The live table keeps every row until the purge
+        self.assertEqual(len(self.client.search_expenses(limit=-1)), 1000)
+    def test_write_archive_gzips_or_moves_the_export(self):
+        raw = os.path.join(self.tmp.name, "export.db")
+        self.client._export_archive(raw, "2001-01-01", [])
+        with open(raw, "rb") as source:
+            content = source.read()
+        path = os.path.join(self.tmp.name, "archive.db.gz")
+        self.assertEqual(ExpensesDatabaseClient._write_archive(raw, path, True), raw)
+        with gzip.open(path, "rb") as packed:
+            self.assertEqual(packed.read(), content)
+        self.assertFalse(os.path.exists(raw + ".gz"))
+        path = os.path.join(self.tmp.name, "archive.db")
+        self.assertEqual(ExpensesDatabaseClient._write_archive(raw, path, False), path)
+        self.assertFalse(os.path.exists(raw))
+        with open(path, "rb") as moved:
+            self.assertEqual(moved.read(), content)
+    def test_check_archive_refuses_rows_changed_after_the_export(self):
+        raw = os.path.join(self.tmp.name, "export.db")
+        version = self.client._export_archive(raw, "2001-01-01", [])
+        count = len(self.client.search_expenses(year=2000, limit=-1))
+        self.client.cursor.execute("ATTACH DATABASE ? AS archive_new;", (raw,))
+        try:
+            with self.client.transaction():
+                self.client._check_archive("2001-01-01", count, version)
+            with ExpensesDatabaseClient(self.client.db_name) as other:
+                other.update_expense(self.client.search_expenses(year=2000, limit=1)[0][0], price="1.00")
+            with self.assertRaisesRegex(sqlite3.OperationalError, "run archive_years again"):
+                with self.client.transaction():
+                    self.client._check_archive("2001-01-01", count, version)
+        finally:
+            self.client.cursor.execute("DETACH DATABASE archive_new;")
+    def test_register_archive_replaces_the_merged_ones(self):
+        with self.client.transaction():
+            first = self.client._register_archive("2000-01-01", "2000-12-01", "a.db.gz", 40, True, [])
+        merged = self.client._load_archives()
+        with self.client.transaction():
+            second = self.client._register_archive("2000-01-01", "2001-12-01", "b.db", 80, False, merged)
+        self.assertGreater(second, first)
+        self.assertEqual(
+            self.client._load_archives(),
+            [{"archive_id": second, "first_date": "2000-01-01", "last_date": "2001-12-01", "path": "b.db", "row_count": 80, "compressed": 0}]
+        )
+    def test_purge_keeps_archived_rows_in_the_rollup(self):
+        totals = self.client.cursor.execute("SELECT * FROM monthly_totals ORDER BY year, month;").fetchall()
+        with self.client.transaction():
+            self.client._purge_archived_rows("2001-01-01")
+        self.assertEqual(self.client.search_expenses(year=2000, limit=-1), [])
+        self.assertEqual(len(self.client.search_expenses(limit=-1)), 960)
+        self.assertEqual(self.client.cursor.execute("SELECT * FROM monthly_totals ORDER BY year, month;").fetchall(), totals)
+        # Deletes of live rows still reach the rollup
+        self.client.delete_expense(self.client.search_expenses(year=2001, limit=1)[0][0])
+        self.assertNotEqual(self.client.cursor.execute("SELECT * FROM monthly_totals ORDER BY year, month;").fetchall(), totals)
+class BulkInsertTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.client = ExpensesDatabaseClient(os.path.join(self.tmp.name, "expenses.db"))
+    def tearDown(self):
+        self.client.close()
+        self.tmp.cleanup()
+    def test_batches_report_their_id_ranges(self):
+        report = self.client.create_expenses_bulk(((f"Item {i}", "1.25", "2024-01-01") for i in range(25)), batch_size=10)
+        self.assertEqual(report, {"inserted": 25, "batches": 3, "id_ranges": [(1, 10), (11, 20), (21, 25)]})
+        self.assertEqual(self.client.total_expenses(), Decimal("31.25"))
+    def test_a_failing_batch_is_rolled_back_alone(self):
+        rows = [("Rent", "500.00", "2024-01-01"), ("Fuel", "40.00", "2024-01-02"), ("Gym", "30.00", "2024-01-03"), (None, "1.00", "2024-01-04")]
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.client.create_expenses_bulk(rows, batch_size=2)
+        self.assertFalse(self.client.connection.in_transaction)
+        # The first batch was committed; no row of the failing one was
+        self.assertEqual([row[1] for row in self.client.search_expenses(limit=-1)], ["Rent", "Fuel"])
+    def test_bad_prices_are_refused_before_their_batch(self):
+        with self.assertRaisesRegex(ValueError, "whole number of cents"):
+            self.client.create_expenses_bulk([("Rent", "500.00", "2024-01-01"), ("Fuel", "0.001", "2024-01-02")])
+        self.assertEqual(self.client.search_expenses(limit=-1), [])
+    def test_set_wise_indexing_matches_the_triggers(self):
+        rows = [(f"Coffee {i % 7}", "3.20", f"2024-{i % 12 + 1:02d}-01") for i in range(ExpensesDatabaseClient.SET_WISE_INDEXING_ROWS * 2)]
+        self.client.create_expenses_bulk(rows, batch_size=len(rows), set_wise_indexing=True)
+        self.assertEqual(self.client.rebuild_monthly_totals()["drifted"], 0)
+        if self.client.fts_enabled:
+            self.assertEqual(len(self.client.search_expenses_ranked("coffee", limit=-1)), len(rows))
+        triggers = {row[0] for row in self.client.cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger';")}
+        self.assertIn("monthly_totals_ai", triggers)
+
+class FullTextTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.client = ExpensesDatabaseClient(os.path.join(self.tmp.name, "expenses.db"))
+        if not self.client.fts_enabled:
+            self.skipTest("SQLite was built without FTS5")
+        self.coffee = self.client.create_expense("Coffee at Starbucks", "3.20", "2024-01-01")
+        self.client.create_expense("Coffee beans", "12.00", "2024-01-02")
+    def tearDown(self):
+        self.client.close()
+        self.tmp.cleanup()
+    def matches(self, text):
+        return [row[1] for row in self.client.search_expenses(expense=text, full_text=True, limit=-1)]
+    def test_terms_are_word_prefixes(self):
+        self.assertEqual(self.matches("cof star"), ["Coffee at Starbucks"])
+        self.assertEqual(self.matches("coffee"), ["Coffee at Starbucks", "Coffee beans"])
+        # Quoted, so FTS5 syntax in the input is taken as text instead of failing the query
+        self.assertEqual(self.matches('"bean AND'), [])
+        self.assertEqual(self.matches('"bean'), ["Coffee beans"])
+    def test_triggers_follow_updates_and_deletes(self):
+        self.client.update_expense(self.coffee, expense="Tea at Starbucks")
+        self.assertEqual(self.matches("coffee"), ["Coffee beans"])
+        self.assertEqual(self.matches("tea"), ["Tea at Starbucks"])
+        self.client.delete_expense(self.coffee)
+        self.assertEqual(self.matches("starbucks"), [])
+        # Fails if the index and the expenses table disagree
+        self.client.cursor.execute("INSERT INTO expenses_fts(expenses_fts, rank) VALUES ('integrity-check', 1);")
+    def test_rows_written_before_the_index_existed_are_indexed_on_open(self):
+        self.client.cursor.execute("DROP TABLE expenses_fts;")
+        self.client.connection.commit()
+        with ExpensesDatabaseClient(self.client.db_name) as reopened:
+            self.assertEqual(len(reopened.search_expenses_ranked("coffee", limit=-1)), 2)
+
+class PooledClientTest(unittest.TestCase):
+    WRITERS = 3
+    READERS = 4
+    WRITES = 150
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.client = PooledExpensesDatabaseClient(os.path.join(self.tmp.name, "expenses.db"), pool_size=self.WRITERS + self.READERS + 1, timeout=10.0)
+    def tearDown(self):
+        self.client.close()
+        self.tmp.cleanup()
+    def test_concurrent_writers_and_readers(self):
+        errors = []
+        writing = threading.Barrier(self.WRITERS + self.READERS)
+        writers_left = [self.WRITERS]
+        lock = threading.Lock()
+        def writer(index):
+            try:
+                writing.wait()
+                for i in range(self.WRITES):
+                    self.client.create_expense(f"Writer {index}", "1.00", f"2024-{i % 12 + 1:02d}-01")
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                with lock:
+                    writers_left[0] -= 1
+                self.client.release_connection()
+        def reader():
+            seen = 0
+            try:
+                writing.wait()
+                while writers_left[0]:
+                    # Committed rows never disappear, so the count can only grow
+                    count = self.client.summarize_expenses()[0][2]
+                    self.assertGreaterEqual(count, seen)
+                    seen = count
+                    self.client.search_expenses(year=2024, month=6, limit=20)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                self.client.release_connection()
+        threads = [threading.Thread(target=writer, args=(i,)) for i in range(self.WRITERS)]
+        threads += [threading.Thread(target=reader) for _ in range(self.READERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(60)
+        self.assertFalse(any(thread.is_alive() for thread in threads))
+        # "database is locked" would show up here as an OperationalError
+        self.assertEqual(errors, [])
+        self.assertEqual(self.client.summarize_expenses()[0][2], self.WRITERS * self.WRITES)
+        self.assertEqual(self.client.summarize_expenses(group_by="expense")[0][2], self.WRITES)
+        self.assertEqual(self.client.connection.execute("PRAGMA journal_mode;").fetchone()[0], "wal")
+    def test_connections_go_back_to_the_pool(self):
+        def read():
+            self.client.search_expenses()
+            # The thread exits without releasing; its lease is returned when the thread-local dies
+        for _ in range(self.client.pool.max_connections * 2):
+            thread = threading.Thread(target=read)
+            thread.start()
+            thread.join()
+        # Would wait for the timeout and raise if the exited threads still held their connections
+        self.client.pool.release(self.client.pool.acquire())
+
+class AsyncClientTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = QueryCache()
+        self.client = AsyncExpensesDatabaseClient(os.path.join(self.tmp.name, "expenses.db"), workers=2, cache=self.cache, durability="full")
+    async def asyncTearDown(self):
+        await self.client.aclose()
+    def tearDown(self):
+        self.tmp.cleanup()
+    async def test_calls_run_on_the_pooled_client(self):
+        self.assertIs(self.client.client.cache, self.cache)
+        self.assertEqual(self.client.client.pool.synchronous, "FULL")
+        exp_ids = await asyncio.gather(*(self.client.create_expense(f"Item {i}", "2.50", f"2024-01-{i + 1:02d}") for i in range(20)))
+        self.assertEqual(sorted(exp_ids), list(range(1, 21)))
+        await self.client.update_expense(exp_ids[0], price="3.00")
+        await self.client.delete_expense(exp_ids[1])
+        self.assertEqual(len(await self.client.search_expenses(year=2024, limit=-1)), 19)
+        rows = [row async for row in self.client.iter_search(page_size=3, year=2024)]
+        self.assertEqual(len(rows), 19)
+        self.assertEqual(sum(row[2] for row in rows), Decimal("48.00"))
+    async def test_the_pool_size_follows_the_workers(self):
+        with self.assertRaisesRegex(ValueError, "workers"):
+            AsyncExpensesDatabaseClient(os.path.join(self.tmp.name, "other.db"), pool_size=4)
+
+class StreamingTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.client = ExpensesDatabaseClient(os.path.join(self.tmp.name, "expenses.db"))
+        self.client.create_expenses_bulk((f"Item {i % 5}", "1.10", f"2024-{i % 12 + 1:02d}-01") for i in range(250))
+    def tearDown(self):
+        self.client.close()
+        self.tmp.cleanup()
+    def test_iterators_return_what_the_searches_return(self):
+        self.assertEqual(list(self.client.iter_expenses(arraysize=7)), self.client.search_expenses(limit=-1))
+        # iter_search orders by exp_id; search_expenses has no ORDER BY
+        self.assertEqual(list(self.client.iter_search(expense="Item 3", year=2024, arraysize=7)), sorted(self.client.search_expenses(expense="Item 3", year=2024, limit=-1)))
+    def test_other_calls_can_run_mid_iteration(self):
+        rows = self.client.iter_expenses(arraysize=10)
+        first = next(rows)
+        self.client.search_expenses(year=2024, month=3)
+        self.client.update_expense(first[0], price="2.20")
+        self.assertEqual(len([first] + list(rows)), 250)
+    def test_arraysize_must_be_positive(self):
+        with self.assertRaisesRegex(ValueError, "arraysize"):
+            next(self.client.iter_expenses(arraysize=0))
+
+class SummaryTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.client = ExpensesDatabaseClient(os.path.join(self.tmp.name, "expenses.db"))
+        self.client.create_expenses_bulk([
+            ("Rent", "500.00", "2024-01-01"), ("Fuel", "40.10", "2024-01-15"), ("Fuel", "39.90", "2024-02-15"),
+            ("Rent", "500.00", "2024-02-01"), ("Gym", "0.10", "2025-02-01"),
+        ])
+    def tearDown(self):
+        self.client.close()
+        self.tmp.cleanup()
+    def test_groups(self):
+        self.assertEqual(self.client.summarize_expenses(), [(None, Decimal("1080.10"), 5, Decimal("216.02"))])
+        self.assertEqual(self.client.summarize_expenses(group_by="expense", year=2024), [
+            ("Fuel", Decimal("80.00"), 2, Decimal("40.00")), ("Rent", Decimal("1000.00"), 2, Decimal("500.00")),
+        ])
+        self.assertEqual([row[:3] for row in self.client.summarize_expenses(group_by="month")], [
+            ("2024-01", Decimal("540.10"), 2), ("2024-02", Decimal("539.90"), 2), ("2025-02", Decimal("0.10"), 1),
+        ])
+        self.assertEqual([row[:3] for row in self.client.summarize_expenses(group_by="year", expense="Fuel")], [("2024", Decimal("80.00"), 2)])
+        self.assertEqual([row[0] for row in self.client.summarize_expenses(group_by="day", month=2)], ["2024-02-01", "2024-02-15", "2025-02-01"])
+        with self.assertRaisesRegex(ValueError, "group_by"):
+            self.client.summarize_expenses(group_by="week")
+    def test_totals_are_exact(self):
+        self.client.create_expenses_bulk([("Coffee", "0.10", "2024-03-01")] * 3)
+        self.assertEqual(self.client.total_expenses(year=2024, month=3), Decimal("0.30"))
+        self.assertEqual(self.client.total_expenses(year=2030), Decimal("0.00"))
+    def test_the_rollup_and_the_rows_agree(self):
+        # Year/month summaries come from the rollup tables, the same ones with a date range from the rows
+        for group_by in (None, "month", "year", "expense"):
+            self.assertEqual(
+                self.client.summarize_expenses(group_by=group_by, year=2024),
+                self.client.summarize_expenses(group_by=group_by, date_from="2024-01-01", date_to="2025-01-01"),
+            )
+
+class UpdateTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.client = ExpensesDatabaseClient(os.path.join(self.tmp.name, "expenses.db"))
+        self.client.create_expenses_bulk([("Rent", "500.00", "2024-01-01"), ("Fuel", "40.10", "2024-02-15"), ("Gym", "30.00", "2024-03-01")])
+    def tearDown(self):
+        self.client.close()
+        self.tmp.cleanup()
+    def test_only_the_given_columns_are_written(self):
+        self.client.update_expense(1, price="450.00")
+        self.client.update_expense(2, expense="Petrol", date="2024-02-16")
+        self.assertEqual(self.client.read_expense(1), (1, "Rent", Decimal("450.00"), "2024-01-01"))
+        self.assertEqual(self.client.read_expense(2), (2, "Petrol", Decimal("40.10"), "2024-02-16"))
+    def test_columns_outside_the_whitelist_are_refused(self):
+        with self.assertRaisesRegex(ValueError, "exp_id"):
+            self.client.update_expenses_bulk([(1, {"price": "1.00"}), (2, {"exp_id": 9})])
+        with self.assertRaisesRegex(ValueError, "Invalid price"):
+            self.client.update_expense(1, price="abc")
+        self.assertEqual(self.client.read_expense(1)[2], Decimal("500.00"))
+    def test_bulk_updates_are_one_transaction(self):
+        self.assertEqual(self.client.update_expenses_bulk([
+            (1, {"price": "1.00"}), (2, {"price": "2.00"}), (3, {"expense": "Pool", "date": "2024-03-02"}), (99, {"price": "9.00"}),
+        ]), 3)
+        self.assertEqual([row[1:] for row in self.client.search_expenses(limit=5)], [
+            ("Rent", Decimal("1.00"), "2024-01-01"), ("Fuel", Decimal("2.00"), "2024-02-15"), ("Pool", Decimal("30.00"), "2024-03-02"),
+        ])
+        # A bad patch in a later batch undoes the batches already applied
+        self.client.UPDATE_BATCH_ROWS = 1
+        with self.assertRaises(ValueError):
+            self.client.update_expenses_bulk([(1, {"price": "5.00"}), (2, {"price": "0.001"})])
+        self.assertEqual(self.client.read_expense(1)[2], Decimal("1.00"))
+    def test_statements_come_from_a_fixed_set(self):
+        self.client.update_expenses_bulk((exp_id, {"price": str(exp_id)}) for exp_id in (1, 2, 3))
+        self.client.update_expense(1, price="7.00")
+        self.assertIs(
+            ExpensesDatabaseClient._update_sql("expenses", ("price",)),
+            ExpensesDatabaseClient._update_sql("expenses", ("price",)),
+        )
+        self.assertEqual(ExpensesDatabaseClient._update_sql("expenses", ("expense", "date")), "UPDATE expenses SET expense = ?, date = ? WHERE exp_id = ?;")
+
+class TransactionTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.client = ExpensesDatabaseClient(os.path.join(self.tmp.name, "expenses.db"))
+        self.client.create_expense("Rent", "500.00", "2024-01-01")
+    def tearDown(self):
+        self.client.close()
+        self.tmp.cleanup()
+    def names(self):
+        with ExpensesDatabaseClient(self.client.db_name) as other:
+            return sorted(row[1] for row in other.search_expenses(limit=10))
+    def test_a_block_commits_once_at_the_end(self):
+        statements = []
+        self.client.connection.set_trace_callback(statements.append)
+        with self.client.transaction():
+            self.client.create_expense("Fuel", "40.10", "2024-02-15")
+            self.client.update_expense(1, price="450.00")
+            self.client.delete_expense(2)
+            self.client.create_expense("Gym", "30.00", "2024-03-01")
+            self.assertEqual(self.names(), ["Rent"])
+        self.client.connection.set_trace_callback(None)
+        self.assertEqual(len([sql for sql in statements if sql == "COMMIT"]), 1)
+        self.assertEqual(self.names(), ["Gym", "Rent"])
+    def test_an_inner_block_is_a_savepoint(self):
+        with self.client.transaction():
+            self.client.create_expense("Fuel", "40.10", "2024-02-15")
+            with self.assertRaises(ValueError):
+                with self.client.transaction():
+                    self.client.create_expense("Gym", "30.00", "2024-03-01")
+                    self.client.create_expense("Pool", "abc", "2024-03-02")
+        self.assertEqual(self.names(), ["Fuel", "Rent"])
+    def test_an_exception_undoes_the_whole_block(self):
+        with self.assertRaises(RuntimeError):
+            with self.client.transaction():
+                self.client.create_expense("Fuel", "40.10", "2024-02-15")
+                with self.client.transaction():
+                    self.client.update_expense(1, price="1.00")
+                raise RuntimeError("cancelled")
+        self.assertEqual(self.names(), ["Rent"])
+        self.assertEqual(self.client.read_expense(1)[2], Decimal("500.00"))
+    def test_durability_levels(self):
+        self.client.set_durability("normal")
+        self.assertEqual(self.client.connection.execute("PRAGMA journal_mode;").fetchone()[0], "wal")
+        self.assertEqual(self.client.connection.execute("PRAGMA synchronous;").fetchone()[0], 1)
+        with self.assertRaisesRegex(ValueError, "durability"):
+            self.client.set_durability("paranoid")
+    def test_options_are_keyword_only(self):
+        with self.assertRaises(TypeError):
+            ExpensesDatabaseClient(self.client.db_name, QueryCache())
+
+@unittest.skipIf(np is None, "NumPy is not installed")
+class ColumnsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.client = ExpensesDatabaseClient(os.path.join(self.tmp.name, "expenses.db"))
+        self.client.create_expenses_bulk([
+            ("Rent", "500.00", "2024-01-01"), ("Fuel", "40.10", "2024-01-15"), ("Fuel", "39.90", "2024-03-15"), ("Gym", "0.10", "2025-02-01"),
+        ])
+    def tearDown(self):
+        self.client.close()
+        self.tmp.cleanup()
+    def test_rows_come_back_as_arrays(self):
+        columns = self.client.fetch_columns(price_dtype="int64", year=2024, arraysize=2)
+        self.assertEqual(columns["exp_id"].tolist(), [1, 2, 3])
+        self.assertEqual(columns["price"].dtype, np.int64)
+        self.assertEqual(columns["price"].tolist(), [50000, 4010, 3990])
+        self.assertEqual(columns["date"].astype(str).tolist(), ["2024-01-01", "2024-01-15", "2024-03-15"])
+        self.assertEqual([columns["categories"][code] for code in columns["expense_code"]], ["Rent", "Fuel", "Fuel"])
+        self.assertEqual(self.client.fetch_columns(expense="Gym")["price"].tolist(), [0.1])
+        with self.assertRaisesRegex(ValueError, "price_dtype"):
+            self.client.fetch_columns(price_dtype="float32")
+    def test_analytics(self):
+        columns = self.client.fetch_columns(price_dtype="int64", year=2024)
+        months, totals = DB_Analytics.monthly_spend(columns)
+        self.assertEqual(months.astype(str).tolist(), ["2024-01", "2024-02", "2024-03"])
+        self.assertEqual(totals.tolist(), [54010, 0, 3990])
+        self.assertEqual(DB_Analytics.rolling_monthly_spend(columns, window=2)[1].tolist(), [54010, 54010, 3990])
+        self.assertEqual(DB_Analytics.category_totals(columns), {"Rent": 50000, "Fuel": 8000})
+        self.assertEqual(DB_Analytics.price_percentiles(columns, (50,), by_category=True), {"Fuel": {50: 4000.0}, "Rent": {50: 50000.0}})
+    def test_files_without_a_date_column_get_nat_dates(self):
+        path = os.path.join(self.tmp.name, "undated.db")
+        with sqlite3.connect(path) as connection:
+            connection.execute("CREATE TABLE expenses (exp_id INTEGER PRIMARY KEY AUTOINCREMENT, expense TEXT NOT NULL, price REAL NOT NULL);")
+            connection.executemany("INSERT INTO expenses (expense, price) VALUES (?, ?);", [("Rent", 500.0), ("Fuel", 40.5)])
+        connection.close()
+        with ExpensesDatabaseClient(path, read_only=True) as client:
+            columns = client.fetch_columns(price_dtype="int64")
+        self.assertEqual(columns["price"].tolist(), [50000, 4050])
+        self.assertTrue(np.isnat(columns["date"]).all())
+        self.assertEqual(DB_Analytics.category_totals(columns), {"Rent": 50000, "Fuel": 4050})
+        with self.assertRaisesRegex(ValueError, "date column"):
+            DB_Analytics.monthly_spend(columns)
+
+class NormalizedTest(unittest.TestCase):
+    ROWS = [("Rent", "500.00", "2024-01-01"), ("Fuel", "40.10", "2024-01-15"), ("Fuel", "39.90", "2024-02-15"), ("Gym", "30.00", "2024-02-01")]
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "expenses.db")
+        with ExpensesDatabaseClient(self.path) as client:
+            client.create_expenses_bulk(self.ROWS)
+            self.rows = client.search_expenses(limit=10)
+            self.summary = client.summarize_expenses(group_by="expense")
+    def tearDown(self):
+        self.tmp.cleanup()
+    def test_existing_files_are_converted_in_chunks(self):
+        stats = ExpensesDatabaseClient.normalize_expenses(self.path, chunk_size=3)
+        self.assertEqual((stats["migrated"], stats["chunks"]), (4, 2))
+        with ExpensesDatabaseClient(self.path) as client:
+            self.assertTrue(client.normalized)
+            self.assertEqual(client.connection.execute("SELECT type FROM sqlite_master WHERE name = 'expenses';").fetchone()[0], "view")
+            self.assertEqual(client.connection.execute("SELECT name FROM categories ORDER BY category_id;").fetchall(), [("Rent",), ("Fuel",), ("Gym",)])
+            # The public API does not change
+            self.assertEqual(client.search_expenses(limit=10), self.rows)
+            self.assertEqual(client.summarize_expenses(group_by="expense"), self.summary)
+            self.assertEqual(client.summarize_expenses(group_by="expense", date_from="2024-01-01", date_to="2025-01-01"), self.summary)
+            if client.fts_enabled:
+                self.assertEqual([row[0] for row in client.search_expenses_ranked("fue")], [2, 3])
+    def test_names_are_interned(self):
+        with ExpensesDatabaseClient(self.path, normalize=True) as client:
+            statements = []
+            client.connection.set_trace_callback(statements.append)
+            for day in range(1, 6):
+                client.create_expense("Coffee", "3.20", f"2024-03-{day:02d}")
+            client.update_expense(1, expense="Rent and bills")
+            client.connection.set_trace_callback(None)
+            # One lookup for each new name, none for the repeats
+            self.assertEqual(len([sql for sql in statements if sql.startswith("INSERT INTO categories")]), 2)
+            self.assertEqual(client.read_expense(1)[1], "Rent and bills")
+            self.assertEqual(client.summarize_expenses(group_by="expense", year=2024, month=3)[0][:3], ("Coffee", Decimal("16.00"), 5))
+    def test_rolled_back_categories_are_forgotten(self):
+        with ExpensesDatabaseClient(self.path, normalize=True) as client:
+            with self.assertRaises(RuntimeError):
+                with client.transaction():
+                    client.create_expense("Coffee", "3.20", "2024-03-01")
+                    raise RuntimeError("cancelled")
+            exp_id = client.create_expense("Coffee", "3.20", "2024-03-02")
+            self.assertEqual(client.read_expense(exp_id)[1], "Coffee")
+        # Once normalized, every client uses the layout
+        with ExpensesDatabaseClient(self.path) as client:
+            self.assertTrue(client.normalized)
+            self.assertEqual(len(client.search_expenses(expense="Coffee")), 1)
+
+class RollupTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.client = ExpensesDatabaseClient(os.path.join(self.tmp.name, "expenses.db"))
+        self.client.create_expenses_bulk([("Rent", "500.00", "2024-01-01"), ("Fuel", "40.10", "2024-01-15"), ("Fuel", "39.90", "2024-02-15")])
+    def tearDown(self):
+        self.client.close()
+        self.tmp.cleanup()
+    def totals(self):
+        return self.client.connection.execute("SELECT year, month, total_cents, row_count FROM monthly_totals ORDER BY 1, 2;").fetchall()
+    def categories(self):
+        return self.client.connection.execute("SELECT year, month, category, total_cents FROM monthly_category_totals ORDER BY 1, 2, 3;").fetchall()
+    def test_triggers_follow_every_write(self):
+        self.assertEqual(self.totals(), [(2024, 1, 54010, 2), (2024, 2, 3990, 1)])
+        self.client.create_expense("Gym", "30.00", "2024-03-01")
+        self.client.update_expense(2, expense="Petrol", date="2024-02-16")
+        self.client.delete_expense(1)
+        # January is left without rows and disappears
+        self.assertEqual(self.totals(), [(2024, 2, 8000, 2), (2024, 3, 3000, 1)])
+        self.assertEqual(self.categories(), [(2024, 2, "Fuel", 3990), (2024, 2, "Petrol", 4010), (2024, 3, "Gym", 3000)])
+    def test_month_totals_are_lookups(self):
+        plan = " ".join(row[3] for row in self.client.connection.execute(
+            "EXPLAIN QUERY PLAN " + self.client._rollup_summary_query(None, 2024, 1)[0], [2024, 1]
+        ))
+        self.assertIn("monthly_totals USING PRIMARY KEY", plan)
+        self.assertEqual(self.client.total_expenses(year=2024, month=1), Decimal("540.10"))
+    def test_rebuild_repairs_drift(self):
+        self.assertEqual(self.client.rebuild_monthly_totals(), {"months": 2, "category_months": 3, "drifted": 0})
+        with self.client.connection:
+            self.client.connection.execute("DELETE FROM monthly_totals WHERE month = 2;")
+            self.client.connection.execute("UPDATE monthly_category_totals SET total_cents = 1 WHERE category = 'Rent';")
+        self.assertEqual(self.client.total_expenses(year=2024, month=2), Decimal("0.00"))
+        self.assertEqual(self.client.rebuild_monthly_totals(), {"months": 2, "category_months": 3, "drifted": 2})
+        self.assertEqual(self.totals(), [(2024, 1, 54010, 2), (2024, 2, 3990, 1)])
+        self.assertEqual(self.client.total_expenses(year=2024, month=2), Decimal("39.90"))
+
+class TransferTest(unittest.TestCase):
+    ROWS = [("Rent", Decimal("500.00"), "2024-01-01"), ("Café, \"bio\"", Decimal("3.10"), "2024-01-15"), ("Fuel", Decimal("0.10"), "2024-02-15")]
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.client = ExpensesDatabaseClient(os.path.join(self.tmp.name, "expenses.db"))
+        self.client.create_expenses_bulk(self.ROWS)
+        self.target = ExpensesDatabaseClient(os.path.join(self.tmp.name, "target.db"))
+    def tearDown(self):
+        self.target.close()
+        self.client.close()
+        self.tmp.cleanup()
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+    def test_round_trip(self):
+        for name in ("expenses.csv", "expenses.jsonl"):
+            self.assertEqual(export_expenses(self.client, self.path(name))["exported"], 3)
+            self.assertFalse(os.path.exists(self.path(name) + ".partial"))
+            report = import_expenses(self.target, self.path(name), batch_size=2)
+            self.assertEqual((report["imported"], report["batches"]), (3, 2))
+        self.assertEqual([row[1:] for row in self.target.iter_expenses()], [tuple(row) for row in self.ROWS] * 2)
+        self.assertEqual(export_expenses(self.client, self.path("january.csv"), year=2024, month=1)["exported"], 2)
+    def test_invalid_rows(self):
+        with open(self.path("bad.jsonl"), "w", encoding="utf-8") as handle:
+            handle.write('{"expense": "Gym", "price": 30, "date": "2024-03-01"}\n')
+            handle.write('{"expense": "Gym", "price": 0.001, "date": "2024-03-02"}\n')
+            handle.write('{"expense": "Gym", "price": 30, "date": "2024-02-30"}\n')
+            handle.write("not json\n")
+        with self.assertRaisesRegex(ValueError, "line 2: price must be a whole number of cents"):
+            import_expenses(self.target, self.path("bad.jsonl"))
+        self.assertEqual(self.target.search_expenses(), [])
+        report = import_expenses(self.target, self.path("bad.jsonl"), on_error="skip")
+        self.assertEqual((report["imported"], report["skipped"]), (1, 3))
+        self.assertEqual(report["errors"][1], "line 3: date does not exist: '2024-02-30'")
+    def test_set_wise_indexing_is_opt_in(self):
+        with open(self.path("many.csv"), "w", encoding="utf-8", newline="") as handle:
+            handle.write("expense,price,date\n" + "Coffee,3.20,2024-03-01\n" * ExpensesDatabaseClient.SET_WISE_INDEXING_ROWS)
+        for set_wise_indexing in (False, True):
+            statements = []
+            self.target.connection.set_trace_callback(statements.append)
+            import_expenses(self.target, self.path("many.csv"), **({"set_wise_indexing": True} if set_wise_indexing else {}))
+            self.target.connection.set_trace_callback(None)
+            self.assertEqual(any(sql.startswith("DROP TRIGGER") for sql in statements), set_wise_indexing)
+        self.assertEqual(self.target.total_expenses(year=2024, month=3), Decimal("3.20") * 2 * ExpensesDatabaseClient.SET_WISE_INDEXING_ROWS)
+
+class CLITest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = os.path.join(self.tmp.name, "expenses.db")
+    def tearDown(self):
+        self.tmp.cleanup()
+    def run_cli(self, *argv):
+        """(exit code, stdout, stderr) of one DB_CLI run."""
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            code = DB_CLI.main(["--db", self.db, *argv])
+        return code, stdout.getvalue(), stderr.getvalue()
+    def test_add_search_and_summarize(self):
+        self.assertEqual(self.run_cli("--output", "json", "add", "Rent", "500.00", "--date", "2024-01-01"), (0, '{"exp_id": 1}\n', ""))
+        self.run_cli("add", "Fuel", "40.10", "--date", "2024-02-15")
+        self.assertEqual(self.run_cli("--output", "json", "search", "--year", "2024", "--month", "2")[1],
+                         '{"exp_id": 2, "expense": "Fuel", "price": 40.10, "date": "2024-02-15"}\n')
+        self.assertEqual(self.run_cli("--output", "csv", "search", "--limit", "1")[1], "exp_id,expense,price,date\n1,Rent,500.00,2024-01-01\n")
+        self.assertEqual(self.run_cli("--output", "csv", "summarize", "--group-by", "month")[1].splitlines()[1:], [
+            "2024-01,500.00,1,500.00", "2024-02,40.10,1,40.10",
+        ])
+        self.assertEqual(self.run_cli("summarize")[1].split(), ["all", "540.10", "2", "270.05"])
+    def test_bulk_import(self):
+        path = os.path.join(self.tmp.name, "march.csv")
+        with open(path, "w", encoding="utf-8", newline="") as handle:
+            handle.write("expense,price,date\nCoffee,3.20,2024-03-01\nCoffee,abc,2024-03-02\n")
+        self.assertEqual(self.run_cli("--output", "json", "bulk-import", path, "--on-error", "skip"),
+                         (0, '{"imported": 1, "skipped": 1, "batches": 1}\n', "skipped line 3: price must be a number, got 'abc'\n"))
+    def test_errors_go_to_stderr(self):
+        code, stdout, stderr = self.run_cli("search")
+        self.assertEqual((code, stdout), (1, ""))
+        self.assertIn("does not exist", stderr)
+        self.assertFalse(os.path.exists(self.db))
+        code, _, stderr = self.run_cli("add", "Rent", "500.001", "--date", "2024-01-01")
+        self.assertEqual(code, 1)
+        self.assertIn("whole number of cents", stderr)
+        self.assertEqual(self.run_cli("--read-only", "add", "Rent", "5", "--date", "2024-01-01")[0], 1)
+    def test_add_to_a_file_without_dates(self):
+        with sqlite3.connect(self.db) as connection:
+            connection.execute("CREATE TABLE expenses (exp_id INTEGER PRIMARY KEY AUTOINCREMENT, expense TEXT NOT NULL, price_cents INTEGER NOT NULL);")
+        connection.close()
+        self.assertEqual(self.run_cli("--output", "json", "add", "Rent", "500.00"), (0, '{"exp_id": 1}\n', ""))
+        code, _, stderr = self.run_cli("add", "Fuel", "40.10", "--date", "2024-02-15")
+        self.assertEqual(code, 1)
+        self.assertIn("without --date", stderr)
+        self.assertEqual(self.run_cli("--output", "csv", "search")[1], "exp_id,expense,price\n1,Rent,500.00\n")
+    def test_qt_is_never_imported(self):
+        loaded = subprocess.run(
+            [sys.executable, "-c", "import sys, DB_CLI; print(any(name.startswith('PyQt5') for name in sys.modules))"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True
+        ).stdout
+        self.assertEqual(loaded.strip(), "False")
+
+class BenchmarkSuiteTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+    def tearDown(self):
+        self.tmp.cleanup()
+    def test_ledgers_are_seeded(self):
+        self.assertEqual(list(DB_Benchmark.synthetic_ledger(50, seed=7)), list(DB_Benchmark.synthetic_ledger(50, seed=7)))
+        self.assertNotEqual(list(DB_Benchmark.synthetic_ledger(50, seed=7)), list(DB_Benchmark.synthetic_ledger(50, seed=8)))
+    def test_a_run_is_compared_with_a_baseline(self):
+        baseline = os.path.join(self.tmp.name, "baseline.json")
+        with mock.patch.dict(DB_Benchmark.SUITE_SIZES, {"tiny": 300}), redirect_stderr(io.StringIO()):
+            DB_Benchmark.run_suite(["tiny"], repeats=1, seed=7, gui=False, output=baseline)
+        with open(baseline, encoding="utf-8") as handle:
+            report = json.load(handle)
+        self.assertEqual(report["meta"]["seed"], 7)
+        results = report["results"]["tiny"]
+        self.assertIn("search.year_month", results)
+        self.assertIn("summarize.by_expense_of_month", results)
+        # Much slower beyond the threshold, slightly slower by less than min_delta_ms, and a new metric
+        results["search.year_month"]["median_ms"] += 100
+        results["summarize.total_all"]["median_ms"] *= 1.5
+        results["crud.new_method"] = {"median_ms": 1.0, "min_ms": 1.0, "runs": 1}
+        current = os.path.join(self.tmp.name, "current.json")
+        with open(current, "w", encoding="utf-8") as handle:
+            json.dump(report, handle)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.assertFalse(DB_Benchmark.compare_runs(baseline, current, threshold=0.1, min_delta_ms=50))
+        self.assertEqual([line.split()[1] for line in output.getvalue().splitlines() if "REGRESSION" in line], ["search.year_month"])
+        self.assertIn("only in after", output.getvalue())
+        with redirect_stdout(io.StringIO()):
+            self.assertTrue(DB_Benchmark.compare_runs(baseline, baseline, threshold=0.1, min_delta_ms=0))
+
+class InstrumentationTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "expenses.db")
+    def tearDown(self):
+        self.tmp.cleanup()
+    def test_statements_are_recorded_per_method(self):
+        stats = MemorySink()
+        instrumentation = QueryInstrumentation([stats], slow_ms=10_000)
+        with ExpensesDatabaseClient(self.path, instrumentation=instrumentation) as client:
+            client.create_expenses_bulk([("Rent", "500.00", "2024-01-01"), ("Fuel", "40.10", "2024-01-15")])
+            stats.reset()
+            client.create_expense("Gym", "30.00", "2024-02-01")
+            # Prices still come back as Decimals
+            self.assertEqual(client.search_expenses(year=2024, month=1, limit=10)[0][2], Decimal("500.00"))
+            instrumentation.flush()
+        methods = {entry["method"]: entry for entry in stats.stats(by="method")}
+        search = next(entry for entry in stats.stats() if entry["method"] == "search_expenses" and entry["statement"].startswith("SELECT exp_id"))
+        self.assertEqual((search["count"], search["rows"]), (1, 2))
+        self.assertGreaterEqual(methods["create_expense"]["count"], 2)  # the INSERT and its commit
+        self.assertEqual(sum(methods["search_expenses"]["histogram"].values()), methods["search_expenses"]["count"])
+        self.assertEqual(list(stats.slow_queries), [])
+    def test_slow_queries_are_logged_with_their_plan(self):
+        log = os.path.join(self.tmp.name, "slow.jsonl")
+        events = []
+        sink = JsonlSink(log, slow_only=True)
+        instrumentation = QueryInstrumentation([sink, CallbackSink(events.append)], slow_ms=0)
+        try:
+            with ExpensesDatabaseClient(self.path, instrumentation=instrumentation) as client:
+                client.create_expense("Rent", "500.00", "2024-01-01")
+                client.search_expenses(year=2024, month=1)
+                with self.assertRaises(sqlite3.OperationalError):
+                    client.cursor.execute("SELECT missing FROM expenses;")
+        finally:
+            sink.close()
+        with open(log, encoding="utf-8") as handle:
+            logged = [json.loads(line) for line in handle]
+        search = next(event for event in logged if event["method"] == "search_expenses" and event["statement"].startswith("SELECT exp_id"))
+        self.assertTrue(any("idx_date_price" in line for line in search["plan"]))
+        self.assertEqual([event["error"] for event in events if "error" in event], ["OperationalError"])
+        self.assertIn("commit", {event["kind"] for event in events})
+    def test_without_instrumentation_connections_are_plain(self):
+        with ExpensesDatabaseClient(self.path) as client:
+            self.assertIs(type(client.connection), sqlite3.Connection)
+        instrumentation = QueryInstrumentation()
+        with ExpensesDatabaseClient(self.path, instrumentation=instrumentation) as client:
+            instrumentation.enabled = False
+            client.search_expenses()
+            instrumentation.flush()
+        self.assertNotIn("search_expenses", {entry["method"] for entry in instrumentation.sinks[0].stats(by="method")})
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.client = ExpensesDatabaseClient(os.path.join(self.tmp.name, "expenses.db"), durability="normal")
+        self.client.create_expenses_bulk([("Rent", "500.00", "2024-01-01"), ("Fuel", "40.10", "2024-01-15")])
+        self.path = os.path.join(self.tmp.name, "report.db")
+    def tearDown(self):
+        self.client.close()
+        self.tmp.cleanup()
+    def test_snapshots_are_point_in_time_copies(self):
+        steps = []
+        stats = ExpensesDatabaseClient.create_snapshot(self.client.db_name, self.path, pages=1, progress=lambda remaining, total: steps.append(remaining))
+        self.assertEqual(stats["steps"], len(steps))
+        self.assertGreater(stats["steps"], 1)
+        self.assertEqual(steps[-1], 0)
+        self.assertFalse(os.path.exists(self.path + ".partial"))
+        self.client.create_expense("Gym", "30.00", "2024-02-01")
+        with ExpensesDatabaseClient.open_snapshot(self.path) as report:
+            self.assertEqual(report.total_expenses(), Decimal("540.10"))
+            self.assertEqual(report.connection.execute("PRAGMA journal_mode;").fetchone()[0], "delete")
+            with self.assertRaises(sqlite3.OperationalError):
+                report.create_expense("Gym", "30.00", "2024-02-01")
+        # Refreshed in place
+        ExpensesDatabaseClient.create_snapshot(self.client.db_name, self.path)
+        with ExpensesDatabaseClient.open_snapshot(self.path) as report:
+            self.assertEqual(report.total_expenses(), Decimal("570.10"))
+    def test_reports_do_not_block_writers(self):
+        with ExpensesDatabaseClient(self.client.db_name, read_only=True) as report:
+            rows = report.iter_expenses(arraysize=1)
+            next(rows)
+            # The report's read transaction is still open
+            self.client.create_expense("Gym", "30.00", "2024-02-01")
+            self.assertEqual(len(list(rows)), 1)
+            with self.assertRaises(sqlite3.OperationalError):
+                report.delete_expense(1)
+        with self.assertRaisesRegex(ValueError, "read-only"):
+            ExpensesDatabaseClient(self.client.db_name, read_only=True, normalize=True)
+        with self.assertRaises(FileNotFoundError):
+            ExpensesDatabaseClient(os.path.join(self.tmp.name, "missing.db"), read_only=True)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, "missing.db")))
+
+class QueryCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = QueryCache()
+        self.client = ExpensesDatabaseClient(os.path.join(self.tmp.name, "expenses.db"), cache=self.cache)
+        self.client.create_expenses_bulk([
+            ("Rent", "500.00", "2024-01-01"), ("Fuel", "40.10", "2024-02-15"), ("Gym", "30.00", "2024-03-01"),
+        ])
+    def tearDown(self):
+        self.client.close()
+        self.tmp.cleanup()
+    def read_months(self):
+        return [self.client.search_expenses(year=2024, month=month) for month in (1, 2, 3)]
+    def test_repeated_reads_are_served_from_the_cache(self):
+        self.read_months()
+        hits = self.cache.stats()["hits"]
+        self.assertEqual(self.read_months(), self.read_months())
+        self.assertEqual(self.cache.stats()["hits"], hits + 6)
+    def test_writes_invalidate_only_their_months(self):
+        self.read_months()
+        self.client.create_expense("Fuel", "38.00", "2024-02-20")
+        self.assertEqual(self.cache.stats()["invalidations"], 1)
+        self.assertEqual(len(self.client.search_expenses(year=2024, month=2)), 2)
+    def test_bulk_updates_invalidate_the_months_rows_leave_and_enter(self):
+        self.read_months()
+        self.assertEqual(self.client.update_expenses_bulk([(1, {"date": "2024-02-01"}), (2, {"price": "41.00"})]), 2)
+        # January (left) and February (entered and edited); March stays cached
+        self.assertEqual(self.cache.stats()["invalidations"], 2)
+        january, february, march = self.read_months()
+        self.assertEqual(january, [])
+        self.assertEqual(sorted(row[2] for row in february), [Decimal("41.00"), Decimal("500.00")])
+        self.assertEqual(self.cache.stats()["entries"], 3)
+    def test_bulk_updates_read_old_dates_once_per_batch(self):
+        self.client.UPDATE_BATCH_ROWS = 2
+        statements = []
+        self.client.connection.set_trace_callback(statements.append)
+        self.client.update_expenses_bulk((exp_id, {"price": "1.00"}) for exp_id in (1, 2, 3))
+        self.client.connection.set_trace_callback(None)
+        self.assertEqual(len([sql for sql in statements if sql.startswith("SELECT exp_id, date")]), 2)
+    def test_stale_results_expiry_and_eviction(self):
+        cache = QueryCache(max_entries=2, ttl=60)
+        version = cache.version
+        cache.invalidate(["2024-01"])
+        cache.put("stale", [1], frozenset({"2024-02"}), version)
+        self.assertIsNone(cache.get("stale"))
+        for key in ("a", "b", "c"):
+            cache.put(key, [key], frozenset({"2024-02"}), cache.version)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("c"), ["c"])
+        self.assertEqual(cache.stats()["evictions"], 1)
+        cache.invalidate(["2025-02"])
+        self.assertEqual(cache.get("b"), ["b"])
+        cache.invalidate(["2024-02"])
+        self.assertIsNone(cache.get("b"))
+        expired = QueryCache(ttl=0)
+        expired.put("a", [1], None, expired.version)
+        self.assertIsNone(expired.get("a"))
+        self.assertEqual(expired.stats()["expirations"], 1)
+
+@unittest.skipIf(QApplication is None, "PyQt5 is not installed")
+class TableModelTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QApplication.instance() or QApplication([])
+    def setUp(self):
+        from ExpenseV2 import ExpenseTableModel
+        self.tmp = tempfile.TemporaryDirectory()
+        self.client = ExpensesDatabaseClient(os.path.join(self.tmp.name, "expenses.db"))
+        self.client.create_expenses_bulk((f"Item {i}", "1.50", f"2024-{i % 12 + 1:02d}-01") for i in range(30))
+        self.model = ExpenseTableModel(self.client, page_size=10, max_cached_pages=2, first_chunk=4)
+        self.load()
+    def tearDown(self):
+        self.model.close()
+        self.client.close()
+        self.tmp.cleanup()
+    def wait(self, condition, timeout=10.0):
+        """Run the Qt event loop until condition() holds, so the workers' signals are delivered."""
+        deadline = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), deadline, "timed out waiting for the table model")
+            self.app.processEvents()
+            time.sleep(0.001)
+    def load(self, **filters):
+        self.model.filters = filters
+        self.model.load()
+        self.wait(lambda: not self.model.loading)
+    def fetch_all(self):
+        while self.model.canFetchMore():
+            self.model.fetchMore()
+            self.wait(lambda: not self.model._fetching)
+    def row_at(self, row):
+        """The model's row, waiting for its page when that was evicted and is being fetched again."""
+        self.wait(lambda: self.model.expense_row(row) is not None)
+        return self.model.expense_row(row)
+    def exp_ids(self):
+        return [self.row_at(row)[0] for row in range(self.model.rowCount())]
+    def test_rows_are_fetched_page_by_page(self):
+        # The first chunk and the rest of the first page
+        self.assertEqual(self.model.rowCount(), 10)
+        self.assertTrue(self.model.canFetchMore())
+        self.model.fetchMore()
+        self.wait(lambda: self.model.rowCount() == 20)
+        self.fetch_all()
+        self.assertEqual(self.exp_ids(), list(range(1, 31)))
+        self.assertLessEqual(len(self.model._pages), self.model.max_cached_pages)
+    def test_new_expenses_take_their_place_in_date_ordered_searches(self):
+        self.load(year=2024)
+        self.fetch_all()
+        exp_id = self.client.create_expense("Rent", "500.00", "2024-01-15")
+        self.model.append_expense(exp_id)
+        self.wait(lambda: not self.model.loading and not self.model._total_pending)
+        self.fetch_all()
+        rows = [self.row_at(row) for row in range(self.model.rowCount())]
+        self.assertEqual(rows, sorted(rows, key=lambda row: (row[3], row[0])))
+        self.assertIn(exp_id, [row[0] for row in rows])
+        self.assertEqual(self.model.total, Decimal("545.00"))
+    def test_changes_during_a_load_are_not_lost_from_the_total(self):
+        self.model.load()
+        # Before the load's total arrives, which may or may not count the new row
+        self.model.append_expense(self.client.create_expense("Rent", "500.00", "2024-01-15"))
+        self.wait(lambda: not self.model.loading and not self.model._total_pending)
+        self.assertEqual(self.model.total, Decimal("545.00"))
+    def test_evicted_pages_are_fetched_again_in_the_background(self):
+        from PyQt5.QtCore import Qt
+        self.fetch_all()
+        self.model.expense_row(25)
+        self.model.expense_row(15)
+        self.assertNotIn(0, self.model._pages)
+        def on_gui_thread(*args, **kwargs):
+            raise AssertionError("a page was read on the GUI thread")
+        self.model.db_client.search_expenses_page = on_gui_thread
+        index = self.model.index(3, 0)
+        self.assertEqual(self.model.data(index), "Loading...")
+        self.assertIsNone(self.model.data(index, Qt.UserRole))
+        self.assertEqual(self.row_at(3)[0], 4)
+        self.assertEqual(self.model.data(index), "Item 3")
+    def test_edits_of_rows_being_fetched_again_are_kept(self):
+        self.fetch_all()
+        self.model.expense_row(25)
+        self.model.expense_row(15)
+        self.client.update_expense(4, price="10.00")
+        self.model.update_row(3, price=Decimal("10.00"))
+        self.client.delete_expense(5)
+        self.model.remove_row(4)
+        self.assertEqual(self.row_at(3)[2], Decimal("10.00"))
+        self.assertEqual(self.row_at(4)[0], 6)
+        self.wait(lambda: not self.model._total_pending)
+        self.assertEqual(self.model.total, self.client.total_expenses())
+    def test_failed_queries_are_reported(self):
+        failures = []
+        self.model.query_failed.connect(failures.append)
+        # ValueError, not sqlite3.Error
+        self.load(year=2024, month=13)
+        self.assertEqual(len(failures), 1)
+        self.assertIn("month must be between 1 and 12", failures[0])
+        self.assertEqual(self.model.rowCount(), 0)
+    def test_the_total_follows_adds_edits_and_deletes(self):
+        self.assertEqual(self.model.total, Decimal("45.00"))
+        exp_id = self.client.create_expense("Rent", "500.00", "2024-01-15")
+        self.model.append_expense(exp_id)
+        self.assertEqual(self.model.total, Decimal("545.00"))
+        self.client.update_expense(1, price="2.00")
+        self.model.update_row(0, price=Decimal("2.00"))
+        self.assertEqual(self.model.total, Decimal("545.50"))
+        self.client.delete_expense(1)
+        self.model.remove_row(0)
+        self.assertEqual(self.model.total, Decimal("543.50"))
+        self.assertEqual(self.model.total, self.client.total_expenses())
+    def test_expenses_outside_the_search_leave_the_total_alone(self):
+        self.load(year=2024, month=1)
+        self.assertEqual(self.model.total, Decimal("4.50"))
+        self.model.append_expense(self.client.create_expense("Rent", "500.00", "2024-02-01"))
+        self.assertEqual(self.model.total, Decimal("4.50"))
+
+@unittest.skipIf(QApplication is None, "PyQt5 is not installed")
+class QueryWorkerTest(unittest.TestCase):
+    class Connection:
+        def __init__(self):
+            self.interrupts = 0
+        def interrupt(self):
+            self.interrupts += 1
+    class Client:
+        """Stands in for the pooled client; search_expenses_page blocks until release is set."""
+        def __init__(self):
+            self.connection = QueryWorkerTest.Connection()
+            self.started = threading.Event()
+            self.release = threading.Event()
+        def search_expenses_page(self, **kwargs):
+            self.started.set()
+            self.release.wait(10)
+            return [(1, "Rent", Decimal("500.00"), "2024-01-01")], None
+        def total_expenses(self, **filters):
+            return Decimal("500.00")
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QApplication.instance() or QApplication([])
+    def worker(self, client):
+        from PyQt5.QtCore import Qt
+        from ExpenseV2 import ExpenseQueryWorker
+        worker = ExpenseQueryWorker(client, 1, {}, None, [10], with_total=True)
+        self.emitted = []
+        for name in ("rows_ready", "total_ready", "failed"):
+            getattr(worker.signals, name).connect(lambda *args, name=name: self.emitted.append(name), Qt.DirectConnection)
+        return worker
+    def test_cancel_interrupts_the_running_query(self):
+        client = self.Client()
+        worker = self.worker(client)
+        thread = threading.Thread(target=worker.run)
+        thread.start()
+        self.assertTrue(client.started.wait(10))
+        worker.cancel()
+        client.release.set()
+        thread.join(10)
+        self.assertEqual(client.connection.interrupts, 1)
+        self.assertEqual(self.emitted, [])
+    def test_cancel_after_the_queries_leaves_the_connection_alone(self):
+        client = self.Client()
+        client.release.set()
+        worker = self.worker(client)
+        worker._connection = client.connection
+        worker.run()
+        # The thread's connection may already run the next worker's query
+        worker._connection = client.connection
+        worker.cancel()
+        self.assertEqual(client.connection.interrupts, 0)
+        self.assertEqual(self.emitted, ["rows_ready", "total_ready"])
+    def test_any_exception_is_reported(self):
+        client = self.Client()
+        client.search_expenses_page = lambda **kwargs: open(os.path.join(tempfile.gettempdir(), "missing", "archive.db.gz"))
+        worker = self.worker(client)
+        worker.run()
+        self.assertEqual(self.emitted, ["failed"])
+
+if __name__ == "__main__":
+    unittest.main()